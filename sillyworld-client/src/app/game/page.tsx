@@ -38,7 +38,7 @@ const translateAction = (actionType: string): string => {
 };
 
 // 辅助函数 - 将道具类型翻译为中文
-const translateItemType = (itemType: string): string => {
+const translateItemType = (itemType: string | null): string => {
   if (!itemType) return '未知道具';
   
   const itemMap: Record<string, string> = {
@@ -77,7 +77,8 @@ const formatGameAction = (action: ApiGameAction, gameState: GameState): string =
 
   switch (action.action_type) {
     case 'buy_item':
-      return `${playerName} 花费 ${action.amount || 0} 代币购买了 ${translateItemType(action.item_type || '')}`;
+      // 其他玩家购买的道具类型不公开
+      return `${playerName} 花费 ${action.amount || 0} 代币购买了 ${action.item_type ? translateItemType(action.item_type) : '一个道具'}`;
     
     case 'balance_change':
       // Add null check for amount
@@ -201,6 +202,12 @@ function GamePageContent() {
                   addToLog(formattedAction);
                 }
               },
+              onGameActions: (actions) => {
+                // 一批动作只更新一次日志
+                if (isComponentMounted && gameState) {
+                  addEntriesToLog(actions.map(action => formatGameAction(action, gameState)));
+                }
+              },
               onGameEnd: (result) => {
                 console.log('游戏结束', result);
                 if (isComponentMounted) {
@@ -258,6 +265,11 @@ function GamePageContent() {
     setGameLog(prev => [...prev, `[${new Date().toLocaleTimeString()}] ${message}`]);
   };
 
+  const addEntriesToLog = (messages: string[]) => {
+    const time = new Date().toLocaleTimeString();
+    setGameLog(prev => [...prev, ...messages.map(message => `[${time}] ${message}`)]);
+  };
+
   // 返回主页
   const handleReturnHome = () => {
     router.push('/');
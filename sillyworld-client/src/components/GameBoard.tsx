@@ -142,7 +142,7 @@ const PlayerCard: FC<{ player: Player }> = ({ player }) => {
 };
 
 // 添加辅助函数，获取道具名称和描述
-const getItemName = (type: string): string => {
+const getItemName = (type: string | null): string => {
   switch (type) {
     case 'aggressive':
       return '激进卡';
@@ -153,11 +153,11 @@ const getItemName = (type: string): string => {
     case 'equalizer':
       return '均富卡';
     default:
-      return type;
+      return type ?? '未知道具';
   }
 };
 
-const getItemDescription = (type: string): string => {
+const getItemDescription = (type: string | null): string => {
   switch (type) {
     case 'aggressive':
       return '激活攻击策略，若本轮说服失败将额外损失代币作为惩罚，若成功则无额外奖励';
@@ -60,7 +60,7 @@ const PlayerListItem: FC<{ player: Player }> = ({ player }) => {
                     : 'bg-blue-600 text-white'
                 } text-xs px-2 py-0.5 rounded-full`}
               >
-                {item.type}
+                {item.type ?? '未知道具'}
               </div>
             ))
           ) : (
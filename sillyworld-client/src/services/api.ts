@@ -55,6 +55,8 @@ export interface Player {
     is_active: boolean;
     last_action?: string;
     last_action_time?: string;
+    // 人类席位：通过WebSocket提交决策（input_request / game_action）
+    is_human?: boolean;
 }
 
 export interface Item {
@@ -63,7 +65,8 @@ export interface Item {
     description: string;
     effect: string;
     price: number;
-    type: string;
+    // 其他玩家未使用的道具只公开数量，类型为null
+    type: string | null;
     used?: boolean;
 }
 
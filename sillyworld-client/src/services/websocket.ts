@@ -2,11 +2,83 @@
 
 import { GameState, GameAction } from './api';
 
-export type WebSocketEventType = 'game_state' | 'game_action' | 'game_end' | 'error';
+export type WebSocketEventType = 'game_state' | 'state_delta' | 'game_action' | 'game_actions' | 'game_end' | 'session' | 'ping' | 'error';
 
 interface WebSocketEvent {
   type: WebSocketEventType;
   data: any;
+  // 完整状态消息携带的版本号和校验和
+  seq?: number;
+  checksum?: number;
+  // 动作消息携带的游标（批量补发时为最后一个动作的游标）
+  cursor?: number;
+}
+
+// 状态差异（格式见服务端 state_sync.py）
+interface StateDelta {
+  base: number;
+  seq: number;
+  diff: any;
+  checksum?: number;
+}
+
+// 把差异应用到旧值上，返回新值
+function applyDiff(old: any, change: any): any {
+  if (change && typeof change === 'object' && !Array.isArray(change)) {
+    if (Array.isArray(old) && '$list' in change) {
+      const ops = change.$list;
+      const result = old.slice(0, ops.len);
+      for (const [index, sub] of Object.entries(ops.set || {})) {
+        result[Number(index)] = applyDiff(result[Number(index)], sub);
+      }
+      return result.concat(ops.append || []);
+    }
+    if (old && typeof old === 'object' && !Array.isArray(old)) {
+      const result: any = { ...old };
+      for (const [key, sub] of Object.entries(change)) {
+        if (key === '$del') continue;
+        result[key] = key in old ? applyDiff(old[key], sub) : sub;
+      }
+      for (const key of change.$del || []) {
+        delete result[key];
+      }
+      return result;
+    }
+  }
+  return change;
+}
+
+// 与服务端相同的规范JSON：键排序、无空白
+function canonicalJson(value: any): string {
+  if (value === null || typeof value !== 'object') {
+    return JSON.stringify(value);
+  }
+  if (Array.isArray(value)) {
+    return `[${value.map(canonicalJson).join(',')}]`;
+  }
+  const keys = Object.keys(value).sort();
+  return `{${keys.map(key => `${JSON.stringify(key)}:${canonicalJson(value[key])}`).join(',')}}`;
+}
+
+let crcTable: number[] | null = null;
+
+function crc32(text: string): number {
+  if (!crcTable) {
+    crcTable = [];
+    for (let n = 0; n < 256; n++) {
+      let c = n;
+      for (let k = 0; k < 8; k++) {
+        c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+      }
+      crcTable.push(c >>> 0);
+    }
+  }
+  let crc = 0xffffffff;
+  const bytes = new TextEncoder().encode(text);
+  for (let i = 0; i < bytes.length; i++) {
+    crc = crcTable[(crc ^ bytes[i]) & 0xff] ^ (crc >>> 8);
+  }
+  return (crc ^ 0xffffffff) >>> 0;
 }
 
 interface WebSocketOptions {
@@ -15,7 +87,33 @@ interface WebSocketOptions {
   onError?: (event: Event) => void;
   onGameState?: (gameState: GameState) => void;
   onGameAction?: (action: GameAction) => void;
+  // 批量收到动作（合并帧或补发历史）时一次性回调，未提供时逐个调用 onGameAction
+  onGameActions?: (actions: GameAction[]) => void;
   onGameEnd?: (result: any) => void;
+  // 人类席位：游戏等待本玩家的决策（截止时间 deadline 为毫秒时间戳）
+  onInputRequest?: (request: InputRequest) => void;
+  // 人类席位：提交的决策是否被接受
+  onInputAck?: (ack: InputAck) => void;
+}
+
+export interface InputRequest {
+  request_id: string;
+  phase: 'preparation' | 'item_usage' | 'persuasion' | 'persuasion_response';
+  round: number;
+  actions: string[];
+  timeout: number;
+  deadline: number;
+  // persuasion_response 阶段附带说服请求的内容
+  from_player?: string;
+  amount?: number;
+  message?: string;
+}
+
+export interface InputAck {
+  accepted: boolean;
+  request_id?: string | null;
+  phase?: string;
+  error?: string;
 }
 
 export class WebSocketService {
@@ -26,6 +124,13 @@ export class WebSocketService {
   private maxReconnectAttempts = 5;
   private reconnectTimeout: NodeJS.Timeout | null = null;
   private isConnecting = false;
+  // 本地的游戏状态及其版本号，用于应用服务端发来的差异
+  private state: any = null;
+  private stateVersion: number | null = null;
+  // 收到的最后一个动作的游标，重连时服务端只补发之后的动作
+  private lastCursor: number | null = null;
+  // 服务端分配的观众会话ID，重连时带上以替换旧连接
+  private sessionId: string | null = null;
 
   constructor(options: WebSocketOptions = {}) {
     this.options = options;
@@ -50,6 +155,12 @@ export class WebSocketService {
       console.log('断开与之前游戏的连接');
       this.disconnect();
     }
+    if (this.gameId !== gameId) {
+      this.state = null;
+      this.stateVersion = null;
+      this.lastCursor = null;
+      this.sessionId = null;
+    }
 
     // 避免频繁重连
     if (this.reconnectAttempts > 0) {
@@ -59,10 +170,16 @@ export class WebSocketService {
 
     this.isConnecting = true;
     this.gameId = gameId;
-    // 为用户生成一个默认的玩家ID
+    // 以观众身份连接，服务端为每个观众分配独立的会话ID
     const playerId = "observer";
     // 使用正确的WebSocket URL格式
-    const wsUrl = `${process.env.NEXT_PUBLIC_WS_URL || 'ws://localhost:8006'}/ws/${gameId}/${playerId}`;
+    // 重连时带上已有的状态版本和动作游标，服务端只补发缺失的差异和动作
+    const params = new URLSearchParams();
+    if (this.stateVersion !== null) params.set('version', String(this.stateVersion));
+    if (this.lastCursor !== null) params.set('cursor', String(this.lastCursor));
+    if (this.sessionId !== null) params.set('session', this.sessionId);
+    const query = params.toString() ? `?${params.toString()}` : '';
+    const wsUrl = `${process.env.NEXT_PUBLIC_WS_URL || 'ws://localhost:8006'}/ws/${gameId}/${playerId}${query}`;
     
     console.log('尝试连接WebSocket:', wsUrl);
     console.log('游戏ID:', gameId);
@@ -203,6 +320,10 @@ export class WebSocketService {
 
     this.gameId = null;
     this.reconnectAttempts = 0;
+    this.state = null;
+    this.stateVersion = null;
+    this.lastCursor = null;
+    this.sessionId = null;
   }
 
   // 发送消息
@@ -227,20 +348,57 @@ export class WebSocketService {
   private handleMessage(event: WebSocketEvent): void {
     switch (event.type) {
       case 'game_state':
+        this.state = event.data;
+        this.stateVersion = event.seq ?? null;
         if (this.options.onGameState) {
           this.options.onGameState(event.data as GameState);
         }
         break;
+      case 'state_delta':
+        this.handleStateDelta(event.data as StateDelta);
+        break;
       case 'game_action':
+        this.lastCursor = event.cursor ?? this.lastCursor;
         if (this.options.onGameAction) {
           this.options.onGameAction(event.data as GameAction);
         }
         break;
+      case 'game_actions':
+        // 服务端合并窗口内的动作，或连接时批量补发的历史动作
+        this.lastCursor = event.cursor ?? this.lastCursor;
+        if (this.options.onGameActions) {
+          this.options.onGameActions(event.data as GameAction[]);
+        } else if (this.options.onGameAction) {
+          for (const action of event.data as GameAction[]) {
+            this.options.onGameAction(action);
+          }
+        }
+        break;
+      case 'ping':
+        // 回复心跳，服务端据此判断连接存活并计算往返时间
+        this.sendMessage('pong', event.data);
+        break;
+      case 'session':
+        this.sessionId = event.data.session_id;
+        break;
       case 'game_end':
         if (this.options.onGameEnd) {
           this.options.onGameEnd(event.data);
         }
         break;
+      case 'input_request':
+        if (this.options.onInputRequest) {
+          this.options.onInputRequest(event.data as InputRequest);
+        }
+        break;
+      case 'input_ack':
+        if (!event.data.accepted) {
+          console.warn('提交的决策被拒绝:', event.data.error);
+        }
+        if (this.options.onInputAck) {
+          this.options.onInputAck(event.data as InputAck);
+        }
+        break;
       case 'error':
         console.error('WebSocket错误:', event.data);
         break;
@@ -249,8 +407,30 @@ export class WebSocketService {
     }
   }
 
-  // 发送游戏行动
-  sendAction(action: Omit<GameAction, 'timestamp'>): boolean {
+  // 应用状态差异，版本不连续或校验和不一致时请求同步
+  private handleStateDelta(delta: StateDelta): void {
+    if (this.state === null || this.stateVersion !== delta.base) {
+      console.warn(`状态版本不连续(本地 ${this.stateVersion}，差异基于 ${delta.base})，请求同步`);
+      this.sendMessage('sync', { version: this.stateVersion });
+      return;
+    }
+    const next = applyDiff(this.state, delta.diff);
+    if (delta.checksum !== undefined && crc32(canonicalJson(next)) !== delta.checksum) {
+      console.warn(`状态校验和不一致(版本 ${delta.seq})，请求完整状态`);
+      this.state = null;
+      this.stateVersion = null;
+      this.sendMessage('sync', { version: null });
+      return;
+    }
+    this.state = next;
+    this.stateVersion = delta.seq;
+    if (this.options.onGameState) {
+      this.options.onGameState(next as GameState);
+    }
+  }
+
+  // 发送游戏行动（人类席位的决策，可带上 input_request 的 request_id）
+  sendAction(action: Omit<GameAction, 'timestamp'> & { request_id?: string; phase?: string }): boolean {
     return this.sendMessage('game_action', action);
   }
 
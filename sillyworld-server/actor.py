@@ -0,0 +1,208 @@
+"""每局游戏一个actor：游戏状态只由它邮箱中的命令按顺序修改
+
+购买道具的HTTP请求、准备阶段和回合循环都会修改余额、奖池和游戏状态。它们不再直接修改，
+而是把修改作为命令放入该游戏的邮箱，由该游戏的actor任务逐个执行，同一局游戏的命令之间不会交错，
+不需要加锁；不同游戏的actor互不影响。
+
+- 命令是协程函数，可以在其中等待LLM调用和广播；节奏停顿、准备时间等等待放在命令之外，不占用邮箱；
+- 命令中再调用同一个actor（例如启动命令中进入准备阶段）时直接执行，不会等待自己；
+- 调用方被取消（例如取消游戏时取消回合任务）时，它排队中的命令被丢弃，正在执行的命令被取消；
+- 人类玩家的输入不经过邮箱：阶段命令正在等待这些输入，经过邮箱会互相等待。
+"""
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+# 邮箱元素: (命令名, 协程函数, 位置参数, 关键字参数, 结果future, 入队时间)
+Command = Tuple[str, Callable[..., Awaitable[Any]], tuple, dict, asyncio.Future, float]
+
+
+class GameActor:
+    """一局游戏的邮箱和执行任务"""
+
+    def __init__(self, game_id: str, throughput_window: float = 60.0):
+        """初始化actor
+
+        Args:
+            game_id: 游戏ID
+            throughput_window: 统计吞吐量的时间窗口(秒)
+        """
+        self.game_id = game_id
+        self.throughput_window = throughput_window
+        self._mailbox: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # 正在执行的命令及其任务
+        self._current: Optional[str] = None
+        self._running: Optional[asyncio.Task] = None
+        self.created_at = time.perf_counter()
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.commands: Counter = Counter()
+        # 窗口内每个命令的完成时间
+        self._completed: Deque[float] = deque()
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self.max_run = 0.0
+
+    @property
+    def depth(self) -> int:
+        """邮箱中等待执行的命令数"""
+        return self._mailbox.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止actor：取消正在执行的命令，丢弃邮箱中的命令"""
+        if self._running is not None:
+            self._running.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._mailbox.empty():
+            _, _, _, _, future, _ = self._mailbox.get_nowait()
+            if not future.done():
+                future.cancel()
+                self.dropped += 1
+
+    async def call(self, name: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """把命令放入邮箱并等待它的结果（命令抛出的异常会在这里重新抛出）
+
+        Args:
+            name: 命令名，用于统计
+            fn: 修改游戏状态的协程函数
+        """
+        if self._running is not None and asyncio.current_task() is self._running:
+            # 命令中再次调用同一个actor：已经持有执行权，直接执行
+            return await fn(*args, **kwargs)
+        return await self.tell(name, fn, *args, **kwargs)
+
+    def tell(self, name: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> asyncio.Future:
+        """把命令放入邮箱，不等待执行，返回结果future"""
+        if self._task is None:
+            raise RuntimeError(f"Actor for game {self.game_id} is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._mailbox.put_nowait((name, fn, args, kwargs, future, time.perf_counter()))
+        self.max_depth = max(self.max_depth, self._mailbox.qsize())
+        return future
+
+    async def _run(self):
+        while True:
+            name, fn, args, kwargs, future, enqueued_at = await self._mailbox.get()
+            if future.done():
+                # 调用方在命令排队期间已经被取消
+                self.dropped += 1
+                continue
+            started = time.perf_counter()
+            self._current = name
+            self._running = asyncio.ensure_future(fn(*args, **kwargs))
+            # 调用方被取消时同时取消正在执行的命令
+            future.add_done_callback(lambda f, task=self._running: task.cancel() if f.cancelled() else None)
+            try:
+                await asyncio.wait({self._running})
+            except asyncio.CancelledError:
+                # actor被停止
+                self._running.cancel()
+                if not future.done():
+                    future.cancel()
+                raise
+            finished = time.perf_counter()
+            task, self._running, self._current = self._running, None, None
+            self._record(name, started - enqueued_at, finished - started, finished)
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                self.failed += 1
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+    def _record(self, name: str, waited: float, ran: float, finished: float):
+        self.processed += 1
+        self.commands[name] += 1
+        self._wait_total += waited
+        self._run_total += ran
+        self.max_run = max(self.max_run, ran)
+        self._completed.append(finished)
+        while self._completed and self._completed[0] < finished - self.throughput_window:
+            self._completed.popleft()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        while self._completed and self._completed[0] < now - self.throughput_window:
+            self._completed.popleft()
+        # 运行时间不足一个窗口时按实际运行时间计算
+        window = max(1e-9, min(self.throughput_window, now - self.created_at))
+        return {
+            "game_id": self.game_id,
+            "mailbox_depth": self.depth,
+            "max_mailbox_depth": self.max_depth,
+            "current_command": self._current,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            # 最近一个窗口内每秒完成的命令数
+            "throughput_per_sec": round(len(self._completed) / window, 3),
+            "avg_wait_ms": round(self._wait_total / self.processed * 1000, 3) if self.processed else 0.0,
+            "avg_run_ms": round(self._run_total / self.processed * 1000, 3) if self.processed else 0.0,
+            "max_run_ms": round(self.max_run * 1000, 3),
+            "commands": dict(self.commands),
+        }
+
+
+class ActorSystem:
+    """所有游戏的actor，按需创建"""
+
+    def __init__(self, throughput_window: float = 60.0):
+        self.throughput_window = throughput_window
+        self.actors: Dict[str, GameActor] = {}
+        self.closed = 0
+
+    def get(self, game_id: str) -> GameActor:
+        """游戏的actor，不存在时创建并启动"""
+        actor = self.actors.get(game_id)
+        if actor is None:
+            actor = self.actors[game_id] = GameActor(game_id, self.throughput_window)
+            actor.start()
+        return actor
+
+    async def call(self, game_id: str, name: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """在游戏的actor中执行命令并等待结果"""
+        return await self.get(game_id).call(name, fn, *args, **kwargs)
+
+    def tell(self, game_id: str, name: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> asyncio.Future:
+        """把命令放入游戏的邮箱，不等待执行"""
+        return self.get(game_id).tell(name, fn, *args, **kwargs)
+
+    async def close(self, game_id: str):
+        """游戏结束或取消后停止它的actor"""
+        actor = self.actors.pop(game_id, None)
+        if actor is not None:
+            await actor.stop()
+            self.closed += 1
+
+    async def stop(self):
+        for game_id in list(self.actors):
+            await self.close(game_id)
+
+    def stats(self) -> Dict[str, Any]:
+        games = [actor.stats() for actor in self.actors.values()]
+        return {
+            "actors": len(games),
+            "closed": self.closed,
+            "mailbox_depth": sum(game["mailbox_depth"] for game in games),
+            "max_mailbox_depth": max((game["max_mailbox_depth"] for game in games), default=0),
+            "processed": sum(game["processed"] for game in games),
+            "throughput_per_sec": round(sum(game["throughput_per_sec"] for game in games), 3),
+            "games": games,
+        }
@@ -0,0 +1,152 @@
+import asyncio
+import math
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set
+
+from exceptions import AdmissionRejectedError
+
+
+class LLMLimiter:
+    """限制全局同时在途的LLM调用数（async with 使用）
+
+    信号量在第一次使用时于运行中的事件循环内创建（Python 3.9 的 asyncio 原语在创建时绑定事件循环，
+    模块导入时创建会绑定到导入时的循环）；事件循环更换后（例如每次 asyncio.run）重新创建。
+    """
+
+    def __init__(self, max_in_flight: int = 16):
+        self.max_in_flight = max(1, max_in_flight)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._loop = loop
+        return self._semaphore
+
+    async def __aenter__(self):
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self.completed += 1
+        self._get_semaphore().release()
+        return False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+        }
+
+
+class AdmissionController:
+    """游戏准入控制
+
+    同时运行的游戏数达到上限后，新启动的游戏进入先进先出的等待队列，
+    有游戏结束时按顺序放行；等待队列也满时直接拒绝（429 + Retry-After），
+    使突发流量下已在运行的游戏延迟保持稳定。
+    """
+
+    def __init__(self, max_active_games: int = 50, max_waiting_games: int = 100, retry_after: int = 30,
+                 on_admit: Optional[Callable[[str], None]] = None):
+        """初始化准入控制
+
+        Args:
+            max_active_games: 同时运行的游戏数上限
+            max_waiting_games: 等待队列长度上限
+            retry_after: 被拒绝时建议的基础重试间隔(秒)
+            on_admit: 排队的游戏被放行时的回调
+        """
+        self.max_active_games = max(1, max_active_games)
+        self.max_waiting_games = max(0, max_waiting_games)
+        self.retry_after = retry_after
+        self.on_admit = on_admit
+
+        self._active: Set[str] = set()
+        # 等待队列，保持加入顺序
+        self._waiting: "OrderedDict[str, None]" = OrderedDict()
+        self.rejected = 0
+
+    def check_capacity(self):
+        """等待队列已满时拒绝新的请求
+
+        Raises:
+            AdmissionRejectedError: 等待队列已满
+        """
+        if len(self._active) >= self.max_active_games and len(self._waiting) >= self.max_waiting_games:
+            self.rejected += 1
+            raise AdmissionRejectedError(
+                f"{len(self._active)} games running, {len(self._waiting)} waiting",
+                self._retry_hint()
+            )
+
+    def admit(self, game_id: str, force: bool = False) -> int:
+        """申请运行一局游戏
+
+        Args:
+            game_id: 游戏ID
+            force: 忽略上限直接放行（如崩溃恢复的游戏）
+
+        Returns:
+            int: 0表示已放行，否则为在等待队列中的位置（从1开始）
+
+        Raises:
+            AdmissionRejectedError: 等待队列已满
+        """
+        position = self.position(game_id)
+        if position is not None:
+            return position
+        if force or len(self._active) < self.max_active_games:
+            self._active.add(game_id)
+            return 0
+        self.check_capacity()
+        self._waiting[game_id] = None
+        print(f"【调试/Admission】游戏进入等待队列: 游戏ID={game_id}, 位置={len(self._waiting)}")
+        return len(self._waiting)
+
+    def release(self, game_id: str):
+        """游戏结束或取消后释放名额，并按顺序放行等待中的游戏"""
+        self._active.discard(game_id)
+        self._waiting.pop(game_id, None)
+        while self._waiting and len(self._active) < self.max_active_games:
+            next_id, _ = self._waiting.popitem(last=False)
+            self._active.add(next_id)
+            print(f"【调试/Admission】放行等待中的游戏: 游戏ID={next_id}")
+            if self.on_admit:
+                self.on_admit(next_id)
+
+    def position(self, game_id: str) -> Optional[int]:
+        """返回游戏的准入位置：0为运行中，n为排队第n位，None为未申请"""
+        if game_id in self._active:
+            return 0
+        for index, waiting_id in enumerate(self._waiting, start=1):
+            if waiting_id == game_id:
+                return index
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_active_games": self.max_active_games,
+            "active_games": len(self._active),
+            "max_waiting_games": self.max_waiting_games,
+            "waiting_games": len(self._waiting),
+            "rejected": self.rejected,
+        }
+
+    def _retry_hint(self) -> int:
+        # 队列越长，建议的重试间隔越长
+        return self.retry_after * max(1, math.ceil(len(self._waiting) / self.max_active_games))
@@ -5,13 +5,22 @@ from datetime import datetime
 from models import Player, GameState, PersuasionRequest, GameAction, ItemType
 
 class AISystem:
-    def __init__(self, openrouter_api_key: str):
+    def __init__(self, openrouter_api_key: str, llm_limiter=None):
         # 使用httpx直接发送请求，避免OpenAI客户端的兼容性问题
         self.api_key = openrouter_api_key
         self.base_url = "https://openrouter.ai/api/v1"
         self.model = "openai/gpt-4o-mini"
+        # 全局在途LLM调用数限制（见 admission.LLMLimiter），为None时不限制
+        self.llm_limiter = llm_limiter
         
     async def _make_openrouter_request(self, messages):
+        """调用OpenRouter API，受全局在途调用数限制"""
+        if self.llm_limiter is None:
+            return await self._post_openrouter(messages)
+        async with self.llm_limiter:
+            return await self._post_openrouter(messages)
+
+    async def _post_openrouter(self, messages):
         """使用httpx直接调用OpenRouter API"""
         try:
             async with httpx.AsyncClient(timeout=30.0) as client:  # 设置30秒超时
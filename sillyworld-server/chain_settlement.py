@@ -0,0 +1,410 @@
+"""异步批量上链结算
+
+游戏结束时 Game 产生的 GameResult 放入 ChainSettlementQueue，由后台任务按批打包为
+sonic_svm 程序的 end_game 指令提交，回合循环从不等待链上确认。
+
+- 每笔交易打包多条 end_game 指令，批大小受 Solana 交易 1232 字节上限约束；
+- 每条指令带有由游戏和结果决定的幂等键，重试或重复入队不会重复结算；
+- 临时错误按指数退避重试，超过次数后进入失败列表；永久错误（如游戏已结束）只影响对应的指令；
+- MockChainBackend 模拟本地验证器（账户状态、幂等、延迟和随机故障），可离线测试并做吞吐基准：
+
+    python chain_settlement.py --results 500 --batch-size 6 --in-flight 4 --latency 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from models import GameResult
+
+# sonic_svm 程序ID（见 sonic_svm/Anchor.toml）
+PROGRAM_ID = "9Lh2tuGKdbVMfmFFEeGDix45cfnNHZzi5mNsseaexuVR"
+
+# Solana 单笔交易的字节上限
+MAX_TX_BYTES = 1232
+# 交易固定部分：签名数 + 1个签名 + 消息头 + 账户数 + 共享账户(authority, fee_recipient, system_program, 程序) + 最近区块哈希 + 指令数
+_TX_BASE_BYTES = 1 + 64 + 3 + 1 + 32 * 4 + 32 + 1
+# 每条 end_game 指令：独有账户(game, vault, winner) + 程序索引 + 账户索引(6) + 数据(8字节鉴别符 + 32字节winnerKey)
+_IX_BYTES = 32 * 3 + 1 + 1 + 6 + 1 + 8 + 32
+
+
+def max_instructions_per_tx() -> int:
+    """单笔交易最多能容纳的 end_game 指令数"""
+    return (MAX_TX_BYTES - _TX_BASE_BYTES) // _IX_BYTES
+
+
+def chain_game_id(game_id: str) -> int:
+    """把服务端的字符串游戏ID映射为链上的 u64 game_id"""
+    return int.from_bytes(hashlib.sha256(game_id.encode()).digest()[:8], "little")
+
+
+def idempotency_key(result: GameResult, winner_key: str) -> str:
+    """同一局游戏的同一结算结果总是得到相同的幂等键"""
+    raw = f"{PROGRAM_ID}:{chain_game_id(result.game_id)}:{winner_key}:{result.final_balance}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class ChainError(Exception):
+    """链上提交失败
+
+    Args:
+        message: 错误信息
+        permanent: 是否为永久错误（重试也不会成功）
+        index: 导致整笔交易失败的指令在批中的位置，None表示与具体指令无关
+    """
+
+    def __init__(self, message: str, permanent: bool = False, index: Optional[int] = None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.index = index
+
+
+class SettlementJob:
+    """一条待上链的游戏结果"""
+
+    def __init__(self, result: GameResult, winner_key: str):
+        self.result = result
+        self.winner_key = winner_key
+        self.key = idempotency_key(result, winner_key)
+        self.status = "pending"  # pending / submitted / confirmed / failed
+        self.attempts = 0
+        self.signature: Optional[str] = None
+        self.error: Optional[str] = None
+        self.enqueued_at = time.perf_counter()
+        self.confirmed_at: Optional[float] = None
+        # 重试退避期间不早于该时间提交
+        self.not_before = 0.0
+
+    def instruction(self) -> Dict[str, Any]:
+        """end_game 指令：账户以PDA种子表示，签名和序列化由后端完成"""
+        game_id = chain_game_id(self.result.game_id)
+        seed = game_id.to_bytes(8, "little").hex()
+        return {
+            "program_id": PROGRAM_ID,
+            "name": "endGame",
+            "accounts": {
+                "game": ["game", seed],
+                "gameVault": ["vault", seed],
+                "winner": self.winner_key,
+            },
+            "args": {"winnerKey": self.winner_key},
+            "game_id": game_id,
+            "idempotency_key": self.key,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "game_id": self.result.game_id,
+            "winner_key": self.winner_key,
+            "idempotency_key": self.key,
+            "status": self.status,
+            "attempts": self.attempts,
+            "signature": self.signature,
+            "error": self.error,
+            "log_root": self.result.log_root,
+        }
+
+
+class ChainBackend:
+    """链上提交后端"""
+
+    async def submit_batch(self, instructions: List[Dict[str, Any]]) -> str:
+        """把一批指令作为一笔交易原子地提交，返回交易签名
+
+        Raises:
+            ChainError: 提交失败，整批均未生效
+        """
+        raise NotImplementedError
+
+
+class MockChainBackend(ChainBackend):
+    """本地验证器替身
+
+    按 sonic_svm 的规则维护游戏账户状态：已结束的游戏再次 end_game 会返回 GameNotActive，
+    但带有已确认幂等键的指令直接视为成功；可配置每笔交易的确认延迟和临时故障率。
+    """
+
+    def __init__(self, latency: float = 0.4, failure_rate: float = 0.0, seed: Optional[int] = None):
+        """初始化模拟后端
+
+        Args:
+            latency: 每笔交易的确认延迟(秒)
+            failure_rate: 交易因临时原因（如区块哈希过期）失败的概率
+            seed: 随机种子
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.ended_games: Dict[int, str] = {}  # 链上game_id -> 获胜者
+        self.confirmed_keys: Dict[str, str] = {}  # 幂等键 -> 交易签名
+        self.transactions = 0
+
+    async def submit_batch(self, instructions: List[Dict[str, Any]]) -> str:
+        if len(instructions) > max_instructions_per_tx():
+            raise ChainError(f"transaction too large: {len(instructions)} instructions", permanent=True)
+        await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise ChainError("blockhash expired")
+
+        # 交易是原子的：先校验全部指令再写入
+        for index, ix in enumerate(instructions):
+            if ix["idempotency_key"] in self.confirmed_keys:
+                continue
+            if ix["game_id"] in self.ended_games:
+                raise ChainError(f"GameNotActive: game {ix['game_id']}", permanent=True, index=index)
+
+        self.transactions += 1
+        signature = hashlib.sha256(f"tx:{self.transactions}".encode()).hexdigest()
+        for ix in instructions:
+            if ix["idempotency_key"] in self.confirmed_keys:
+                continue
+            self.ended_games[ix["game_id"]] = ix["args"]["winnerKey"]
+            self.confirmed_keys[ix["idempotency_key"]] = signature
+        return signature
+
+
+def create_chain_backend(kind: str = "mock", **kwargs) -> ChainBackend:
+    """按名称创建链上后端（目前只有模拟后端，真实后端可实现 ChainBackend 后在此注册）"""
+    if kind == "mock":
+        return MockChainBackend(**kwargs)
+    raise ValueError(f"Unknown chain backend: {kind}")
+
+
+class ChainSettlementQueue:
+    """后台批量上链队列"""
+
+    def __init__(self, backend: ChainBackend, batch_size: int = 6, linger: float = 0.2,
+                 max_in_flight: int = 4, max_retries: int = 5, retry_delay: float = 1.0,
+                 winner_key: Optional[Callable[[GameResult], str]] = None):
+        """初始化上链队列
+
+        Args:
+            backend: 链上提交后端
+            batch_size: 每笔交易最多打包的指令数（不超过交易大小上限）
+            linger: 凑批的最长等待时间(秒)
+            max_in_flight: 同时等待确认的交易数上限
+            max_retries: 临时错误的最大重试次数
+            retry_delay: 首次重试的等待时间(秒)，之后按指数增长
+            winner_key: 获胜者玩家 -> 链上公钥的映射，默认使用玩家ID
+        """
+        self.backend = backend
+        self.batch_size = max(1, min(batch_size, max_instructions_per_tx()))
+        self.linger = linger
+        self.max_in_flight = max(1, max_in_flight)
+        # asyncio原语在 start() 中于运行中的事件循环内创建（Python 3.9 在创建时绑定事件循环）
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._submitting: set = set()
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.winner_key = winner_key or (lambda result: result.winner_id)
+
+        self.jobs: Dict[str, SettlementJob] = {}  # 游戏ID -> 结算任务
+        self._pending: Deque[SettlementJob] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.retries = 0
+        self._latency_total = 0.0
+        self._started_at: Optional[float] = None
+
+    def enqueue(self, result: GameResult) -> SettlementJob:
+        """放入一条游戏结果，立即返回（同一局游戏只入队一次）"""
+        job = self.jobs.get(result.game_id)
+        if job is not None:
+            return job
+        job = SettlementJob(result, self.winner_key(result))
+        self.jobs[result.game_id] = job
+        self._pending.append(job)
+        if self._wakeup:
+            self._wakeup.set()
+        print(f"【调试/Chain】游戏结果进入上链队列: 游戏ID={result.game_id}, 幂等键={job.key}, 队列长度={len(self._pending)}")
+        return job
+
+    def start(self):
+        """启动后台提交任务（需在事件循环中调用），启动前入队的结果在启动后提交"""
+        if self._task is None or self._task.done():
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+            self._wakeup = asyncio.Event()
+            self._started_at = time.perf_counter()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """停止后台任务，先在超时时间内尽量提交完剩余结果"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.drain(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"【警告/Chain】停止时仍有 {len(self._pending)} 条结果未上链")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def drain(self):
+        """等待队列中的结果全部确认或失败"""
+        while self._pending or self._submitting:
+            await asyncio.sleep(0.01)
+
+    def status(self, game_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(game_id)
+        return job.to_dict() if job else None
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {"pending": 0, "submitted": 0, "confirmed": 0, "failed": 0}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            **counts,
+            "batches": self.batches,
+            "retries": self.retries,
+            "batch_size": self.batch_size,
+            "avg_batch_size": round(counts["confirmed"] / self.batches, 2) if self.batches else 0.0,
+            "avg_confirm_latency": round(self._latency_total / counts["confirmed"], 4) if counts["confirmed"] else 0.0,
+            "throughput": round(counts["confirmed"] / elapsed, 2) if elapsed else 0.0,
+        }
+
+    async def _run(self):
+        try:
+            while True:
+                await self._in_flight.acquire()
+                batch = await self._next_batch()
+                task = asyncio.create_task(self._submit_guarded(batch))
+                self._submitting.add(task)
+                task.add_done_callback(self._submitting.discard)
+        finally:
+            for task in list(self._submitting):
+                task.cancel()
+
+    async def _submit_guarded(self, batch: List[SettlementJob]):
+        try:
+            await self._submit(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 未预期的错误不能让后台任务退出
+            print(f"【错误/Chain】提交批次时出错: {str(e)}")
+            self._retry(batch, str(e))
+        finally:
+            self._in_flight.release()
+
+    async def _next_batch(self) -> List[SettlementJob]:
+        """取出一批到期的任务，不足一批时最多等待linger秒凑批"""
+        deadline = None
+        while True:
+            now = time.perf_counter()
+            ready = [job for job in self._pending if job.not_before <= now]
+            if ready and (len(ready) >= self.batch_size or (deadline is not None and now >= deadline)):
+                batch = ready[:self.batch_size]
+                for job in batch:
+                    self._pending.remove(job)
+                return batch
+            if ready and deadline is None:
+                deadline = now + self.linger
+
+            # 等待新结果、凑批截止或最早的重试到期
+            wake_at = [deadline] if deadline is not None else []
+            wake_at += [job.not_before for job in self._pending if job.not_before > now]
+            timeout = max(0.0, min(wake_at) - now) if wake_at else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _submit(self, batch: List[SettlementJob]):
+        for job in batch:
+            job.status = "submitted"
+            job.attempts += 1
+        try:
+            signature = await self.backend.submit_batch([job.instruction() for job in batch])
+        except ChainError as e:
+            if e.permanent and e.index is not None:
+                # 只有出错的指令失败，其余指令立即重新提交
+                failed = batch[e.index]
+                self._fail(failed, str(e))
+                for job in batch:
+                    if job is not failed:
+                        job.attempts -= 1
+                        job.status = "pending"
+                        self._pending.appendleft(job)
+                self._wakeup.set()
+            elif e.permanent:
+                for job in batch:
+                    self._fail(job, str(e))
+            else:
+                self._retry(batch, str(e))
+            return
+
+        self.batches += 1
+        now = time.perf_counter()
+        for job in batch:
+            job.status = "confirmed"
+            job.signature = signature
+            job.confirmed_at = now
+            self._latency_total += now - job.enqueued_at
+        print(f"【调试/Chain】批次上链成功: 指令数={len(batch)}, 签名={signature[:16]}")
+
+    def _retry(self, batch: List[SettlementJob], error: str):
+        now = time.perf_counter()
+        for job in batch:
+            job.error = error
+            if job.attempts > self.max_retries:
+                self._fail(job, error)
+                continue
+            self.retries += 1
+            job.status = "pending"
+            job.not_before = now + self.retry_delay * (2 ** (job.attempts - 1))
+            self._pending.append(job)
+        print(f"【警告/Chain】批次上链失败，稍后重试: 指令数={len(batch)}, 错误={error}")
+        self._wakeup.set()
+
+    def _fail(self, job: SettlementJob, error: str):
+        job.status = "failed"
+        job.error = error
+        print(f"【错误/Chain】游戏结果上链失败: 游戏ID={job.result.game_id}, 错误={error}")
+
+
+async def _benchmark(args):
+    from datetime import datetime
+
+    backend = MockChainBackend(latency=args.latency, failure_rate=args.failure_rate, seed=args.seed)
+    queue = ChainSettlementQueue(backend, batch_size=args.batch_size, linger=args.linger,
+                                 max_in_flight=args.in_flight, retry_delay=args.latency)
+    queue.start()
+    for i in range(args.results):
+        queue.enqueue(GameResult(
+            game_id=f"bench-{i}", winner_id=f"player-{i % 4}", final_balance=100 + i, prize_pool=40,
+            total_rounds=10, end_time=datetime.now(), winner_prompt=""
+        ))
+    started = time.perf_counter()
+    await queue.drain()
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+    stats = queue.stats()
+    print(f"结果数={args.results}, 批大小={queue.batch_size}, 并发交易={args.in_flight}, 交易数={backend.transactions}, 耗时={elapsed:.2f}s, "
+          f"吞吐={stats['confirmed'] / elapsed:.1f}条/s, 平均确认延迟={stats['avg_confirm_latency']}s, "
+          f"重试={stats['retries']}, 失败={stats['failed']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上链结算队列吞吐基准（模拟验证器）")
+    parser.add_argument("--results", type=int, default=200, help="游戏结果数量")
+    parser.add_argument("--batch-size", type=int, default=max_instructions_per_tx(), help="每笔交易的指令数")
+    parser.add_argument("--linger", type=float, default=0.05, help="凑批等待时间(秒)")
+    parser.add_argument("--in-flight", type=int, default=4, help="同时等待确认的交易数")
+    parser.add_argument("--latency", type=float, default=0.05, help="每笔交易的确认延迟(秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="临时故障率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    asyncio.run(_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
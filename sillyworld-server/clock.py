@@ -0,0 +1,114 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+
+class Clock:
+    """时钟接口：游戏时间戳和节奏等待都通过它获取，便于替换为虚拟时钟"""
+
+    def now(self) -> datetime:
+        raise NotImplementedError
+
+    def monotonic(self) -> float:
+        raise NotImplementedError
+
+    async def sleep(self, seconds: float):
+        raise NotImplementedError
+
+
+class SystemClock(Clock):
+    """真实时钟"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """虚拟时钟：sleep不真正等待，只推进虚拟时间
+
+    每次读取时间都前进一个固定的tick，因此在相同的执行顺序下时间戳完全确定，
+    并且同一局游戏中的动作时间戳严格递增。
+    """
+
+    def __init__(self, start: Optional[datetime] = None, tick: float = 0.001):
+        """初始化虚拟时钟
+
+        Args:
+            start: 虚拟时间起点，默认为 2025-01-01 00:00:00
+            tick: 每次读取时间推进的秒数
+        """
+        self.start = start or datetime(2025, 1, 1)
+        self.tick = tick
+        self._elapsed = 0.0
+
+    def now(self) -> datetime:
+        self._elapsed += self.tick
+        return self.start + timedelta(seconds=self._elapsed)
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    async def sleep(self, seconds: float):
+        self._elapsed += max(0.0, seconds)
+        # 仍然让出事件循环，使其他游戏有机会执行
+        await asyncio.sleep(0)
+
+
+class PacingProfile:
+    """回合节奏配置（单位均为秒）"""
+
+    def __init__(self, name: str, preparation_time: float, round_start_pause: float,
+                 ai_thinking_pause: float, phase_pause: float, round_interval: float,
+                 virtual_clock: bool = False):
+        """初始化节奏配置
+
+        Args:
+            name: 配置名称
+            preparation_time: 准备阶段AI考虑购买道具的时间
+            round_start_pause: 回合开始广播玩家状态后的停顿
+            ai_thinking_pause: AI"思考"提示后的停顿
+            phase_pause: 道具/说服/结算阶段结束后的停顿
+            round_interval: 两个回合之间的间隔
+            virtual_clock: 是否使用虚拟时钟
+        """
+        self.name = name
+        self.preparation_time = preparation_time
+        self.round_start_pause = round_start_pause
+        self.ai_thinking_pause = ai_thinking_pause
+        self.phase_pause = phase_pause
+        self.round_interval = round_interval
+        self.virtual_clock = virtual_clock
+
+
+PACING_PROFILES: Dict[str, PacingProfile] = {
+    # 观战节奏：与原先的固定等待一致，便于观众跟上比赛
+    "spectator": PacingProfile("spectator", preparation_time=10, round_start_pause=2,
+                               ai_thinking_pause=2, phase_pause=1, round_interval=3),
+    # 快速节奏：保留动画所需的最短停顿，用于调试和演示
+    "fast": PacingProfile("fast", preparation_time=2, round_start_pause=0.5,
+                          ai_thinking_pause=0.5, phase_pause=0.2, round_interval=0.5),
+    # 无头模式：零等待 + 虚拟时钟，用于模拟和基准测试
+    "headless": PacingProfile("headless", preparation_time=0, round_start_pause=0,
+                              ai_thinking_pause=0, phase_pause=0, round_interval=0,
+                              virtual_clock=True),
+}
+
+
+def get_pacing_profile(name: str) -> PacingProfile:
+    """按名称获取节奏配置"""
+    try:
+        return PACING_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"未知的节奏配置: {name}，可选: {', '.join(PACING_PROFILES)}")
+
+
+def create_clock(profile: PacingProfile) -> Clock:
+    """为节奏配置创建对应的时钟"""
+    return VirtualClock() if profile.virtual_clock else SystemClock()
@@ -0,0 +1,261 @@
+"""WebSocket消息编码
+
+每条广播消息只编码一次，得到的文本由所有接收者共享（发送队列、历史日志中保存的都是编码结果）。
+安装了 orjson 时使用它编码，否则退回标准库 json；两者输出相同的JSON（枚举取值，时间为ISO格式）。
+
+客户端可以通过WebSocket子协议协商二进制编码（需要安装 msgpack）：
+- sillyworld.json: JSON文本帧（默认，未提供子协议时也是JSON）；
+- sillyworld.msgpack: MessagePack二进制帧，消息类型和结构相同，但已知字段名替换为整数标签（FIELD_TAGS 中的下标），
+  时间字段为毫秒时间戳。MessagePack帧中不含状态校验和（校验和按JSON形式计算），客户端只按版本号检查连续性。
+MessagePack帧由每条JSON消息转换一次得到，同一条广播的所有二进制连接共享转换结果。
+"""
+import argparse
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+try:
+    import orjson  # 可选依赖，编码速度快一个数量级
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack  # 可选依赖，二进制协议
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+JSON_PROTOCOL = "sillyworld.json"
+MSGPACK_PROTOCOL = "sillyworld.msgpack"
+
+# MessagePack协议的字段标签，标签为字段在此列表中的下标，只能在末尾追加
+FIELD_TAGS = (
+    # 消息外壳和状态同步
+    "type", "data", "seq", "checksum", "cursor", "session_id", "base", "diff", "$del", "$list", "len", "set", "append",
+    # GameState
+    "game_id", "phase", "players", "current_round", "prize_pool", "total_resources", "start_time", "last_update",
+    "winner", "is_active", "status", "persuasion_requests",
+    # Player / Item
+    "id", "name", "prompt", "balance", "items", "last_action_time", "price", "used",
+    # GameAction
+    "player_id", "action_type", "target_player", "amount", "message", "item_id", "item_type", "description",
+    "timestamp", "thinking_process", "public_message",
+    # PersuasionRequest
+    "from_player", "to_player", "accepted", "processed",
+    # game_end
+    "winner_id", "version",
+    # 人类玩家输入（input_request / input_ack）
+    "is_human", "request_id", "actions", "timeout", "deadline", "round", "error",
+)
+_TAG_OF = {name: tag for tag, name in enumerate(FIELD_TAGS)}
+# 以毫秒时间戳传输的字段
+TIMESTAMP_FIELDS = frozenset(("start_time", "last_update", "last_action_time", "timestamp", "end_time"))
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def negotiate_protocol(offered: List[str]) -> Optional[str]:
+    """按客户端提供的子协议顺序选择编码，未提供子协议时返回None（JSON）"""
+    for protocol in offered:
+        if protocol == MSGPACK_PROTOCOL and msgpack is not None:
+            return protocol
+        if protocol == JSON_PROTOCOL:
+            return protocol
+    return None
+
+
+def _loads(text: str) -> Any:
+    return orjson.loads(text) if orjson else json.loads(text)
+
+
+def _to_wire(value: Any, key: Any = None) -> Any:
+    """JSON形式 -> MessagePack形式：字段名换成标签，时间换成毫秒时间戳，去掉校验和"""
+    if isinstance(value, dict):
+        return {_TAG_OF.get(k, k): _to_wire(v, k) for k, v in value.items() if k != "checksum"}
+    if isinstance(value, list):
+        return [_to_wire(item) for item in value]
+    if key in TIMESTAMP_FIELDS and isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value).timestamp() * 1000)
+        except ValueError:
+            return value
+    return value
+
+
+def _from_wire(value: Any) -> Any:
+    """客户端发来的MessagePack形式 -> JSON形式（只还原字段名）"""
+    if isinstance(value, dict):
+        return {
+            (FIELD_TAGS[k] if isinstance(k, int) and 0 <= k < len(FIELD_TAGS) else k): _from_wire(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_from_wire(item) for item in value]
+    return value
+
+
+def decode_client_message(raw: bytes) -> Dict[str, Any]:
+    """解码MessagePack客户端发来的消息"""
+    return _from_wire(msgpack.unpackb(raw, strict_map_key=False))
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        # orjson 原生支持 datetime 和枚举，这里无需转换为JSON模式
+        return obj.model_dump() if orjson else obj.model_dump(mode="json")
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> str:
+    """把消息（可以包含Pydantic模型、枚举和datetime）编码为JSON文本"""
+    if orjson:
+        return orjson.dumps(obj, default=_default).decode("utf-8")
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+class MessageEncoder:
+    """消息编码器，按消息类型统计编码耗时分布"""
+
+    # 耗时直方图的桶上界（微秒），最后一个桶为超过所有上界
+    BUCKETS = (10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self, packed_cache: int = 256):
+        self.backend = "orjson" if orjson else "json"
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        # 最近转换过的MessagePack帧：JSON消息 -> 二进制帧
+        self._packed: "OrderedDict[str, bytes]" = OrderedDict()
+        self._packed_cache = max(1, packed_cache)
+
+    def encode(self, message_type: str, data: Any, **fields: Any) -> str:
+        """编码一条 {"type": ..., "data": ...} 消息
+
+        Args:
+            message_type: 消息类型
+            data: 消息内容
+            fields: 附加的顶层字段
+        """
+        return self.encode_message({"type": message_type, "data": data, **fields})
+
+    def encode_message(self, message: Dict[str, Any]) -> str:
+        """编码一条已经组装好的消息，按其type字段统计"""
+        started = time.perf_counter()
+        text = dumps(message)
+        self._observe(message.get("type", "message"), time.perf_counter() - started, len(text))
+        return text
+
+    def encode_data(self, message_type: str, data: Any) -> str:
+        """只编码消息内容，之后可以用 frame 组装到不同的消息外壳中（内容不会被重复编码）"""
+        started = time.perf_counter()
+        text = dumps(data)
+        self._observe(message_type, time.perf_counter() - started, len(text))
+        return text
+
+    @staticmethod
+    def frame(message_type: str, data_text: str, **fields: Any) -> str:
+        """用已编码的内容组装 {"type": ..., ..., "data": ...} 消息"""
+        head = dumps({"type": message_type, **fields})
+        return f'{head[:-1]},"data":{data_text}}}'
+
+    def pack(self, message: str) -> bytes:
+        """把编码后的JSON消息转换为MessagePack帧（每条消息只转换一次）"""
+        packed = self._packed.get(message)
+        if packed is not None:
+            self._packed.move_to_end(message)
+            return packed
+        started = time.perf_counter()
+        obj = _loads(message)
+        packed = msgpack.packb(_to_wire(obj))
+        self._observe(f"{obj.get('type', 'message')}/msgpack", time.perf_counter() - started, len(packed))
+        self._packed[message] = packed
+        if len(self._packed) > self._packed_cache:
+            self._packed.popitem(last=False)
+        return packed
+
+    def stats(self, message_type: Optional[str] = None) -> Dict[str, Any]:
+        """编码次数、平均耗时(微秒)、平均长度和耗时直方图"""
+        labels = [f"<{bound}us" for bound in self.BUCKETS] + [f">={self.BUCKETS[-1]}us"]
+        result = {}
+        for name, stats in self._stats.items():
+            if message_type is not None and name != message_type:
+                continue
+            count = stats["count"]
+            result[name] = {
+                "count": count,
+                "avg_us": round(stats["total_time"] * 1e6 / count, 1),
+                "max_us": round(stats["max_time"] * 1e6, 1),
+                "avg_bytes": round(stats["total_bytes"] / count),
+                "histogram": dict(zip(labels, stats["histogram"])),
+            }
+        return {"backend": self.backend, "msgpack": msgpack is not None, "types": result}
+
+    def _observe(self, message_type: str, elapsed: float, size: int):
+        stats = self._stats.get(message_type)
+        if stats is None:
+            stats = self._stats[message_type] = {
+                "count": 0, "total_time": 0.0, "max_time": 0.0, "total_bytes": 0,
+                "histogram": [0] * (len(self.BUCKETS) + 1),
+            }
+        stats["count"] += 1
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+        stats["total_bytes"] += size
+        micros = elapsed * 1e6
+        for index, bound in enumerate(self.BUCKETS):
+            if micros < bound:
+                stats["histogram"][index] += 1
+                break
+        else:
+            stats["histogram"][-1] += 1
+
+
+def _benchmark(args):
+    from models import GameAction, GameState, Item, ItemType, GamePhase, Player
+
+    now = datetime.now()
+    players = [
+        Player(id=f"player-{i}", name=f"玩家{i}", prompt="尽量说服其他玩家转账给我" * 5, balance=100 + i,
+               items=[Item(type=ItemType.SHIELD, price=20)], last_action_time=now)
+        for i in range(args.players)
+    ]
+    state = GameState(game_id="bench", phase=GamePhase.PERSUASION_PHASE, players=players, current_round=7,
+                      prize_pool=40, total_resources=400, start_time=now, last_update=now, status="active")
+    action = GameAction(player_id="player-0", action_type="ai_speech", target_player="player-1", amount=10,
+                        description="玩家0对玩家1发表了公开发言，请求转账10个代币", public_message="合作才能共赢，把代币交给我吧！",
+                        thinking_process="玩家1目前余额最高，应该优先说服他。" * 4)
+    encoder = MessageEncoder()
+    print(f"JSON后端={encoder.backend}, msgpack={'可用' if msgpack else '未安装'}")
+    for name, data in (("game_state", state), ("game_action", action)):
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            text = encoder.encode(name, data)
+        json_us = (time.perf_counter() - started) * 1e6 / args.iterations
+        line = f"{name}: JSON {len(text.encode('utf-8'))}字节 {json_us:.1f}us"
+        if msgpack is not None:
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                encoder._packed.clear()
+                packed = encoder.pack(text)
+            pack_us = (time.perf_counter() - started) * 1e6 / args.iterations
+            line += f" | MessagePack {len(packed)}字节 (JSON的{len(packed) / len(text.encode('utf-8')):.0%}) 转换{pack_us:.1f}us"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket消息编码基准：JSON与MessagePack的编码耗时和帧大小")
+    parser.add_argument("--players", type=int, default=8, help="游戏状态中的玩家数")
+    parser.add_argument("--iterations", type=int, default=2000, help="每种消息的编码次数")
+    _benchmark(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
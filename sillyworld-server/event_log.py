@@ -0,0 +1,407 @@
+import asyncio
+import copy
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from models import GameState, GameAction
+from clock import Clock, SystemClock
+from merkle import MerkleAccumulator, canonical_json, leaf_hash, verify_proof
+
+# 顶层可变字段（玩家、说服请求单独处理）
+_SCALAR_FIELDS = (
+    "phase", "current_round", "prize_pool", "total_resources",
+    "last_update", "winner", "is_active", "status",
+)
+_PLAYER_FIELDS = ("balance", "is_active", "last_action_time")
+
+
+class GameEvent(BaseModel):
+    """事件日志中的一条不可变记录"""
+    game_id: str
+    seq: int
+    round: int  # 事件所属回合（从1开始，快照为其状态的current_round）
+    event_type: str  # action / snapshot / field_set / player_added / player_set / item_added / item_used / persuasion_added / persuasion_updated / persuasion_set
+    data: Dict[str, Any] = {}
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+
+def compact_state(game_state: GameState) -> Dict[str, Any]:
+    """将GameState转换为紧凑的JSON安全字典，用于快照
+
+    结算阶段结束时已解决的说服请求会从游戏状态中移除，回合边界上的快照只包含仍待结算的请求，
+    快照大小不随回合数增长。
+    """
+    return game_state.model_dump(mode="json")
+
+
+def _fingerprint(game_state: GameState) -> Dict[str, Any]:
+    """状态中会被差异比较的部分（不序列化玩家prompt、道具详情等不变内容）
+
+    结构: {"fields": 顶层可变字段, "players": {玩家ID: [可变字段, 道具used标记列表]}, "requests": 说服请求}
+    """
+    return {
+        "fields": game_state.model_dump(mode="json", include=set(_SCALAR_FIELDS)),
+        "players": {
+            player.id: [player.model_dump(mode="json", include=set(_PLAYER_FIELDS)), [item.used for item in player.items]]
+            for player in game_state.players
+        },
+        "requests": [request.model_dump(mode="json") for request in game_state.persuasion_requests],
+    }
+
+
+def _diff_state(old: Dict[str, Any], game_state: GameState) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """比较上次记录的指纹与当前状态，返回状态变更事件（不含seq）和新指纹"""
+    new = _fingerprint(game_state)
+    changes = []
+    for field in _SCALAR_FIELDS:
+        if old["fields"].get(field) != new["fields"].get(field):
+            changes.append({"event_type": "field_set", "data": {"field": field, "value": new["fields"].get(field)}})
+
+    for player in game_state.players:
+        before = old["players"].get(player.id)
+        if before is None:
+            changes.append({"event_type": "player_added", "data": {"player": player.model_dump(mode="json")}})
+            continue
+        fields, used = new["players"][player.id]
+        for field in _PLAYER_FIELDS:
+            if before[0].get(field) != fields.get(field):
+                changes.append({"event_type": "player_set", "data": {
+                    "player_id": player.id, "field": field, "value": fields.get(field)
+                }})
+        old_used = before[1]
+        for index, item_used in enumerate(used):
+            if index >= len(old_used):
+                changes.append({"event_type": "item_added", "data": {
+                    "player_id": player.id, "item": player.items[index].model_dump(mode="json")
+                }})
+            elif item_used and not old_used[index]:
+                changes.append({"event_type": "item_used", "data": {"player_id": player.id, "index": index}})
+
+    old_requests, requests = old["requests"], new["requests"]
+    if len(requests) < len(old_requests):
+        # 已解决的请求被移除，整体替换为剩余的请求（此时列表很短）
+        changes.append({"event_type": "persuasion_set", "data": {"requests": requests}})
+    else:
+        for index, request in enumerate(requests):
+            if index >= len(old_requests):
+                changes.append({"event_type": "persuasion_added", "data": {"request": request}})
+            elif request != old_requests[index]:
+                changed = {k: v for k, v in request.items() if old_requests[index].get(k) != v}
+                changes.append({"event_type": "persuasion_updated", "data": {"index": index, "fields": changed}})
+    return changes, new
+
+
+def _apply_event(state: Dict[str, Any], event: GameEvent):
+    """把单个状态变更事件应用到紧凑状态上（原地修改）"""
+    data = copy.deepcopy(event.data)
+    if event.event_type == "snapshot":
+        state.clear()
+        state.update(data["state"])
+    elif event.event_type == "field_set":
+        state[data["field"]] = data["value"]
+    elif event.event_type == "player_added":
+        state["players"].append(data["player"])
+    elif event.event_type in ("player_set", "item_added", "item_used"):
+        player = next(p for p in state["players"] if p["id"] == data["player_id"])
+        if event.event_type == "player_set":
+            player[data["field"]] = data["value"]
+        elif event.event_type == "item_added":
+            player["items"].append(data["item"])
+        else:
+            player["items"][data["index"]]["used"] = True
+    elif event.event_type == "persuasion_added":
+        state["persuasion_requests"].append(data["request"])
+    elif event.event_type == "persuasion_updated":
+        state["persuasion_requests"][data["index"]].update(data["fields"])
+    elif event.event_type == "persuasion_set":
+        state["persuasion_requests"] = data["requests"]
+
+
+class EventLog:
+    """仅追加的游戏事件日志，每隔N回合写入一次紧凑快照
+
+    任意回合的游戏状态可以通过"最近快照 + 之后的事件"重建，
+    因此不需要在内存中保留完整的历史GameState对象。
+
+    运行后台写入任务（start_flusher）时，事件先缓存在内存中，按间隔在线程中批量追加到文件，
+    不在事件循环中做文件IO；游戏结束后调用 forget 释放内存，之后需要时再从文件加载。
+    """
+
+    def __init__(self, snapshot_interval: int = 5, persist_dir: Optional[str] = None,
+                 clock: Optional[Clock] = None):
+        """初始化事件日志
+
+        Args:
+            snapshot_interval: 每隔多少回合写入一次快照
+            persist_dir: 事件持久化目录（每局游戏一个JSONL文件），为None时仅保存在内存中
+            clock: 事件时间戳使用的时钟
+        """
+        self.clock = clock or SystemClock()
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        if self.persist_dir:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+
+        self._events: Dict[str, List[GameEvent]] = {}
+        # 快照在事件列表中的位置，按seq递增
+        self._snapshot_index: Dict[str, List[int]] = {}
+        # 最近一次记录时的状态指纹，用于计算差异
+        self._shadow: Dict[str, Dict[str, Any]] = {}
+        # 每局游戏事件日志的增量Merkle树，叶子为按seq排列的事件
+        self._merkle: Dict[str, MerkleAccumulator] = {}
+
+        # 待写入文件的事件行，以及正在由写入线程追加的一批
+        self._pending: Dict[str, List[str]] = {}
+        self._writing: Dict[str, List[str]] = {}
+        self._io_lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    def start(self, game_state: GameState):
+        """开始记录一局游戏，写入初始快照"""
+        game_id = game_state.game_id
+        self._events[game_id] = []
+        self._snapshot_index[game_id] = []
+        self._merkle[game_id] = MerkleAccumulator()
+        self._shadow[game_id] = _fingerprint(game_state)
+        self._append(game_id, [self._snapshot_event(game_state)])
+
+    def record(self, game_state: GameState, actions: Iterable[GameAction] = ()) -> List[GameEvent]:
+        """记录一批动作以及自上次记录以来的全部状态变更
+
+        Args:
+            game_state: 当前游戏状态
+            actions: 本次产生的游戏动作
+
+        Returns:
+            List[GameEvent]: 新追加的事件
+        """
+        game_id = game_state.game_id
+        if game_id not in self._shadow and not self.load(game_id):
+            self.start(game_state)
+
+        # 回合结束时current_round才会+1，因此以记录前的回合数+1作为事件所属回合
+        round_no = self._shadow[game_id]["fields"]["current_round"] + 1
+        events = [
+            self._new_event(game_id, round_no, "action", action.model_dump(mode="json"))
+            for action in actions
+        ]
+        changes, self._shadow[game_id] = _diff_state(self._shadow[game_id], game_state)
+        for change in changes:
+            events.append(self._new_event(game_id, round_no, change["event_type"], change["data"]))
+
+        # 跨过快照间隔时写入紧凑快照
+        last_snapshot = self._events[game_id][self._snapshot_index[game_id][-1]]
+        if game_state.current_round - last_snapshot.round >= self.snapshot_interval:
+            events.append(self._snapshot_event(game_state))
+
+        self._append(game_id, events)
+        return events
+
+    def events(self, game_id: str, after_seq: int = -1, limit: Optional[int] = None) -> List[GameEvent]:
+        """按顺序返回seq大于after_seq的事件"""
+        events = self._events.get(game_id, [])
+        start = max(0, after_seq + 1)  # seq与列表下标一致
+        end = None if limit is None else start + limit
+        return events[start:end]
+
+    def loaded(self, game_id: str) -> bool:
+        """一局游戏的事件是否在内存中"""
+        return game_id in self._events
+
+    def last_seq(self, game_id: str) -> int:
+        """返回一局游戏最新事件的seq，没有事件时返回-1"""
+        return len(self._events.get(game_id, [])) - 1
+
+    def state_at(self, game_id: str, round_no: Optional[int] = None) -> Optional[GameState]:
+        """重建第round_no回合结束时的游戏状态，round_no为None时重建最新状态
+
+        复杂度为 O(最近快照之后的事件数)。
+        """
+        events = self._events.get(game_id)
+        if not events:
+            return None
+        target = events[-1].round if round_no is None else round_no
+
+        # 找到不晚于目标回合的最近快照
+        start_pos = None
+        for pos in reversed(self._snapshot_index[game_id]):
+            if events[pos].round <= target:
+                start_pos = pos
+                break
+        if start_pos is None:
+            return None
+
+        state: Dict[str, Any] = {}
+        for event in events[start_pos:]:
+            if event.round > target:
+                break
+            if event.event_type != "action":
+                _apply_event(state, event)
+        return GameState(**state)
+
+    def load(self, game_id: str) -> bool:
+        """从持久化目录加载一局游戏的事件日志"""
+        if not self.persist_dir:
+            return False
+        path = self.persist_dir / f"{game_id}.jsonl"
+        if not path.exists():
+            return False
+
+        # 文件之外还有尚未写入的事件：正在写入的一批在写入线程持有锁期间不会被读到一半
+        with self._io_lock:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            lines += self._writing.get(game_id, [])
+        lines += self._pending.get(game_id, [])
+
+        self._events[game_id] = []
+        self._snapshot_index[game_id] = []
+        self._merkle[game_id] = MerkleAccumulator()
+        for line in lines:
+            if line.strip():
+                self._index_event(GameEvent(**json.loads(line)))
+        state = self.state_at(game_id)
+        if state is not None:
+            self._shadow[game_id] = _fingerprint(state)
+        return True
+
+    def restore(self, game_state: GameState):
+        """崩溃恢复后重新接管一局游戏
+
+        持久化日志中可能包含恢复点之后、未被快照覆盖的事件，
+        因此在日志末尾追加一次完整快照，使后续重建以恢复点为准。
+        """
+        game_id = game_state.game_id
+        if game_id not in self._events and not self.load(game_id):
+            self.start(game_state)
+            return
+        fingerprint = _fingerprint(game_state)
+        if self._shadow.get(game_id) != fingerprint:
+            self._shadow[game_id] = fingerprint
+            self._append(game_id, [self._snapshot_event(game_state)])
+
+    def forget(self, game_id: str):
+        """释放一局游戏在内存中的事件和Merkle树（持久化文件保留，未写入的事件仍会写入）"""
+        self._events.pop(game_id, None)
+        self._snapshot_index.pop(game_id, None)
+        self._shadow.pop(game_id, None)
+        self._merkle.pop(game_id, None)
+
+    def commitment(self, game_id: str, size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """事件日志前size条（默认全部）的Merkle根"""
+        tree = self._merkle.get(game_id)
+        if tree is None or (size is not None and not 0 < size <= tree.size):
+            return None
+        size = tree.size if size is None else size
+        return {"root": tree.root(size).hex(), "size": size}
+
+    def proof(self, game_id: str, seq: int, size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """第seq条事件在前size条事件（默认全部）构成的Merkle树中的包含证明
+
+        验证方用 merkle.leaf_hash(canonical_json(event)) 作为叶子哈希，
+        沿 proof 自底向上计算，结果应等于 root。
+        """
+        tree = self._merkle.get(game_id)
+        if tree is None:
+            return None
+        size = tree.size if size is None else size
+        if not 0 <= seq < size <= tree.size:
+            return None
+        path = tree.proof(seq, size)
+        return {
+            "event": self._events[game_id][seq].model_dump(mode="json"),
+            "leaf": tree.levels[0][seq].hex(),
+            "index": seq,
+            "size": size,
+            "root": tree.root(size).hex(),
+            "proof": [node.hex() for node in path],
+        }
+
+    @staticmethod
+    def verify(proof: Dict[str, Any]) -> bool:
+        """用 proof() 的返回值重新计算叶子哈希并验证包含证明"""
+        return verify_proof(
+            leaf_hash(canonical_json(proof["event"])), proof["index"], proof["size"],
+            [bytes.fromhex(node) for node in proof["proof"]], bytes.fromhex(proof["root"])
+        )
+
+    def start_flusher(self, interval: float = 0.5):
+        """启动后台写入任务，此后事件按间隔批量写入文件"""
+        if self.persist_dir and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop_flusher(self):
+        """停止后台写入任务并写入剩余的事件"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        """在线程中把缓存的事件追加到文件"""
+        with self._io_lock:
+            # 被取消的上一次写入可能仍有未写完的一批，新事件排在它之后
+            for game_id, lines in self._pending.items():
+                self._writing.setdefault(game_id, []).extend(lines)
+            self._pending = {}
+        if self._writing:
+            await asyncio.to_thread(self._write_batch)
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"【错误/EventLog】写入事件日志失败: {e}")
+
+    def _write_batch(self):
+        with self._io_lock:
+            for game_id, lines in self._writing.items():
+                self._write_lines(game_id, lines)
+            self._writing = {}
+
+    def _write_lines(self, game_id: str, lines: List[str]):
+        with open(self.persist_dir / f"{game_id}.jsonl", "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def _snapshot_event(self, game_state: GameState) -> GameEvent:
+        return self._new_event(game_state.game_id, game_state.current_round, "snapshot",
+                               {"state": compact_state(game_state)})
+
+    def _new_event(self, game_id: str, round_no: int, event_type: str, data: Dict[str, Any]) -> GameEvent:
+        # seq在_append时按追加顺序分配
+        return GameEvent(game_id=game_id, seq=-1, round=round_no, event_type=event_type, data=data,
+                         timestamp=self.clock.now())
+
+    def _index_event(self, event: GameEvent):
+        events = self._events[event.game_id]
+        if event.event_type == "snapshot":
+            self._snapshot_index[event.game_id].append(len(events))
+        events.append(event)
+        # 追加时即增量哈希，叶子为事件的规范JSON编码
+        self._merkle[event.game_id].append(canonical_json(event.model_dump(mode="json")))
+
+    def _append(self, game_id: str, events: List[GameEvent]):
+        if not events:
+            return
+        for event in events:
+            event.seq = len(self._events[game_id])
+            self._index_event(event)
+
+        if self.persist_dir:
+            lines = [event.model_dump_json() + "\n" for event in events]
+            if self._flusher is not None:
+                self._pending.setdefault(game_id, []).extend(lines)
+            else:
+                # 没有后台写入任务时（如离线工具）直接写入
+                self._write_lines(game_id, lines)
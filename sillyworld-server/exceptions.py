@@ -44,4 +44,18 @@ class ItemError(GameError):
 
 class ValidationError(GameError):
     def __init__(self, field: str, error: str):
-        super().__init__(f"Validation error for {field}: {error}") 
\ No newline at end of file
+        super().__init__(f"Validation error for {field}: {error}")
+
+class VersionConflictError(GameError):
+    def __init__(self, key: str, expected_version: int, current_version: int):
+        super().__init__(
+            f"Version conflict for {key}. "
+            f"Expected: {expected_version}, Current: {current_version}"
+        )
+        self.status_code = status.HTTP_409_CONFLICT
+
+class AdmissionRejectedError(GameError):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server busy: {reason}. Retry after {retry_after} seconds")
+        self.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        self.headers = {"Retry-After": str(retry_after)}
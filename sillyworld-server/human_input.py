@@ -0,0 +1,351 @@
+"""人类玩家的输入队列
+
+人类席位（Player.is_human）的玩家通过WebSocket发送 game_action 消息。消息经过校验后进入该局游戏的输入队列，
+游戏阶段轮到该席位决策时打开一个输入请求（推送 input_request 给玩家），在阶段截止时间内等待输入；
+截止时仍没有输入时由AI按该席位的策略prompt代为决策。
+
+输入到达时直接交给正在等待的阶段（或在请求打开之前先保存，请求打开时立即取用），
+不经过轮询，其他席位的LLM调用不影响输入的处理。统计每个输入从收到到被游戏应用的延迟。
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from exceptions import InvalidActionError
+from models import GameAction, GameState, ItemType
+
+# 每个阶段人类玩家可以提交的动作（pass为放弃本阶段的动作）
+PHASE_ACTIONS = {
+    "preparation": ("buy_item", "pass"),
+    "item_usage": ("use_item", "pass"),
+    "persuasion": ("persuade", "pass"),
+    "persuasion_response": ("accept", "reject"),
+}
+# 各阶段等待人类玩家输入的默认截止时间(秒)
+DEFAULT_DEADLINES = {
+    "preparation": 20.0,
+    "item_usage": 20.0,
+    "persuasion": 30.0,
+    "persuasion_response": 20.0,
+}
+# 必须针对已打开的请求提交的阶段（如回应某个说服请求），其他阶段可以提前提交
+RESPONSE_PHASES = ("persuasion_response",)
+# 说服金额范围与发言长度上限
+PERSUADE_AMOUNT = (5, 20)
+MAX_MESSAGE_LENGTH = 500
+
+# 推送消息给玩家: (游戏ID, 玩家ID, {"type": ..., "data": ...})
+Notifier = Callable[[str, str, Dict[str, Any]], Awaitable[None]]
+
+
+def parse_deadlines(text: str) -> Dict[str, float]:
+    """解析 "item_usage=20,persuasion=30" 形式的截止时间配置，未列出的阶段使用默认值"""
+    deadlines = dict(DEFAULT_DEADLINES)
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        phase, _, seconds = part.partition("=")
+        if phase.strip() not in PHASE_ACTIONS:
+            raise ValueError(f"Unknown input phase: {phase}")
+        deadlines[phase.strip()] = float(seconds)
+    return deadlines
+
+
+class PlayerInput:
+    """一个通过校验的人类玩家输入"""
+
+    def __init__(self, player_id: str, phase: str, action: GameAction, round_number: int,
+                 received_at: float, request_id: Optional[str] = None):
+        """
+        Args:
+            action: 输入转换成的决策（与AI决策的格式相同）
+            round_number: 提交时的回合，提前提交的输入只在同一回合有效
+            received_at: 收到消息的时间（time.perf_counter）
+            request_id: 输入回应的请求，提前提交时为None
+        """
+        self.player_id = player_id
+        self.phase = phase
+        self.action = action
+        self.round_number = round_number
+        self.received_at = received_at
+        self.request_id = request_id
+
+
+class InputRequest:
+    """游戏正在等待的一个人类玩家输入"""
+
+    def __init__(self, player_id: str, phase: str, round_number: int, timeout: float,
+                 context: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.player_id = player_id
+        self.phase = phase
+        self.round_number = round_number
+        self.timeout = timeout
+        self.context = context or {}
+        self.opened_at = time.perf_counter()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def message(self) -> Dict[str, Any]:
+        return {
+            "type": "input_request",
+            "data": {
+                "request_id": self.id,
+                "phase": self.phase,
+                "round": self.round_number,
+                "actions": list(PHASE_ACTIONS[self.phase]),
+                "timeout": self.timeout,
+                "deadline": int((time.time() + self.timeout) * 1000),
+                **self.context,
+            },
+        }
+
+
+class GameInputQueue:
+    """一局游戏的人类玩家输入"""
+
+    def __init__(self, game_id: str):
+        self.game_id = game_id
+        # 请求ID -> 正在等待的请求（按打开顺序）
+        self._open: Dict[str, InputRequest] = {}
+        # (玩家ID, 阶段) -> 请求打开之前提交的输入，只保留最新的一个
+        self._early: Dict[Tuple[str, str], PlayerInput] = {}
+
+    def submit(self, game_state: GameState, player_id: str, data: Dict[str, Any], received_at: float) -> PlayerInput:
+        """校验输入并交给等待它的请求，还没有请求时先保存
+
+        Raises:
+            InvalidActionError: 输入不合法，或没有可以回应的请求
+        """
+        action_type = data.get("action_type")
+        request = self._match(player_id, action_type, data.get("request_id"), data.get("phase"))
+        # 提前提交时按动作推断阶段（pass需要指明阶段）
+        phase = request.phase if request is not None else data.get("phase") or next(
+            (p for p, actions in PHASE_ACTIONS.items()
+             if action_type in actions and action_type != "pass" and p not in RESPONSE_PHASES), None
+        )
+        if phase is None or action_type not in PHASE_ACTIONS.get(phase, ()):
+            raise InvalidActionError(str(action_type), "unsupported action for this phase")
+        if request is None and phase in RESPONSE_PHASES:
+            raise InvalidActionError(str(action_type), "no pending request to respond to")
+        action = validate_action(game_state, player_id, phase, data)
+        submitted = PlayerInput(player_id, phase, action, game_state.current_round, received_at,
+                                request.id if request is not None else None)
+        if request is not None:
+            request.future.set_result(submitted)
+        else:
+            self._early[(player_id, phase)] = submitted
+        return submitted
+
+    def _match(self, player_id: str, action_type: Any, request_id: Optional[str],
+               phase: Optional[str]) -> Optional[InputRequest]:
+        if request_id is not None:
+            request = self._open.get(request_id)
+            if request is None or request.player_id != player_id or request.future.done():
+                raise InvalidActionError(str(action_type), f"request {request_id} is not pending")
+            return request
+        # 未指定请求时回应该玩家最早打开的、接受该动作的请求
+        for request in self._open.values():
+            if (request.player_id == player_id and not request.future.done()
+                    and action_type in PHASE_ACTIONS[request.phase]
+                    and (phase is None or phase == request.phase)):
+                return request
+        return None
+
+    async def wait(self, player_id: str, phase: str, round_number: int, timeout: float,
+                   notify: Optional[Notifier] = None, context: Optional[Dict[str, Any]] = None
+                   ) -> Tuple[Optional[PlayerInput], float]:
+        """等待玩家在截止时间内的输入
+
+        Returns:
+            (输入, 请求打开到收到输入的时间)，超时为 (None, timeout)
+        """
+        early = self._early.pop((player_id, phase), None)
+        if early is not None and early.round_number == round_number:
+            return early, 0.0
+        if timeout <= 0:
+            return None, 0.0
+        request = InputRequest(player_id, phase, round_number, timeout, context)
+        self._open[request.id] = request
+        try:
+            if notify is not None:
+                await notify(self.game_id, player_id, request.message())
+            submitted = await asyncio.wait_for(request.future, timeout)
+            return submitted, submitted.received_at - request.opened_at
+        except asyncio.TimeoutError:
+            return None, timeout
+        finally:
+            del self._open[request.id]
+
+    def pending(self) -> List[Dict[str, Any]]:
+        return [
+            {"request_id": r.id, "player_id": r.player_id, "phase": r.phase,
+             "waiting": round(time.perf_counter() - r.opened_at, 3)}
+            for r in self._open.values()
+        ]
+
+    def close(self):
+        for request in self._open.values():
+            if not request.future.done():
+                request.future.cancel()
+        self._early.clear()
+
+
+def validate_action(game_state: GameState, player_id: str, phase: str, data: Dict[str, Any]) -> GameAction:
+    """校验输入并转换为决策，不合法时抛出 InvalidActionError"""
+    action_type = data["action_type"]
+    player = next((p for p in game_state.players if p.id == player_id), None)
+    if player is None or not player.is_human:
+        raise InvalidActionError(action_type, "not a human seat in this game")
+    if not player.is_active:
+        raise InvalidActionError(action_type, "player is no longer active")
+    message = data.get("message")
+    if message is not None and (not isinstance(message, str) or len(message) > MAX_MESSAGE_LENGTH):
+        raise InvalidActionError(action_type, f"message must be a string of at most {MAX_MESSAGE_LENGTH} characters")
+
+    target_player = data.get("target_player")
+    if action_type in ("use_item", "persuade") and target_player is not None:
+        if target_player == player_id or not any(p.id == target_player and p.is_active for p in game_state.players):
+            raise InvalidActionError(action_type, "target must be another active player")
+    if action_type == "persuade" and target_player is None:
+        raise InvalidActionError(action_type, "target_player is required")
+
+    amount = data.get("amount")
+    if action_type == "persuade":
+        low, high = PERSUADE_AMOUNT
+        if not isinstance(amount, int) or isinstance(amount, bool) or not low <= amount <= high:
+            raise InvalidActionError(action_type, f"amount must be an integer between {low} and {high}")
+
+    item_type = data.get("item_type")
+    if action_type == "use_item":
+        unused = [item.type for item in player.items if not item.used]
+        if not unused:
+            raise InvalidActionError(action_type, "no unused items")
+        if item_type is not None:
+            try:
+                item_type = ItemType(item_type)
+            except ValueError:
+                raise InvalidActionError(action_type, f"unknown item type {item_type}")
+            if item_type not in unused:
+                raise InvalidActionError(action_type, f"no unused {item_type.value} item")
+    else:
+        item_type = None
+
+    return GameAction(
+        player_id=player_id,
+        action_type=action_type,
+        target_player=target_player,
+        amount=amount if action_type == "persuade" else None,
+        item_type=item_type,
+        public_message=message,
+        description=f"玩家 {player.name} 提交了 {action_type}",
+    )
+
+
+class HumanInputHub:
+    """所有游戏的人类玩家输入队列及延迟统计"""
+
+    def __init__(self, deadlines: Optional[Dict[str, float]] = None, notify: Optional[Notifier] = None,
+                 latency_samples: int = 1000):
+        """初始化输入中心
+
+        Args:
+            deadlines: 各阶段等待输入的截止时间(秒)，未列出的阶段使用 DEFAULT_DEADLINES
+            notify: 推送 input_request 给玩家的回调
+            latency_samples: 延迟统计保留的最近样本数
+        """
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        self.notify = notify
+        self.queues: Dict[str, GameInputQueue] = {}
+        self.received = 0
+        self.rejected: Dict[str, int] = {}
+        self.applied_count = 0
+        self.timeouts = 0
+        # 最近若干个输入从收到到被游戏取用、到被应用（动作已记录和广播）的时间，以及玩家的响应时间(秒)
+        self._handoff: Deque[float] = deque(maxlen=max(1, latency_samples))
+        self._applied: Deque[float] = deque(maxlen=max(1, latency_samples))
+        self._response: Deque[float] = deque(maxlen=max(1, latency_samples))
+
+    def queue(self, game_id: str) -> GameInputQueue:
+        queue = self.queues.get(game_id)
+        if queue is None:
+            queue = self.queues[game_id] = GameInputQueue(game_id)
+        return queue
+
+    def submit(self, game_state: GameState, player_id: str, data: Dict[str, Any],
+               received_at: Optional[float] = None) -> PlayerInput:
+        """收到人类玩家的 game_action 消息
+
+        Raises:
+            InvalidActionError: 输入不合法
+        """
+        received_at = received_at if received_at is not None else time.perf_counter()
+        try:
+            submitted = self.queue(game_state.game_id).submit(game_state, player_id, data, received_at)
+        except InvalidActionError as e:
+            reason = str(data.get("action_type"))
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+            print(f"【警告/HumanInput】输入被拒绝: 游戏ID={game_state.game_id}, 玩家ID={player_id}, 原因={e.detail}")
+            raise
+        self.received += 1
+        print(f"【调试/HumanInput】收到输入: 游戏ID={game_state.game_id}, 玩家ID={player_id}, 阶段={submitted.phase}, "
+              f"动作={submitted.action.action_type}, 请求ID={submitted.request_id}")
+        return submitted
+
+    async def wait(self, game_state: GameState, player_id: str, phase: str,
+                   context: Optional[Dict[str, Any]] = None) -> Optional[PlayerInput]:
+        """等待人类席位在阶段截止时间内的输入，超时返回None（由AI代为决策）"""
+        submitted, response = await self.queue(game_state.game_id).wait(
+            player_id, phase, game_state.current_round, self.deadlines.get(phase, 0.0), self.notify, context
+        )
+        if submitted is None:
+            self.timeouts += 1
+            print(f"【警告/HumanInput】等待输入超时，由AI代为决策: 游戏ID={game_state.game_id}, 玩家ID={player_id}, 阶段={phase}")
+            return None
+        self._response.append(response)
+        self._handoff.append(time.perf_counter() - submitted.received_at)
+        return submitted
+
+    def applied(self, submitted: Optional[PlayerInput]):
+        """输入对应的动作已经被游戏应用"""
+        if submitted is None:
+            return
+        self.applied_count += 1
+        self._applied.append(time.perf_counter() - submitted.received_at)
+
+    def close(self, game_id: str):
+        queue = self.queues.pop(game_id, None)
+        if queue is not None:
+            queue.close()
+
+    @staticmethod
+    def _summary(samples: Deque[float]) -> Dict[str, Any]:
+        ordered = sorted(samples)
+
+        def percentile(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+        return {
+            "samples": len(ordered),
+            "avg": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "deadlines": self.deadlines,
+            "received": self.received,
+            "rejected": dict(self.rejected),
+            "applied": self.applied_count,
+            "timeouts": self.timeouts,
+            # 收到 -> 被等待中的阶段取用(毫秒)
+            "handoff_ms": self._summary(self._handoff),
+            # 收到 -> 动作已记录和广播(毫秒)
+            "applied_ms": self._summary(self._applied),
+            # 请求打开 -> 收到输入，即玩家的思考时间(毫秒)
+            "response_ms": self._summary(self._response),
+            "pending": {game_id: queue.pending() for game_id, queue in self.queues.items() if queue.pending()},
+        }
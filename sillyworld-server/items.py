@@ -1,20 +1,247 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Iterable, Tuple, FrozenSet
 from datetime import datetime
+from itertools import combinations
 from models import Item, ItemType, Player, GameState, GameAction
+from ledger import TokenLedger, POOL
 import random
 
+# 道具效果标记表：玩家ID -> 目标玩家ID（无目标时为None）
+EffectMarks = Dict[str, Optional[str]]
+
+# 道具阶段使用道具时的效果处理：返回效果描述
+UseHook = Callable[[GameState, EffectMarks, Player, Player, Item], str]
+# 回合开始/结算阶段的效果处理：接收当前时间戳和代币账本，返回产生的动作
+PhaseHook = Callable[[GameState, EffectMarks, datetime, TokenLedger], List[GameAction]]
+# 结算阶段支付金额修正：输入原始金额，返回实际支付金额
+PaymentHook = Callable[[int], int]
+
+
+class ItemSpec:
+    """道具定义：价格、抽取权重以及各阶段的效果钩子"""
+
+    def __init__(self,
+                 item_type: ItemType,
+                 name: str,
+                 price: int,
+                 weight: float = 1.0,
+                 on_use: Optional[UseHook] = None,
+                 on_round_start: Optional[PhaseHook] = None,
+                 on_settlement: Optional[PhaseHook] = None,
+                 on_payment: Optional[PaymentHook] = None):
+        """初始化道具定义
+
+        Args:
+            item_type: 道具类型
+            name: 道具中文名
+            price: 购买价格
+            weight: 随机抽取时的相对权重
+            on_use: 道具阶段使用时的效果
+            on_round_start: 下一回合开始时触发的效果
+            on_settlement: 结算阶段转账完成后触发的效果
+            on_payment: 被说服支付时对金额的修正
+        """
+        self.type = item_type
+        self.name = name
+        self.price = price
+        self.weight = weight
+        self.on_use = on_use
+        self.on_round_start = on_round_start
+        self.on_settlement = on_settlement
+        self.on_payment = on_payment
+
+
+def _find_active_player(game_state: GameState, player_id: Optional[str]) -> Optional[Player]:
+    return next((p for p in game_state.players if p.id == player_id and p.is_active), None)
+
+
+# ---- 激进卡 ----
+
+def _use_aggressive(game_state: GameState, marks: EffectMarks, player: Player, target: Player, item: Item) -> str:
+    # 标记玩家使用了激进卡，说服失败时将受到额外惩罚（在结算阶段处理）
+    marks[player.id] = target.id
+    return f"激活攻击策略，若本轮说服失败将额外损失 {item.price} 代币作为惩罚，若成功则无额外奖励"
+
+
+def _settle_aggressive(game_state: GameState, marks: EffectMarks, now: datetime, ledger: TokenLedger) -> List[GameAction]:
+    actions = []
+    for player_id in list(marks):
+        del marks[player_id]
+        player = _find_active_player(game_state, player_id)
+        if not player:
+            continue
+
+        # 检查该玩家是否有发起并成功的说服
+        has_successful_persuasion = any(
+            r.from_player == player.id and r.accepted and r.processed
+            for r in game_state.persuasion_requests
+        )
+        if has_successful_persuasion:
+            continue
+
+        # 查找玩家使用的激进卡
+        aggressive_item = next((item for item in player.items if item.used and item.type == ItemType.AGGRESSIVE), None)
+        penalty_amount = aggressive_item.price if aggressive_item else ITEM_REGISTRY[ItemType.AGGRESSIVE].price
+
+        if player.balance >= penalty_amount:
+            old_balance = player.balance
+            # 资金流入奖池
+            ledger.transfer(player.id, POOL, penalty_amount, "aggressive_penalty")
+
+            actions.append(GameAction(
+                player_id=player.id,
+                action_type="aggressive_penalty",
+                amount=penalty_amount,
+                description=f"激进卡反噬：玩家 {player.name} 说服失败，损失 {penalty_amount} 代币 (从 {old_balance} 减至 {player.balance})，资金流入奖池",
+                timestamp=now
+            ))
+            print(f"【调试/Items】激进卡反噬: 玩家 {player.name} 损失 {penalty_amount} 代币")
+    return actions
+
+
+# ---- 护盾卡 ----
+
+def _use_shield(game_state: GameState, marks: EffectMarks, player: Player, target: Player, item: Item) -> str:
+    # 标记玩家使用了护盾，在被说服时支付金额减半（在结算阶段处理）
+    marks[player.id] = None
+    return f"激活防护盾，若本轮被其他玩家成功说服，需要支付的代币减半(50%)"
+
+
+def _shield_payment(amount: int) -> int:
+    return max(1, amount // 2)  # 至少支付1代币
+
+
+def _settle_shield(game_state: GameState, marks: EffectMarks, now: datetime, ledger: TokenLedger) -> List[GameAction]:
+    # 护盾效果只持续一轮
+    marks.clear()
+    return []
+
+
+# ---- 情报卡 ----
+
+def _use_intel(game_state: GameState, marks: EffectMarks, player: Player, target: Player, item: Item) -> str:
+    # 查看目标玩家的Prompt信息片段（取前1/3部分）
+    prompt_part = target.prompt[:len(target.prompt)//3] + "..."
+    return f"获取了 {target.name} 的隐藏信息片段: '{prompt_part}'，用于猜测对方的策略倾向"
+
+
+# ---- 均富卡 ----
+
+def _use_equalizer(game_state: GameState, marks: EffectMarks, player: Player, target: Player, item: Item) -> str:
+    # 找到当前资金最多的玩家(排除自己)，将在下一轮开始时与其平分资金
+    richest_player = max(
+        [p for p in game_state.players if p.id != player.id and p.is_active],
+        key=lambda p: p.balance
+    )
+    marks[player.id] = richest_player.id
+    return f"选择了 {richest_player.name} 作为均富目标，将在下一轮开始时与其平分两人的资金总额"
+
+
+def _round_start_equalizer(game_state: GameState, marks: EffectMarks, now: datetime, ledger: TokenLedger) -> List[GameAction]:
+    actions = []
+    for player_id, target_id in list(marks.items()):
+        del marks[player_id]
+        player = _find_active_player(game_state, player_id)
+        target_player = _find_active_player(game_state, target_id)
+        if not player or not target_player:
+            continue
+
+        player_balance = player.balance
+        target_balance = target_player.balance
+        each = (player_balance + target_balance) // 2
+        # 两人总额为奇数时，余下的1代币流入奖池
+        ledger.post({
+            player.id: each - player_balance,
+            target_player.id: each - target_balance,
+            POOL: player_balance + target_balance - 2 * each,
+        }, "equalizer")
+
+        actions.append(GameAction(
+            player_id=player.id,
+            action_type="equalizer_effect",
+            target_player=target_player.id,
+            description=f"均富卡生效：玩家 {player.name} 和 {target_player.name} 平分资金 (从 {player_balance}/{target_balance} 变为 {each}/{each})",
+            timestamp=now
+        ))
+        print(f"【调试/Items】均富卡生效: 玩家 {player.name} 和 {target_player.name} 平分资金")
+    return actions
+
+
+# 道具注册表：新增道具只需在此登记，无需修改游戏主循环
+ITEM_REGISTRY: Dict[ItemType, ItemSpec] = {
+    spec.type: spec for spec in [
+        ItemSpec(ItemType.AGGRESSIVE, "激进卡", price=15,
+                 on_use=_use_aggressive, on_settlement=_settle_aggressive),
+        ItemSpec(ItemType.SHIELD, "护盾卡", price=10,
+                 on_use=_use_shield, on_settlement=_settle_shield, on_payment=_shield_payment),
+        ItemSpec(ItemType.INTEL, "情报卡", price=8,
+                 on_use=_use_intel),
+        ItemSpec(ItemType.EQUALIZER, "均富卡", price=12,
+                 on_use=_use_equalizer, on_round_start=_round_start_equalizer),
+    ]
+}
+
+
+def _compile_draw_table(registry: Dict[ItemType, ItemSpec]) -> Dict[FrozenSet[str], Tuple[List[ItemType], List[float]]]:
+    """为每一种"已拥有道具类型"组合预先计算剩余可抽取的道具及其累计权重"""
+    values = [t.value for t in registry]
+    table = {}
+    for size in range(len(values) + 1):
+        for owned in combinations(values, size):
+            remaining = [t for t in registry if t.value not in owned]
+            cum_weights = []
+            total = 0.0
+            for t in remaining:
+                total += registry[t].weight
+                cum_weights.append(total)
+            table[frozenset(owned)] = (remaining, cum_weights)
+    return table
+
+
 class ItemSystem:
-    ITEM_PRICES = {
-        ItemType.AGGRESSIVE: 15,
-        ItemType.SHIELD: 10,
-        ItemType.INTEL: 8,
-        ItemType.EQUALIZER: 12
+    REGISTRY = ITEM_REGISTRY
+    ITEM_PRICES = {item_type: spec.price for item_type, spec in ITEM_REGISTRY.items()}
+
+    # 预编译的分发表
+    USE_HANDLERS: Dict[ItemType, UseHook] = {
+        t: spec.on_use for t, spec in ITEM_REGISTRY.items() if spec.on_use
     }
+    ROUND_START_HOOKS: List[Tuple[ItemType, PhaseHook]] = [
+        (t, spec.on_round_start) for t, spec in ITEM_REGISTRY.items() if spec.on_round_start
+    ]
+    SETTLEMENT_HOOKS: List[Tuple[ItemType, PhaseHook]] = [
+        (t, spec.on_settlement) for t, spec in ITEM_REGISTRY.items() if spec.on_settlement
+    ]
+    PAYMENT_HOOKS: List[Tuple[ItemType, PaymentHook]] = [
+        (t, spec.on_payment) for t, spec in ITEM_REGISTRY.items() if spec.on_payment
+    ]
+    _DRAW_TABLE = _compile_draw_table(ITEM_REGISTRY)
 
     @staticmethod
     def get_random_item() -> ItemType:
         """随机生成一个道具类型"""
-        return random.choice(list(ItemType))
+        return ItemSystem.draw_item_type(())
+
+    @staticmethod
+    def draw_item_type(owned: Iterable[str]) -> Optional[ItemType]:
+        """从玩家尚未拥有的道具类型中按权重抽取一个（不放回抽样）
+
+        Args:
+            owned: 玩家已拥有的道具类型值
+
+        Returns:
+            Optional[ItemType]: 抽中的道具类型，已拥有全部类型时返回None
+        """
+        remaining, cum_weights = ItemSystem._DRAW_TABLE[frozenset(owned)]
+        if not remaining:
+            return None
+        return random.choices(remaining, cum_weights=cum_weights)[0]
+
+    @staticmethod
+    def draw_affordable_item_type(owned: Iterable[str], balance: int) -> Optional[ItemType]:
+        """从玩家尚未拥有且买得起的道具类型中抽取一个，没有可选类型时返回None"""
+        excluded = set(owned)
+        excluded.update(t.value for t, price in ItemSystem.ITEM_PRICES.items() if price > balance)
+        return ItemSystem.draw_item_type(excluded)
 
     @staticmethod
     def create_item(item_type: ItemType) -> Item:
@@ -22,78 +249,48 @@ class ItemSystem:
         return Item(type=item_type, price=ItemSystem.ITEM_PRICES[item_type], used=False)
 
     @staticmethod
-    def can_use_item(player: Player, item_type: ItemType) -> bool:
-        # 检查玩家是否有足够的余额购买道具
-        return player.balance >= ItemSystem.ITEM_PRICES[item_type]
+    def new_effect_marks() -> Dict[ItemType, EffectMarks]:
+        """为一局游戏创建空的道具效果标记表"""
+        return {item_type: {} for item_type in ITEM_REGISTRY}
 
     @staticmethod
-    def use_item(
+    def apply_use(
         game_state: GameState,
+        effects: Dict[ItemType, EffectMarks],
         player: Player,
-        item_type: ItemType,
-        target_player: Optional[str] = None
-    ) -> GameAction:
-        if not ItemSystem.can_use_item(player, item_type):
-            raise ValueError("Player does not have enough balance to use this item")
-
-        # 扣除道具费用
-        player.balance -= ItemSystem.ITEM_PRICES[item_type]
-        
-        # 创建道具使用记录
-        action = GameAction(
-            player_id=player.id,
-            action_type="use_item",
-            target_player=target_player,
-            item_type=item_type,
-            timestamp=datetime.now()
-        )
-
-        # 根据道具类型处理效果
-        if item_type == ItemType.AGGRESSIVE:
-            # 激进卡效果在说服阶段处理
-            pass
-        elif item_type == ItemType.SHIELD:
-            # 护盾卡效果在说服阶段处理
-            pass
-        elif item_type == ItemType.INTEL:
-            # 情报卡效果在说服阶段处理
-            pass
-        elif item_type == ItemType.EQUALIZER:
-            # 均富卡效果在下一轮开始时处理
-            pass
-
-        return action
+        target: Player,
+        item: Item
+    ) -> str:
+        """在道具阶段应用道具效果，返回效果描述"""
+        handler = ItemSystem.USE_HANDLERS.get(item.type)
+        if not handler:
+            return ""
+        return handler(game_state, effects[item.type], player, target, item)
 
     @staticmethod
-    def handle_item_conflicts(
-        game_state: GameState,
-        actions: List[GameAction]
-    ) -> List[GameAction]:
-        # 处理道具冲突
-        # 按照时间戳排序，先使用的道具生效
-        sorted_actions = sorted(actions, key=lambda x: x.timestamp)
-        valid_actions = []
-        used_items = set()
-
-        for action in sorted_actions:
-            if action.item_type not in used_items:
-                valid_actions.append(action)
-                used_items.add(action.item_type)
-
-        return valid_actions
+    def run_round_start(game_state: GameState, effects: Dict[ItemType, EffectMarks],
+                        now: datetime, ledger: TokenLedger) -> List[GameAction]:
+        """执行回合开始时生效的道具效果，now为产生动作的时间戳（游戏时钟），资金变动记入该局的ledger"""
+        actions = []
+        for item_type, hook in ItemSystem.ROUND_START_HOOKS:
+            if effects[item_type]:
+                actions.extend(hook(game_state, effects[item_type], now, ledger))
+        return actions
 
     @staticmethod
-    def apply_aggressive_effect(target_balance: int, prize_pool: int) -> tuple:
-        """应用激进卡效果"""
-        amount = 10
-        if target_balance >= amount:
-            target_balance -= amount
-            prize_pool += amount
-        return target_balance, prize_pool
+    def run_settlement(game_state: GameState, effects: Dict[ItemType, EffectMarks],
+                       now: datetime, ledger: TokenLedger) -> List[GameAction]:
+        """执行结算阶段（转账之后）生效的道具效果，now为产生动作的时间戳（游戏时钟），资金变动记入该局的ledger"""
+        actions = []
+        for item_type, hook in ItemSystem.SETTLEMENT_HOOKS:
+            if effects[item_type]:
+                actions.extend(hook(game_state, effects[item_type], now, ledger))
+        return actions
 
     @staticmethod
-    def apply_equalizer_effect(balance1: int, balance2: int) -> tuple:
-        """应用均富卡效果"""
-        total = balance1 + balance2
-        each = total // 2
-        return each, each 
\ No newline at end of file
+    def adjust_payment(effects: Dict[ItemType, EffectMarks], payer_id: str, amount: int) -> int:
+        """根据支付方生效中的道具修正需支付的金额"""
+        for item_type, hook in ItemSystem.PAYMENT_HOOKS:
+            if payer_id in effects[item_type]:
+                amount = hook(amount)
+        return amount
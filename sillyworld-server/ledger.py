@@ -0,0 +1,143 @@
+"""复式记账的代币账本
+
+一局游戏的所有代币移动（门票、购买道具、说服转账、道具效果、破产清算、获胜奖励和税费）
+都作为借贷平衡的分录追加到账本中，并由账本同步写入 GameState。
+账本的分录借贷平衡，账户合计恒等于期初总额；守恒检查把游戏状态中的合计
+（玩家余额 + 奖池 + 平台账户）与期初总额比较，再逐一核对本阶段被改动的账户，即可发现绕过账本的修改。
+"""
+from typing import Any, Dict, List, Optional
+
+from models import GameState
+
+# 非玩家账户
+POOL = "pool"    # 奖池，对应 GameState.prize_pool
+HOUSE = "house"  # 平台账户，收取获胜者税费
+
+
+class LedgerEntry:
+    """一条分录，各分项金额之和为0"""
+
+    __slots__ = ("seq", "round", "reason", "legs")
+
+    def __init__(self, seq: int, round_no: int, reason: str, legs: Dict[str, int]):
+        self.seq = seq
+        self.round = round_no
+        self.reason = reason
+        self.legs = legs
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "round": self.round, "reason": self.reason, "legs": self.legs}
+
+
+class TokenLedger:
+    """一局游戏的仅追加复式账本"""
+
+    def __init__(self, game_state: GameState):
+        """以当前状态作为期初余额开立账本"""
+        self.game_state = game_state
+        self._players = {p.id: p for p in game_state.players}
+        self.accounts: Dict[str, int] = {p.id: p.balance for p in game_state.players}
+        self.accounts[POOL] = game_state.prize_pool
+        self.accounts[HOUSE] = 0
+        # 期初总额，此后只能在账户之间移动
+        self.total = sum(self.accounts.values())
+        self.entries: List[LedgerEntry] = []
+        # 上次检查以来被改动的账户
+        self._touched: set = set()
+        self.violations: List[str] = []
+
+    @classmethod
+    def restore(cls, game_state: GameState, entries: List[Dict[str, Any]]) -> "TokenLedger":
+        """从崩溃恢复快照重建账本：账户余额取自恢复的游戏状态，平台账户余额和分录取自快照"""
+        ledger = cls(game_state)
+        ledger.entries = [LedgerEntry(e["seq"], e["round"], e["reason"], e["legs"]) for e in entries]
+        ledger.accounts[HOUSE] = sum(entry.legs.get(HOUSE, 0) for entry in ledger.entries)
+        ledger.total += ledger.accounts[HOUSE]
+        return ledger
+
+    def post(self, legs: Dict[str, int], reason: str) -> LedgerEntry:
+        """追加一条分录并写入游戏状态
+
+        Args:
+            legs: 账户 -> 金额变动，总和必须为0
+            reason: 分录原因，如 buy_item / settlement / winner_payout
+
+        Raises:
+            ValueError: 分录借贷不平衡或账户不存在
+        """
+        legs = {account: delta for account, delta in legs.items() if delta}
+        if sum(legs.values()) != 0:
+            raise ValueError(f"分录借贷不平衡: {reason} {legs}")
+        # 先校验全部账户，被拒绝的分录不留下部分写入
+        unknown = [account for account in legs if account not in self.accounts]
+        if unknown:
+            raise ValueError(f"未知账户: {', '.join(unknown)}")
+        for account, delta in legs.items():
+            self.accounts[account] += delta
+            self._touched.add(account)
+            if account == POOL:
+                self.game_state.prize_pool += delta
+            elif account != HOUSE:
+                self._players[account].balance += delta
+
+        entry = LedgerEntry(len(self.entries), self.game_state.current_round + 1, reason, legs)
+        self.entries.append(entry)
+        return entry
+
+    def transfer(self, from_account: str, to_account: str, amount: int, reason: str) -> Optional[LedgerEntry]:
+        """两个账户之间的转账"""
+        if amount == 0:
+            return None
+        return self.post({from_account: -amount, to_account: amount}, reason)
+
+    def check(self) -> bool:
+        """守恒检查：游戏状态中的合计与期初总额比较，并核对上次检查以来被改动的账户
+
+        总额不变但在未改动账户之间挪动的代币只有 audit() 能发现。
+
+        Returns:
+            bool: 是否通过，不通过时原因追加到 violations
+        """
+        ok = True
+        actual_total = (sum(p.balance for p in self.game_state.players)
+                        + self.game_state.prize_pool + self.accounts[HOUSE])
+        if actual_total != self.total:
+            self._violation(f"总额不守恒: 状态合计 {actual_total}，期初 {self.total}")
+            ok = False
+        for account in self._touched:
+            expected = self.accounts[account]
+            if account == POOL:
+                actual = self.game_state.prize_pool
+            elif account == HOUSE:
+                continue
+            else:
+                actual = self._players[account].balance
+            if actual != expected:
+                self._violation(f"账户 {account} 被绕过账本修改: 账本 {expected}，状态 {actual}")
+                ok = False
+            if expected < 0:
+                self._violation(f"账户 {account} 余额为负: {expected}")
+                ok = False
+        self._touched.clear()
+        return ok
+
+    def audit(self) -> bool:
+        """完整对账（O(P)），用于游戏结束时或调试"""
+        self._touched.update(self.accounts)
+        return self.check()
+
+    def entries_since(self, seq: int = -1) -> List[LedgerEntry]:
+        """返回seq之后的分录，供链上结算批量读取"""
+        return self.entries[seq + 1:]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "accounts": dict(self.accounts),
+            "entries": len(self.entries),
+            "violations": list(self.violations),
+        }
+
+    def _violation(self, message: str):
+        print(f"【错误/Ledger】游戏 {self.game_state.game_id}: {message}")
+        self.violations.append(message)
@@ -1,12 +1,31 @@
 import asyncio
+import hmac
 import json
-from datetime import datetime
+import secrets
+import time
 
 from models import Player, GameState, GameResult, GamePhase, GameAction
 from game import Game
 from ai import AISystem
 from items import ItemSystem
 from websocket import ConnectionManager
+from event_log import EventLog
+from recovery import RecoveryManager, ROUND_STEPS, next_step
+from sharding import shard_for, new_game_id
+from state_store import create_state_store, GameStateCache
+from scheduler import RoundScheduler
+from clock import get_pacing_profile, create_clock
+from admission import AdmissionController, LLMLimiter
+from pipeline import PhasePipeline, RecorderSink, BroadcastSink, MetricsSink
+from chain_settlement import ChainSettlementQueue, create_chain_backend
+from pubsub import create_pubsub
+from projection import (ADMIN_VIEW, PUBLIC_VIEW, connection_view, player_view, project_event,
+                        project_ledger_entry, project_state, seat_token, verify_seat_token)
+from human_input import HumanInputHub, PHASE_ACTIONS, parse_deadlines, validate_action
+from actor import ActorSystem
+from exceptions import InvalidActionError
+from encoder import (negotiate_protocol, decode_client_message, msgpack_available, FIELD_TAGS,
+                     TIMESTAMP_FIELDS, JSON_PROTOCOL, MSGPACK_PROTOCOL)
 
 from fastapi import FastAPI, WebSocket, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
@@ -14,7 +33,7 @@ from pydantic import BaseModel
 import uvicorn
 import os
 from dotenv import load_dotenv
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 
 # 加载环境变量
 load_dotenv()
@@ -65,9 +84,164 @@ async def log_requests(request, call_next):
         raise
 
 # 初始化系统组件
-ai_system = AISystem(openrouter_api_key=os.getenv("OPENROUTER_API_KEY"))
-game_system = Game(ai_system)
-connection_manager = ConnectionManager()
+# 准入控制：同时运行的游戏数与在途LLM调用数上限
+admission = AdmissionController(
+    max_active_games=int(os.getenv("MAX_ACTIVE_GAMES", "50")),
+    max_waiting_games=int(os.getenv("MAX_WAITING_GAMES", "100")),
+    retry_after=int(os.getenv("ADMISSION_RETRY_AFTER", "30")),
+    on_admit=lambda game_id: _admit_queued_game(game_id)
+)
+llm_limiter = LLMLimiter(int(os.getenv("MAX_INFLIGHT_LLM", "16")))
+ai_system = AISystem(openrouter_api_key=os.getenv("OPENROUTER_API_KEY"), llm_limiter=llm_limiter)
+# 回合节奏：spectator(默认) / fast / headless(零等待+虚拟时钟，用于模拟和基准测试)
+pacing = get_pacing_profile(os.getenv("PACING_PROFILE", "spectator"))
+clock = create_clock(pacing)
+print(f"【调试】节奏配置: {pacing.name}, 时钟={type(clock).__name__}")
+event_log = EventLog(
+    snapshot_interval=int(os.getenv("EVENT_SNAPSHOT_INTERVAL", "5")),
+    persist_dir=os.getenv("EVENT_LOG_DIR", "game_records/events"),
+    clock=clock
+)
+# 分片模式下由 sharding.py 为每个工作进程设置
+shard_index = int(os.getenv("SHARD_INDEX", "0"))
+shard_count = int(os.getenv("SHARD_COUNT", "1"))
+# 游戏状态存放在可插拔的外部存储中，本进程只缓存自己持有的游戏
+state_store = create_state_store(
+    os.getenv("STATE_STORE", "memory"),
+    os.getenv("STATE_STORE_DIR", "game_records/state")
+)
+# 以事件日志的最新seq作为变更标记：没有新事件的游戏不会被序列化
+game_cache = GameStateCache(
+    state_store,
+    replica_ttl=float(os.getenv("STATE_REPLICA_TTL", "1.0")),
+    change_marker=lambda game_id: event_log.last_seq(game_id)
+)
+# 游戏结果在后台批量上链，回合循环不等待确认
+chain_queue = ChainSettlementQueue(
+    create_chain_backend(os.getenv("CHAIN_BACKEND", "mock")),
+    batch_size=int(os.getenv("CHAIN_BATCH_SIZE", "6")),
+    linger=float(os.getenv("CHAIN_BATCH_LINGER", "0.2")),
+    max_in_flight=int(os.getenv("CHAIN_MAX_INFLIGHT", "4")),
+    max_retries=int(os.getenv("CHAIN_MAX_RETRIES", "5"))
+)
+# 人类席位的输入队列：WebSocket收到的决策交给正在等待的游戏阶段，截止时间内没有输入时由AI代为决策
+human_inputs = HumanInputHub(
+    deadlines=parse_deadlines(os.getenv("HUMAN_INPUT_DEADLINES", "")),
+    notify=lambda game_id, player_id, message: connection_manager.send_personal_message(game_id, player_id, message)
+)
+# 准备阶段通过WebSocket放弃购买的人类席位: 游戏ID -> 玩家ID集合（准备阶段结束时不再由AI代为购买）
+preparation_passes: Dict[str, Set[str]] = {}
+game_system = Game(
+    ai_system,
+    event_log=event_log,
+    game_id_factory=lambda: new_game_id(shard_index, shard_count),
+    games=game_cache,
+    clock=clock,
+    on_result=chain_queue.enqueue,
+    inputs=human_inputs
+)
+# 游戏事件总线：多进程部署时游戏所在进程发布，持有观众连接的进程投递
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+event_bus = create_pubsub(
+    PUBSUB_BACKEND,
+    **({"path": os.getenv("PUBSUB_SOCKET", "/tmp/sillyworld-pubsub.sock")} if PUBSUB_BACKEND == "unix" else {})
+)
+# 每个WebSocket连接一个有界发送队列，慢速客户端按策略丢弃、合并或断开
+connection_manager = ConnectionManager(
+    max_queue=int(os.getenv("WS_SEND_QUEUE", "256")),
+    policy=os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest"),
+    history_size=int(os.getenv("WS_HISTORY_SIZE", "500")),
+    replay_batch=int(os.getenv("WS_REPLAY_BATCH", "100")),
+    coalesce_window=float(os.getenv("WS_COALESCE_WINDOW", "0")),
+    spectator_shard_size=int(os.getenv("WS_SPECTATOR_SHARD_SIZE", "256")),
+    bus=event_bus,
+    heartbeat_interval=float(os.getenv("WS_HEARTBEAT_INTERVAL", "15")),
+    idle_timeout=float(os.getenv("WS_IDLE_TIMEOUT", "45")),
+    clock=clock
+)
+# 带上该令牌(?admin_token=)的WebSocket连接看到完整状态和所有思考过程；未设置时不提供管理员视图
+WS_ADMIN_TOKEN = os.getenv("WS_ADMIN_TOKEN", "")
+# 派生玩家席位令牌的密钥；未设置时每次启动随机生成（重启或崩溃恢复后之前发放的令牌失效）
+SEAT_TOKEN_SECRET = os.getenv("SEAT_TOKEN_SECRET") or secrets.token_hex(32)
+
+def _is_admin(admin_token: Optional[str]) -> bool:
+    return bool(WS_ADMIN_TOKEN) and admin_token is not None and hmac.compare_digest(admin_token, WS_ADMIN_TOKEN)
+
+def _request_view(game_id: str, player_id: Optional[str], token: Optional[str], admin_token: Optional[str]) -> str:
+    """HTTP请求的视图：管理员令牌为管理员视图，玩家ID加席位令牌为该玩家视图，否则为公开视图
+
+    Raises:
+        HTTPException: 提供了玩家ID但席位令牌无效
+    """
+    if _is_admin(admin_token):
+        return ADMIN_VIEW
+    if player_id is None:
+        return PUBLIC_VIEW
+    if not verify_seat_token(SEAT_TOKEN_SECRET, game_id, player_id, token):
+        raise HTTPException(status_code=403, detail="Invalid seat token")
+    return player_view(player_id)
+# 阶段流水线：动作一产生就依次交给记录、广播和统计接收端
+phase_metrics = MetricsSink()
+phase_pipeline = PhasePipeline(
+    game_system,
+    [RecorderSink(game_system), BroadcastSink(connection_manager)],
+    metrics=phase_metrics
+)
+recovery_manager = RecoveryManager(
+    game_system,
+    snapshot_dir=os.getenv("RECOVERY_DIR", "game_records/recovery"),
+    interval=float(os.getenv("RECOVERY_INTERVAL", "1.0"))
+)
+# 所有游戏的回合循环由同一个调度器驱动（run_scheduled_round 在下方定义，调用时才解析）
+round_scheduler = RoundScheduler(
+    lambda game_id, start_step: run_scheduled_round(game_id, start_step),
+    round_interval=float(os.getenv("ROUND_INTERVAL", pacing.round_interval)),
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_ROUNDS", "32")),
+    stall_timeout=float(os.getenv("ROUND_STALL_TIMEOUT", "120")),
+    # 连续出错被放弃的游戏与正常结束的游戏一样释放资源
+    on_failed=lambda game_id: _release_game(game_id)
+)
+# 每局游戏一个actor：购买道具、准备阶段和回合步骤都作为命令在游戏的邮箱中依次执行，互不交错
+actors = ActorSystem(throughput_window=float(os.getenv("ACTOR_THROUGHPUT_WINDOW", "60")))
+
+async def publish_action(game_id: str, action: GameAction):
+    """把回合循环或API产生的动作交给阶段流水线的接收端（记录、广播、统计）"""
+    await phase_pipeline.emit(game_id, action)
+
+@app.on_event("startup")
+async def restore_games():
+    """启动时恢复未完成的游戏，并从最近提交的步骤继续回合循环"""
+    round_scheduler.start()
+    owned = lambda game_id: shard_for(game_id, shard_count) == shard_index
+    for game_id, committed_step in recovery_manager.restore(owns=owned):
+        game_state = game_system.games[game_id]
+        # 恢复的游戏已经在运行，不受名额限制
+        admission.admit(game_id, force=True)
+        if game_state.status == "preparation":
+            print(f"【调试】重新开始准备阶段: 游戏ID={game_id}")
+            round_scheduler.track(game_id, asyncio.create_task(ai_preparation_phase(game_id, pacing.preparation_time)))
+        else:
+            start_step = next_step(committed_step)
+            print(f"【调试】恢复回合循环: 游戏ID={game_id}, 起始步骤={start_step}")
+            round_scheduler.schedule(game_id, start_step)
+    recovery_manager.start()
+    event_log.start_flusher(float(os.getenv("EVENT_FLUSH_INTERVAL", "0.5")))
+    game_cache.start(float(os.getenv("STATE_FLUSH_INTERVAL", "0.5")))
+    chain_queue.start()
+    await event_bus.start()
+    connection_manager.start()
+
+@app.on_event("shutdown")
+async def flush_recovery_snapshots():
+    # 先停止回合循环，使最后一次快照与提交的步骤一致
+    await round_scheduler.stop()
+    await actors.stop()
+    await recovery_manager.stop()
+    await event_log.stop_flusher()
+    await game_cache.stop()
+    await chain_queue.stop()
+    await connection_manager.stop()
+    await event_bus.stop()
 
 # API路由
 @app.get("/")
@@ -83,100 +257,353 @@ async def options_handler(path: str):
 class CreateGameRequest(BaseModel):
     players: List[Player]
 
-@app.post("/api/games", response_model=GameState)
+@app.post("/api/games")
 async def create_game(request: CreateGameRequest):
+    """创建游戏，返回游戏状态和每个席位的令牌（seat_tokens，只返回给创建者）"""
     print(f"【调试】接收到创建游戏请求，玩家数量={len(request.players)}")
+    # 等待队列已满时直接返回429，避免继续堆积
+    admission.check_capacity()
     try:
         players = [
-            Player(id=p.id, name=p.name, prompt=p.prompt, balance=100)  # 每位玩家初始代币为100
+            Player(id=p.id, name=p.name, prompt=p.prompt, balance=100, is_human=p.is_human)  # 每位玩家初始代币为100
             for p in request.players
         ]
         game_state = game_system.create_game(players)
-        # 确保奖池金额固定为每位玩家的10代币入场费总和
-        game_state.prize_pool = len(players) * 10
         print(f"【调试】游戏创建成功: 游戏ID={game_state.game_id}")
-        return game_state
+        return {
+            **game_state.model_dump(mode="json"),
+            "seat_tokens": {p.id: seat_token(SEAT_TOKEN_SECRET, game_state.game_id, p.id) for p in players}
+        }
     except Exception as e:
         print(f"【错误】创建游戏失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create game: {str(e)}")
 
 @app.get("/api/games/{game_id}")
-async def get_game(game_id: str):
+async def get_game(game_id: str, player_id: Optional[str] = None, seat_token: Optional[str] = None,
+                   admin_token: Optional[str] = None):
     game_state = game_system.games.get(game_id)
     if not game_state:
         raise HTTPException(status_code=404, detail="Game not found")
+    # 非本人的prompt和未使用道具的类型按视图隐藏
+    view = _request_view(game_id, player_id, seat_token, admin_token)
     
     # 转换为前端期望的格式
     response_data = {
         "game_id": game_state.game_id,
         "round": game_state.current_round,  # 转换字段名
         "phase": game_state.phase.value if isinstance(game_state.phase, GamePhase) else game_state.phase,
-        "players": [player.dict() for player in game_state.players],
+        "players": project_state({"players": [player.dict() for player in game_state.players]}, view)["players"],
         "prize_pool": game_state.prize_pool,
         "current_player_id": None,  # 前端期望的字段，暂时设为None
         "status": game_state.status,
         "winner_id": game_state.winner,  # 转换字段名
         "created_at": game_state.start_time.isoformat(),  # 转换字段名和格式
         "updated_at": game_state.last_update.isoformat(),  # 转换字段名和格式
-        "is_preparation": game_system.game_preparation.get(game_id, False)  # 添加准备阶段标志
+        # 添加准备阶段标志（其他进程持有的游戏按状态字段判断）
+        "is_preparation": game_system.game_preparation.get(game_id, game_state.status == "preparation"),
+        # 0为已放行，n为排队第n位，None为尚未启动
+        "queue_position": admission.position(game_id)
     }
     
     return response_data
 
+@app.get("/api/games/{game_id}/history")
+async def get_game_history(game_id: str, round: Optional[int] = None, player_id: Optional[str] = None,
+                           seat_token: Optional[str] = None, admin_token: Optional[str] = None):
+    """从事件日志重建指定回合的游戏状态（不指定回合时为最新状态），按请求的视图投影"""
+    view = _request_view(game_id, player_id, seat_token, admin_token)
+    if not event_log.loaded(game_id) and not event_log.load(game_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+    game_state = event_log.state_at(game_id, round)
+    if not game_state:
+        raise HTTPException(status_code=404, detail=f"No history for round {round}")
+    return project_state(game_state.model_dump(mode="json"), view)
+
+@app.get("/api/games/{game_id}/events")
+async def get_game_events(game_id: str, after_seq: int = -1, limit: int = 500, player_id: Optional[str] = None,
+                          seat_token: Optional[str] = None, admin_token: Optional[str] = None):
+    """按顺序返回事件日志，用于回放；私密内容按请求的视图隐藏"""
+    view = _request_view(game_id, player_id, seat_token, admin_token)
+    if not event_log.loaded(game_id) and not event_log.load(game_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+    return [project_event(event.model_dump(mode="json"), view)
+            for event in event_log.events(game_id, after_seq=after_seq, limit=limit)]
+
+@app.get("/api/games/{game_id}/settlements")
+async def get_game_settlements(game_id: str, player_id: Optional[str] = None, seat_token: Optional[str] = None,
+                               admin_token: Optional[str] = None):
+    """每回合的紧凑结算账本：轧差后的转账、完全抵消的请求、余额不足被拒绝的义务以及余额变动
+
+    结算只包含公开的说服转账，所有视图看到的内容相同；席位令牌与其他接口一样校验。
+    """
+    _request_view(game_id, player_id, seat_token, admin_token)
+    if game_id not in game_system.games:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return game_system.settlement_ledgers.get(game_id, [])
+
+@app.get("/api/games/{game_id}/ledger")
+async def get_game_ledger(game_id: str, after_seq: int = -1, player_id: Optional[str] = None,
+                          seat_token: Optional[str] = None, admin_token: Optional[str] = None):
+    """代币账本：各账户余额、守恒检查结果以及seq之后的分录，购买道具的金额只对本人和管理员可见"""
+    view = _request_view(game_id, player_id, seat_token, admin_token)
+    ledger = game_system.get_ledger(game_id)
+    if not ledger:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return {
+        **ledger.summary(),
+        "items": [project_ledger_entry(entry.to_dict(), view) for entry in ledger.entries_since(after_seq)]
+    }
+
+@app.get("/api/games/{game_id}/commitment")
+async def get_game_commitment(game_id: str, size: Optional[int] = None):
+    """事件日志的Merkle根；游戏结束后同时返回写入结果的根"""
+    if not event_log.loaded(game_id) and not event_log.load(game_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+    commitment = event_log.commitment(game_id, size)
+    if not commitment:
+        raise HTTPException(status_code=400, detail=f"Invalid log size {size}")
+    result = game_system.results.get(game_id)
+    return {
+        **commitment,
+        "result_root": result.log_root if result else None,
+        "result_size": result.log_size if result else None
+    }
+
+@app.get("/api/games/{game_id}/proof/{seq}")
+async def get_event_proof(game_id: str, seq: int, size: Optional[int] = None, player_id: Optional[str] = None,
+                          seat_token: Optional[str] = None, admin_token: Optional[str] = None):
+    """第seq条事件的包含证明，size默认为游戏结果中承诺的事件数（未结束时为当前日志长度）
+
+    事件含有该视图看不到的内容时返回投影后的事件并标记 redacted：
+    此时无法从事件重新计算叶子哈希，但仍可用返回的 leaf 验证它包含在 root 中。
+    """
+    view = _request_view(game_id, player_id, seat_token, admin_token)
+    if not event_log.loaded(game_id) and not event_log.load(game_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+    if size is None and game_id in game_system.results:
+        size = game_system.results[game_id].log_size
+    proof = event_log.proof(game_id, seq, size)
+    if not proof:
+        raise HTTPException(status_code=404, detail=f"No event {seq} within log size {size}")
+    event = project_event(proof["event"], view)
+    return {**proof, "event": event, "redacted": event is not proof["event"]}
+
+@app.get("/api/games/{game_id}/chain")
+async def get_game_chain_settlement(game_id: str):
+    """游戏结果的上链状态"""
+    status = chain_queue.status(game_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="No chain settlement for game")
+    return status
+
+@app.get("/api/chain")
+async def get_chain_stats():
+    """上链结算队列的统计：各状态数量、批次、重试、平均确认延迟和吞吐"""
+    return chain_queue.stats()
+
+@app.get("/api/ws/protocol")
+async def get_websocket_protocol():
+    """WebSocket可协商的子协议，以及MessagePack协议的字段标签和时间字段"""
+    return {
+        "subprotocols": [MSGPACK_PROTOCOL, JSON_PROTOCOL] if msgpack_available() else [JSON_PROTOCOL],
+        "field_tags": list(FIELD_TAGS),
+        "timestamp_fields": sorted(TIMESTAMP_FIELDS),
+    }
+
+@app.get("/api/ws/stats")
+async def get_websocket_stats():
+    """WebSocket连接的发送队列深度、丢弃/合并数量和滞后"""
+    return connection_manager.stats()
+
+@app.get("/api/admission")
+async def get_admission_stats():
+    """准入控制与LLM调用并发的当前状态"""
+    return {
+        "games": admission.stats(),
+        "llm": llm_limiter.stats()
+    }
+
+@app.get("/api/metrics/phases")
+async def get_phase_metrics():
+    """各阶段耗时、首个动作延迟以及各类动作数量"""
+    return phase_metrics.snapshot()
+
+@app.get("/api/metrics/inputs")
+async def get_input_metrics():
+    """人类玩家输入的数量、超时次数，以及从收到到被游戏应用的延迟"""
+    return human_inputs.stats()
+
+@app.get("/api/actors")
+async def get_actor_stats():
+    """每局游戏actor的邮箱深度、命令吞吐量以及等待和执行耗时"""
+    return actors.stats()
+
+@app.get("/api/state_store")
+async def get_state_store_stats():
+    """状态缓存中持有的游戏数、只读副本数以及写回时的版本冲突"""
+    return game_cache.stats()
+
+@app.get("/api/scheduler/games")
+async def list_scheduled_games():
+    """列出调度器中的游戏以及其中停滞的游戏"""
+    return {
+        "games": round_scheduler.games(),
+        "stalled": round_scheduler.stalled()
+    }
+
+@app.post("/api/games/{game_id}/cancel")
+async def cancel_game(game_id: str):
+    """取消一局游戏的回合循环，游戏状态置为cancelled"""
+    game_state = game_system.games.get(game_id)
+    if not game_state:
+        raise HTTPException(status_code=404, detail="Game not found")
+    if game_state.status == "completed":
+        raise HTTPException(status_code=400, detail="Game already completed")
+
+    # 先取消回合任务，它正在执行或排队的命令随之取消，取消命令不必等待一个完整的阶段
+    round_scheduler.cancel(game_id)
+    await actors.call(game_id, "cancel", _cancel_game, game_id, game_state)
+    await _release_game(game_id)
+    return {"game_id": game_id, "status": game_state.status}
+
+async def _cancel_game(game_id: str, game_state: GameState):
+    """取消游戏（在游戏的actor中执行）"""
+    if game_state.status == "completed":
+        # 排队期间游戏已经正常结束
+        return
+    # 此前的命令可能又创建了准备阶段任务或安排了回合
+    round_scheduler.cancel(game_id)
+    admission.release(game_id)
+    human_inputs.close(game_id)
+    preparation_passes.pop(game_id, None)
+    game_state.is_active = False
+    game_state.status = "cancelled"
+    game_system.game_preparation[game_id] = False
+    cancel_action = GameAction(
+        player_id="system",
+        action_type="game_cancelled",
+        description="游戏已被取消",
+        timestamp=clock.now()
+    )
+    await publish_action(game_id, cancel_action)
+    recovery_manager.snapshot(game_id)
+
 @app.post("/api/games/{game_id}/start")
-async def start_game(game_id: str):
+async def start_game(game_id: str, player_id: Optional[str] = None, seat_token: Optional[str] = None,
+                     admin_token: Optional[str] = None):
     print(f"【调试】接收到启动游戏请求: 游戏ID={game_id}")
     game_state = game_system.games.get(game_id)
     if not game_state:
         print(f"【错误】找不到游戏: 游戏ID={game_id}")
         raise HTTPException(status_code=404, detail="Game not found")
+    view = _request_view(game_id, player_id, seat_token, admin_token)
+    
+    # 启动在游戏的actor中执行，重复的启动请求不会再开始一个准备阶段或回合循环
+    if game_state.status == "waiting":
+        queue_position = await actors.call(game_id, "start", _start_game, game_id, game_state)
+    else:
+        print(f"【警告】游戏已经启动，忽略重复的启动请求: 游戏ID={game_id}, 状态={game_state.status}")
+        queue_position = 0
+    
+    # 返回与前端期望格式一致的游戏状态
+    response_data = {
+        "game_id": game_state.game_id,
+        "round": game_state.current_round,
+        "phase": game_state.phase.value if isinstance(game_state.phase, GamePhase) else game_state.phase,
+        "players": project_state({"players": [player.dict() for player in game_state.players]}, view)["players"],
+        "prize_pool": game_state.prize_pool,
+        "current_player_id": None,
+        "status": game_state.status,
+        "winner_id": game_state.winner,
+        "created_at": game_state.start_time.isoformat(),
+        "updated_at": game_state.last_update.isoformat(),
+        "is_preparation": game_state.status == "preparation",
+        "queue_position": queue_position
+    }
     
+    print(f"【调试】游戏准备阶段开始响应: 游戏ID={game_id}")
+    return response_data
+
+async def _start_game(game_id: str, game_state: GameState) -> int:
+    """启动游戏（在游戏的actor中执行）
+
+    Returns:
+        int: 在等待队列中的位置，0表示已进入准备阶段
+    """
+    if game_state.status != "waiting":
+        print(f"【警告】游戏已经启动，忽略重复的启动请求: 游戏ID={game_id}, 状态={game_state.status}")
+        return 0
+    queue_position = admission.position(game_id)
+    if queue_position:
+        print(f"【警告】游戏已在等待队列中，忽略重复的启动请求: 游戏ID={game_id}, 位置={queue_position}")
+        return queue_position
+
+    # 准入控制：运行中的游戏已满时进入等待队列，队列也满时返回429
+    queue_position = admission.admit(game_id)
+    if queue_position:
+        print(f"【调试】游戏进入等待队列: 游戏ID={game_id}, 位置={queue_position}")
+        queued_action = GameAction(
+            player_id="system",
+            action_type="game_queued",
+            description=f"服务器繁忙，游戏已进入等待队列，当前位置: {queue_position}",
+            timestamp=clock.now()
+        )
+        await publish_action(game_id, queued_action)
+    else:
+        await _begin_preparation(game_id, game_state)
+    return queue_position
+
+async def _begin_preparation(game_id: str, game_state: GameState):
+    """进入准备阶段并创建AI购买道具的后台任务"""
     # 设置游戏为准备阶段，记录开始时间
-    print(f"【调试】游戏 {game_id} 进入准备阶段，AI有10秒时间考虑购买道具")
+    print(f"【调试】游戏 {game_id} 进入准备阶段，AI有{pacing.preparation_time:g}秒时间考虑购买道具")
     game_system.game_preparation[game_id] = True
     game_state.status = "preparation"
-    preparation_start_time = datetime.now()
+    preparation_start_time = clock.now()
     
     # 广播游戏准备阶段开始的消息
     preparation_action = GameAction(
         player_id="system",
         action_type="preparation_start",
-        description=f"游戏准备阶段开始，AI有10秒时间考虑购买道具策略",
+        description=f"游戏准备阶段开始，AI有{pacing.preparation_time:g}秒时间考虑购买道具策略",
         timestamp=preparation_start_time
     )
-    await connection_manager.broadcast_game_action(game_id, preparation_action)
+    await publish_action(game_id, preparation_action)
+    recovery_manager.snapshot(game_id)
     
     # 异步执行AI道具购买决策
     try:
         # 创建一个决策任务
-        task = asyncio.create_task(ai_preparation_phase(game_id, 10))  # 10秒准备时间
+        task = asyncio.create_task(ai_preparation_phase(game_id, pacing.preparation_time))
+        round_scheduler.track(game_id, task)
         print(f"【调试】AI准备阶段任务已创建: 游戏ID={game_id}, 任务ID={id(task)}")
     except Exception as e:
         print(f"【错误】创建AI准备阶段任务失败: 游戏ID={game_id}, 错误={e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to start preparation phase: {str(e)}")
-    
-    # 返回与前端期望格式一致的游戏状态
-    response_data = {
-        "game_id": game_state.game_id,
-        "round": game_state.current_round,
-        "phase": game_state.phase.value if isinstance(game_state.phase, GamePhase) else game_state.phase,
-        "players": [player.dict() for player in game_state.players],
-        "prize_pool": game_state.prize_pool,
-        "current_player_id": None,
-        "status": game_state.status,
-        "winner_id": game_state.winner,
-        "created_at": game_state.start_time.isoformat(),
-        "updated_at": game_state.last_update.isoformat(),
-        "is_preparation": True
-    }
-    
-    print(f"【调试】游戏准备阶段开始响应: 游戏ID={game_id}")
-    return response_data
 
-async def ai_preparation_phase(game_id: str, preparation_time: int = 10):
-    """AI准备阶段处理，允许AI购买道具，持续指定的时间（默认10秒）"""
+def _admit_queued_game(game_id: str):
+    """等待队列中的游戏获得名额后开始准备阶段（在游戏的actor中执行）"""
+    game_state = game_system.games.get(game_id)
+    if not game_state or game_state.status != "waiting":
+        # 排队期间游戏已被取消或丢失，直接让出名额
+        admission.release(game_id)
+        return
+    actors.tell(game_id, "admitted", _begin_admitted_game, game_id, game_state)
+
+async def _begin_admitted_game(game_id: str, game_state: GameState):
+    if game_state.status != "waiting":
+        # 放入邮箱后游戏被取消
+        admission.release(game_id)
+        return
+    await _begin_preparation(game_id, game_state)
+
+async def ai_preparation_phase(game_id: str, preparation_time: float = 10):
+    """AI准备阶段处理，允许AI购买道具，持续指定的时间（默认10秒，由节奏配置决定）
+
+    广播和购买作为命令在游戏的actor中执行；准备时间内邮箱空闲，人类玩家的购买请求随到随处理。
+    """
     try:
         print(f"【调试】开始AI准备阶段: 游戏ID={game_id}")
         game_state = game_system.games.get(game_id)
@@ -184,332 +611,306 @@ async def ai_preparation_phase(game_id: str, preparation_time: int = 10):
             print(f"【错误】找不到游戏: 游戏ID={game_id}")
             return
         
-        # 记录开始时间
-        start_time = datetime.now()
-        
-        # 广播AI思考开始的消息
-        for player in game_state.players:
-            ai_thinking = GameAction(
-                player_id=player.id,
-                action_type="ai_thinking",
-                description=f"AI玩家 {player.name} 正在思考购买哪些道具...",
-                timestamp=datetime.now()
-            )
-            await connection_manager.broadcast_game_action(game_id, ai_thinking)
+        await actors.call(game_id, "preparation_announce", _announce_preparation, game_id, game_state)
         
         # 等待准备时间结束
-        await asyncio.sleep(preparation_time)
-        
-        # 为每个AI玩家购买道具
-        for player in game_state.players:
-            player_items = game_system.player_item_types.get(game_id, {}).get(player.id, set())
-            print(f"【调试】AI决策购买道具: 玩家ID={player.id}, 已有道具类型数={len(player_items)}, 类型={player_items}")
-            
-            # 模拟AI决策，随机决定购买1-3个道具
-            import random
-            target_item_count = random.randint(1, 3)
-            
-            # 广播AI决策结果
-            decision_log = GameAction(
-                player_id=player.id,
-                action_type="ai_decision",
-                description=f"AI玩家 {player.name} 决定购买 {target_item_count} 个不同类型的道具",
-                timestamp=datetime.now()
-            )
-            await connection_manager.broadcast_game_action(game_id, decision_log)
-            
-            # 购买道具直到达到目标数量或资金不足
-            while len(player_items) < target_item_count and player.balance >= 10:
-                # 尝试购买一个新类型的道具
-                item_type = ItemSystem.get_random_item()
-                
-                # 确保不重复购买同一类型的道具
-                attempts = 0
-                while item_type.value in player_items and attempts < 10:
-                    item_type = ItemSystem.get_random_item()
-                    attempts += 1
-                
-                if item_type.value not in player_items or attempts >= 10:
-                    # 购买道具
-                    cost = 10
-                    player.balance -= cost
-                    game_state.prize_pool += cost
-                    
-                    # 添加道具到玩家库存
-                    item = ItemSystem.create_item(item_type)
-                    player.items.append(item)
-                    
-                    # 记录玩家已购买的道具类型
-                    if game_id in game_system.player_item_types and player.id in game_system.player_item_types[game_id]:
-                        game_system.player_item_types[game_id][player.id].add(item_type.value)
-                    
-                    # 记录动作
-                    action = GameAction(
-                        player_id=player.id,
-                        action_type="buy_item",
-                        amount=cost,
-                        item_type=item_type,
-                        description=f"AI玩家 {player.name} 花费 {cost} 代币购买了道具: {item_type.value}，当前余额: {player.balance}",
-                        timestamp=datetime.now()
-                    )
-                    
-                    # 广播动作
-                    await connection_manager.broadcast_game_action(game_id, action)
-                    
-                    print(f"【调试】AI玩家购买道具: 玩家ID={player.id}, 道具={item_type.value}")
-                    
-                    # 更新玩家道具记录
-                    player_items = game_system.player_item_types.get(game_id, {}).get(player.id, set())
-        
-        # 准备阶段结束，开始游戏
-        game_state.is_active = True
-        game_state.status = "active"
-        
-        # 结束准备阶段，玩家不能再购买道具
-        game_system.game_preparation[game_id] = False
-        
-        # 广播准备阶段结束消息
-        end_prep_action = GameAction(
-            player_id="system",
-            action_type="preparation_end",
-            description=f"准备阶段结束，游戏正式开始！共有 {len(game_state.players)} 位玩家参与",
-            timestamp=datetime.now()
-        )
-        await connection_manager.broadcast_game_action(game_id, end_prep_action)
-        
-        print(f"【调试】游戏准备阶段结束，开始游戏: 游戏ID={game_id}")
+        await clock.sleep(preparation_time)
         
-        # 启动游戏回合处理
-        task = asyncio.create_task(process_game_rounds(game_id))
-        print(f"【调试】游戏回合处理任务已创建: 游戏ID={game_id}, 任务ID={id(task)}")
+        await actors.call(game_id, "preparation_purchases", _finish_preparation, game_id, game_state)
         
     except Exception as e:
         print(f"【错误】AI准备阶段处理出错: 游戏ID={game_id}, 错误={e}")
         import traceback
         traceback.print_exc()
 
-async def process_game_rounds(game_id: str):
-    """在后台处理游戏回合"""
-    try:
-        print(f"【调试】开始处理游戏回合: 游戏ID={game_id}")
-        game_state = game_system.games.get(game_id)
-        if not game_state:
-            print(f"【错误】找不到游戏: 游戏ID={game_id}")
-            return
-            
-        print(f"【调试】游戏状态检查: ID={game_id}, is_active={game_state.is_active}, status={game_state.status}")
-        if not game_state.is_active:
-            print(f"【错误】游戏不处于活动状态: 游戏ID={game_id}")
-            return
+async def _announce_preparation(game_id: str, game_state: GameState):
+    """广播AI思考开始的消息（人类席位在准备时间内通过 /buy_item 自己购买）"""
+    for player in game_state.players:
+        if player.is_human:
+            continue
+        ai_thinking = GameAction(
+            player_id=player.id,
+            action_type="ai_thinking",
+            description=f"AI玩家 {player.name} 正在思考购买哪些道具...",
+            timestamp=clock.now()
+        )
+        await publish_action(game_id, ai_thinking)
 
-        # 处理一轮游戏
-        print(f"【调试】处理游戏回合: 游戏ID={game_id}, 回合={game_state.current_round}, 当前阶段={game_state.phase}")
-        print(f"【调试】玩家状态: {[(p.name, p.balance, p.is_active) for p in game_state.players]}")
+async def _finish_preparation(game_id: str, game_state: GameState):
+    """为AI玩家购买道具，结束准备阶段并开始回合循环"""
+    if game_state.status != "preparation":
+        print(f"【警告】游戏已不在准备阶段: 游戏ID={game_id}, 状态={game_state.status}")
+        return
+    
+    # 为每个AI玩家购买道具
+    passed = preparation_passes.pop(game_id, set())
+    for player in game_state.players:
+        player_items = game_system.player_item_types.get(game_id, {}).get(player.id, set())
+        if player.is_human and (player_items or player.id in passed):
+            # 人类玩家已经自己购买了道具或选择不购买；一个都没买时由AI代为购买
+            continue
+        print(f"【调试】AI决策购买道具: 玩家ID={player.id}, 已有道具类型数={len(player_items)}, 类型={player_items}")
         
-        # 记录玩家在回合开始时的状态，用于跟踪变化
-        previous_player_states = {player.id: player.dict() for player in game_state.players}
+        # 模拟AI决策，随机决定购买1-3个道具
+        import random
+        target_item_count = random.randint(1, 3)
         
-        # 记录玩家状态（可观察）
-        status_action = GameAction(
-            player_id="system",
-            action_type="round_start",
-            description=f"回合 {game_state.current_round + 1} 开始，当前阶段: {game_state.phase}，奖池: {game_state.prize_pool} 代币",
-            timestamp=datetime.now()
+        # 广播AI决策结果
+        decision_log = GameAction(
+            player_id=player.id,
+            action_type="ai_decision",
+            description=f"AI玩家 {player.name} 决定购买 {target_item_count} 个不同类型的道具",
+            timestamp=clock.now()
         )
-        print(f"【调试】广播回合开始: {status_action.description}")
-        await connection_manager.broadcast_game_action(game_id, status_action)
-        
-        # 输出玩家初始状态
-        for player in game_state.players:
-            if player.is_active:
-                # 更详细的道具状态日志
-                items_info = "，".join([f"{item.type.value}" + ("(已使用)" if item.used else "") for item in player.items]) if player.items else "无"
-                player_status = GameAction(
-                    player_id=player.id,
-                    action_type="player_status",
-                    description=f"玩家 {player.name} 当前状态：资金 {player.balance} 代币，道具: {items_info}",
-                    timestamp=datetime.now()
-                )
-                print(f"【调试】广播玩家状态: {player_status.description}")
-                await connection_manager.broadcast_game_action(game_id, player_status)
-                
-                # 记录AI玩家的决策过程（如果是AI玩家）
-                if "AI" in player.name:
-                    ai_decision_log = GameAction(
-                        player_id=player.id,
-                        action_type="ai_decision",
-                        description=f"AI玩家 {player.name} 思考中: 当前回合={game_state.current_round+1}, 阶段={game_state.phase}, 资金={player.balance}",
-                        timestamp=datetime.now()
-                    )
-                    print(f"【调试】AI决策日志: {ai_decision_log.description}")
-                    await connection_manager.broadcast_game_action(game_id, ai_decision_log)
-        
-        # 等待2秒，让玩家有时间查看初始状态
-        await asyncio.sleep(2)
+        await publish_action(game_id, decision_log)
         
-        # AI思考阶段 - 让玩家感受到AI在"思考"
-        for player in game_state.players:
-            if player.is_active and "AI" in player.name:
-                thinking_action = GameAction(
+        # 购买道具直到达到目标数量或资金不足
+        while len(player_items) < target_item_count:
+            # 从尚未拥有且买得起的类型中抽取一个新道具，资金经由账本流入奖池
+            action = game_system.buy_item(game_state, player, buyer="AI玩家")
+            if action is None:
+                break
+            
+            # 广播动作（道具类型只对本人可见）
+            await publish_action(game_id, action)
+            
+            print(f"【调试】AI玩家购买道具: 玩家ID={player.id}, 道具={action.item_type.value}")
+            
+            # 更新玩家道具记录
+            player_items = game_system.player_item_types.get(game_id, {}).get(player.id, set())
+    
+    # 准备阶段结束，开始游戏
+    game_state.is_active = True
+    game_state.status = "active"
+    
+    # 结束准备阶段，玩家不能再购买道具
+    game_system.game_preparation[game_id] = False
+    
+    # 广播准备阶段结束消息
+    end_prep_action = GameAction(
+        player_id="system",
+        action_type="preparation_end",
+        description=f"准备阶段结束，游戏正式开始！共有 {len(game_state.players)} 位玩家参与",
+        timestamp=clock.now()
+    )
+    await publish_action(game_id, end_prep_action)
+    # 尚未提交回合中的任何步骤，恢复后从回合开始执行
+    recovery_manager.checkpoint(game_id, None)
+    
+    print(f"【调试】游戏准备阶段结束，开始游戏: 游戏ID={game_id}")
+    
+    # 启动游戏回合处理
+    round_scheduler.schedule(game_id)
+
+async def _announce_round_start(game_id: str, game_state: GameState):
+    """广播回合开始时的玩家状态"""
+    # 记录玩家状态（可观察）
+    status_action = GameAction(
+        player_id="system",
+        action_type="round_start",
+        description=f"回合 {game_state.current_round + 1} 开始，当前阶段: {game_state.phase}，奖池: {game_state.prize_pool} 代币",
+        timestamp=clock.now()
+    )
+    print(f"【调试】广播回合开始: {status_action.description}")
+    await publish_action(game_id, status_action)
+    
+    # 输出玩家初始状态
+    for player in game_state.players:
+        if player.is_active:
+            # 更详细的道具状态日志（未使用道具的类型只对本人可见，这里只公开数量）
+            unused = sum(1 for item in player.items if not item.used)
+            used = [item.type.value for item in player.items if item.used]
+            items_info = "，".join(([f"未使用{unused}个"] if unused else []) + [f"{name}(已使用)" for name in used]) or "无"
+            player_status = GameAction(
+                player_id=player.id,
+                action_type="player_status",
+                description=f"玩家 {player.name} 当前状态：资金 {player.balance} 代币，道具: {items_info}",
+                timestamp=clock.now()
+            )
+            print(f"【调试】广播玩家状态: {player_status.description}")
+            await publish_action(game_id, player_status)
+            
+            # 记录AI玩家的决策过程（如果是AI玩家）
+            if "AI" in player.name:
+                ai_decision_log = GameAction(
                     player_id=player.id,
-                    action_type="ai_thinking",
-                    description=f"AI玩家 {player.name} 正在分析局势，规划本轮策略...",
-                    timestamp=datetime.now()
+                    action_type="ai_decision",
+                    description=f"AI玩家 {player.name} 思考中: 当前回合={game_state.current_round+1}, 阶段={game_state.phase}, 资金={player.balance}",
+                    timestamp=clock.now()
                 )
-                await connection_manager.broadcast_game_action(game_id, thinking_action)
-        
-        # 等待2秒，模拟AI思考时间
-        await asyncio.sleep(2)
-        
-        # 道具阶段
-        print(f"【调试】即将进入道具阶段: 游戏ID={game_id}")
-        item_phase_action = GameAction(
-            player_id="system",
-            action_type="phase_change",
-            description=f"回合 {game_state.current_round+1} 道具阶段开始",
-            timestamp=datetime.now()
-        )
-        await connection_manager.broadcast_game_action(game_id, item_phase_action)
-        
-        # 处理道具阶段
-        item_actions = await game_system.process_item_phase(game_id)
-        for action in item_actions:
-            await connection_manager.broadcast_game_action(game_id, action)
-            print(f"【调试】广播道具阶段动作: {action.action_type} - {action.description}")
-        
-        # 等待1秒，让玩家有时间查看道具阶段结果
-        await asyncio.sleep(1)
-        
-        # 说服阶段
-        print(f"【调试】即将进入说服阶段: 游戏ID={game_id}")
-        persuasion_phase_action = GameAction(
-            player_id="system",
-            action_type="phase_change",
-            description=f"回合 {game_state.current_round+1} 说服阶段开始",
-            timestamp=datetime.now()
-        )
-        await connection_manager.broadcast_game_action(game_id, persuasion_phase_action)
-        
-        # 处理说服阶段
-        persuasion_actions = await game_system.process_persuasion_phase(game_id)
-        for action in persuasion_actions:
-            await connection_manager.broadcast_game_action(game_id, action)
-            print(f"【调试】广播说服阶段动作: {action.action_type} - {action.description}")
-        
-        # 等待1秒，让玩家有时间查看说服阶段结果
-        await asyncio.sleep(1)
-        
-        # 结算阶段
-        print(f"【调试】即将进入结算阶段: 游戏ID={game_id}")
-        settlement_phase_action = GameAction(
-            player_id="system",
-            action_type="phase_change",
-            description=f"回合 {game_state.current_round+1} 结算阶段开始",
-            timestamp=datetime.now()
-        )
-        await connection_manager.broadcast_game_action(game_id, settlement_phase_action)
-        
-        # 处理结算阶段
-        settlement_actions = await game_system.process_settlement_phase(game_id)
-        for action in settlement_actions:
-            await connection_manager.broadcast_game_action(game_id, action)
-            print(f"【调试】广播结算阶段动作: {action.action_type} - {action.description}")
-        
-        # 等待1秒，让玩家有时间查看结算阶段结果
-        await asyncio.sleep(1)
-        
-        # 统计阶段
-        print(f"【调试】即将进入统计阶段: 游戏ID={game_id}")
-        statistics_phase_action = GameAction(
-            player_id="system",
-            action_type="phase_change",
-            description=f"回合 {game_state.current_round+1} 统计阶段开始",
-            timestamp=datetime.now()
-        )
-        await connection_manager.broadcast_game_action(game_id, statistics_phase_action)
-        
-        # 处理统计阶段
-        statistics_actions = await game_system.process_statistics_phase(game_id)
-        for action in statistics_actions:
-            await connection_manager.broadcast_game_action(game_id, action)
-            print(f"【调试】广播统计阶段动作: {action.action_type} - {action.description}")
-        
-        # 回合结束，更新游戏状态
-        game_state.current_round += 1
-        game_state.last_update = datetime.now()
-        
-        # 回合结束状态记录
-        end_status_action = GameAction(
-            player_id="system",
-            action_type="round_end",
-            description=f"回合 {game_state.current_round} 结束，下一回合为回合 {game_state.current_round+1}，奖池现在为 {game_state.prize_pool} 代币",
-            timestamp=datetime.now()
-        )
-        print(f"【调试】广播回合结束: {end_status_action.description}")
-        await connection_manager.broadcast_game_action(game_id, end_status_action)
+                print(f"【调试】AI决策日志: {ai_decision_log.description}")
+                await publish_action(game_id, ai_decision_log)
+
+async def _announce_ai_thinking(game_id: str, game_state: GameState):
+    """AI思考阶段 - 让玩家感受到AI在“思考”"""
+    for player in game_state.players:
+        if player.is_active and "AI" in player.name:
+            thinking_action = GameAction(
+                player_id=player.id,
+                action_type="ai_thinking",
+                description=f"AI玩家 {player.name} 正在分析局势，规划本轮策略...",
+                timestamp=clock.now()
+            )
+            await publish_action(game_id, thinking_action)
+
+async def _run_round_phase(game_id: str, game_state: GameState, step: str):
+    """执行回合中的一个游戏阶段，动作产生后立即经流水线记录和广播"""
+    label = {
+        "item_phase": "道具",
+        "persuasion_phase": "说服",
+        "settlement_phase": "结算",
+        "statistics_phase": "统计",
+    }[step]
+
+    print(f"【调试】即将进入{label}阶段: 游戏ID={game_id}")
+    phase_action = GameAction(
+        player_id="system",
+        action_type="phase_change",
+        description=f"回合 {game_state.current_round+1} {label}阶段开始",
+        timestamp=clock.now()
+    )
+    await publish_action(game_id, phase_action)
+
+    action_count = await phase_pipeline.run_phase(game_id, step)
+    print(f"【调试】{label}阶段完成: 游戏ID={game_id}, 动作数={action_count}")
+
+async def run_scheduled_round(game_id: str, start_step: str) -> bool:
+    """调度器执行回合的入口，游戏结束时释放游戏占用的资源"""
+    keep_running = await process_game_round(game_id, start_step)
+    if not keep_running:
+        await _release_game(game_id)
+    return keep_running
+
+async def _release_game(game_id: str):
+    """游戏结束、取消或被调度器放弃后释放它占用的资源（可重复调用）"""
+    admission.release(game_id)
+    human_inputs.close(game_id)
+    preparation_passes.pop(game_id, None)
+    await actors.close(game_id)
+    # 结束的游戏不再产生事件：最后一次写回后逐出状态缓存，释放内存中的事件和Merkle树，需要时从存储和文件加载
+    game_cache.evict(game_id)
+    event_log.forget(game_id)
+    # 账本、结算记录、道具记录以及广播用的状态版本和动作缓冲区也随之释放
+    game_system.forget(game_id)
+    connection_manager.forget(game_id)
+
+async def process_game_round(game_id: str, start_step: str = ROUND_STEPS[0]) -> bool:
+    """处理一个游戏回合，由 round_scheduler 调度
+
+    每个步骤作为命令在游戏的actor中执行，步骤之间的停顿不占用邮箱。
+
+    Args:
+        game_id: 游戏ID
+        start_step: 从回合中的哪个步骤开始执行，崩溃恢复或出错重试时为最近提交步骤的下一步
+
+    Returns:
+        bool: 游戏是否需要继续下一回合
+    """
+    print(f"【调试】开始处理游戏回合: 游戏ID={game_id}, 起始步骤={start_step}")
+    game_state = game_system.games.get(game_id)
+    if not game_state:
+        print(f"【错误】找不到游戏: 游戏ID={game_id}")
+        return False
         
-        # 检查游戏是否结束
-        is_game_end = game_system.check_game_end(game_id)
-        if is_game_end:
-            print(f"【调试】游戏结束条件满足，执行结束流程: 游戏ID={game_id}")
-            end_actions = await game_system.end_game(game_id)
-            for action in end_actions:
-                await connection_manager.broadcast_game_action(game_id, action)
-            game_state.is_active = False
-            
-            # 游戏结束，广播游戏结束消息
-            if game_state.winner:
-                # 发送详细的结束消息
-                winner_name = next((p.name for p in game_state.players if p.id == game_state.winner), '未知')
-                end_message = GameAction(
-                    player_id="system",
-                    action_type="game_completed",
-                    description=f"游戏结束! 胜利者: {winner_name}，最终奖金: {game_state.prize_pool} 代币",
-                    timestamp=datetime.now()
-                )
-                print(f"【调试】广播游戏结束: {end_message.description}")
-                await connection_manager.broadcast_game_action(game_id, end_message)
-                await connection_manager.broadcast_game_end(game_id, game_state.winner)
+    print(f"【调试】游戏状态检查: ID={game_id}, is_active={game_state.is_active}, status={game_state.status}")
+    if not game_state.is_active:
+        print(f"【错误】游戏不处于活动状态: 游戏ID={game_id}")
+        return False
+
+    # 处理一轮游戏
+    print(f"【调试】处理游戏回合: 游戏ID={game_id}, 回合={game_state.current_round}, 当前阶段={game_state.phase}")
+    print(f"【调试】玩家状态: {[(p.name, p.balance, p.is_active) for p in game_state.players]}")
+    
+    for step in ROUND_STEPS[ROUND_STEPS.index(start_step):]:
+        if step == "round_start":
+            await actors.call(game_id, step, _announce_round_start, game_id, game_state)
+            # 停顿片刻，让玩家有时间查看初始状态
+            await clock.sleep(pacing.round_start_pause)
+            await actors.call(game_id, "ai_thinking", _commit_step, game_id, step, _announce_ai_thinking, game_state)
+            # 停顿片刻，模拟AI思考时间
+            await clock.sleep(pacing.ai_thinking_pause)
+        elif step == "round_end":
+            await actors.call(game_id, step, _commit_step, game_id, step, _end_round, game_state)
         else:
-            # 广播游戏状态更新
-            print(f"【调试】广播游戏状态: 游戏ID={game_id}, 回合={game_state.current_round}, 阶段={game_state.phase}")
-            broadcast_success = await connection_manager.broadcast_game_state(game_id, game_state)
-            
-            if not broadcast_success:
-                print(f"【警告】没有活跃的WebSocket连接，但游戏回合处理将继续: 游戏ID={game_id}")
-            
-            # 继续下一轮的处理
-            if game_state.is_active:
-                # 安排下一轮处理
-                delay = 3  # 延迟3秒
-                print(f"【调试】计划下一轮处理: 游戏ID={game_id}, 延迟={delay}秒")
-                await asyncio.sleep(delay)
-                print(f"【调试】启动下一轮处理任务: 游戏ID={game_id}")
-                
-                try:
-                    # 使用独立的任务处理以确保不会中断
-                    next_round_task = asyncio.create_task(process_game_rounds(game_id))
-                    print(f"【调试】下一轮处理任务已创建: 游戏ID={game_id}, 任务ID={id(next_round_task)}")
-                except Exception as e:
-                    print(f"【错误】创建下一轮处理任务失败: 游戏ID={game_id}, 错误={e}")
-                    import traceback
-                    traceback.print_exc()
-                    # 尝试重新调度
-                    print(f"【调试】尝试重新调度下一轮处理: 游戏ID={game_id}")
-                    asyncio.get_event_loop().call_later(5, lambda: asyncio.create_task(process_game_rounds(game_id)))
-            else:
-                print(f"【调试】游戏已结束: 游戏ID={game_id}")
-                
-    except Exception as e:
-        print(f"【错误】处理游戏回合时出错: 游戏ID={game_id}, 错误={e}")
-        # 记录堆栈跟踪以便调试
-        import traceback
-        traceback.print_exc()
+            await actors.call(game_id, step, _commit_step, game_id, step, _run_round_phase, game_state, step)
+
+        # 停顿片刻，让玩家有时间查看阶段结果
+        if step in ("item_phase", "persuasion_phase", "settlement_phase"):
+            await clock.sleep(pacing.phase_pause)
+    
+    return await actors.call(game_id, "round_complete", _complete_round, game_id, game_state)
+
+async def _commit_step(game_id: str, step: str, run_step, *args):
+    """执行回合中的一个步骤并提交（在游戏的actor中执行）
+
+    恢复快照在步骤完整执行后、下一个命令之前抓取，不会包含执行到一半的阶段。
+    """
+    await run_step(game_id, *args)
+    recovery_manager.checkpoint(game_id, step)
+    round_scheduler.checkpoint(game_id, step)
+
+async def _end_round(game_id: str, game_state: GameState):
+    """回合结束，更新游戏状态"""
+    game_state.current_round += 1
+    game_state.last_update = clock.now()
+    
+    # 回合结束状态记录
+    end_status_action = GameAction(
+        player_id="system",
+        action_type="round_end",
+        description=f"回合 {game_state.current_round} 结束，下一回合为回合 {game_state.current_round+1}，奖池现在为 {game_state.prize_pool} 代币",
+        timestamp=clock.now()
+    )
+    print(f"【调试】广播回合结束: {end_status_action.description}")
+    await publish_action(game_id, end_status_action)
+
+async def _complete_round(game_id: str, game_state: GameState) -> bool:
+    """检查游戏是否结束并广播回合后的状态，返回游戏是否需要继续下一回合"""
+    # 检查游戏是否结束
+    is_game_end = game_system.check_game_end(game_id)
+    if is_game_end:
+        print(f"【调试】游戏结束条件满足，执行结束流程: 游戏ID={game_id}")
+        await phase_pipeline.run_phase(game_id, "end_game")
+        game_state.is_active = False
+        human_inputs.close(game_id)
+        
+        # 游戏结束，广播游戏结束消息
+        if game_state.winner:
+            # 发送详细的结束消息
+            winner_name = next((p.name for p in game_state.players if p.id == game_state.winner), '未知')
+            end_message = GameAction(
+                player_id="system",
+                action_type="game_completed",
+                description=f"游戏结束! 胜利者: {winner_name}，最终奖金: {game_state.prize_pool} 代币",
+                timestamp=clock.now()
+            )
+            print(f"【调试】广播游戏结束: {end_message.description}")
+            await publish_action(game_id, end_message)
+            await connection_manager.broadcast_game_end(game_id, game_state.winner)
+        # 已结束的游戏在下一次写入时删除恢复快照
+        recovery_manager.snapshot(game_id)
+        return False
+
+    # 广播游戏状态更新
+    print(f"【调试】广播游戏状态: 游戏ID={game_id}, 回合={game_state.current_round}, 阶段={game_state.phase}")
+    broadcast_success = await connection_manager.broadcast_game_state(game_id, game_state)
+    
+    if not broadcast_success:
+        print(f"【警告】没有活跃的WebSocket连接，但游戏回合处理将继续: 游戏ID={game_id}")
+    
+    # 下一回合由调度器在 round_interval 之后安排
+    if not game_state.is_active:
+        print(f"【调试】游戏已结束: 游戏ID={game_id}")
+    return game_state.is_active
 
 # WebSocket路由
 @app.websocket("/ws/{game_id}/{player_id}")
-async def websocket_endpoint(websocket: WebSocket, game_id: str, player_id: str):
+async def websocket_endpoint(websocket: WebSocket, game_id: str, player_id: str, version: Optional[int] = None,
+                             cursor: Optional[int] = None, session: Optional[str] = None,
+                             admin_token: Optional[str] = None, seat_token: Optional[str] = None):
     print(f"WebSocket连接请求: 游戏ID={game_id}, 玩家ID={player_id}")
+    # 连接标识：玩家为玩家ID，观众为会话ID
+    connection_key = player_id
     try:
         # 检查game_id是否存在
         game_state = game_system.games.get(game_id)
@@ -518,18 +919,46 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str, player_id: str)
             await websocket.close(code=1008, reason="游戏不存在")
             return
             
-        await connection_manager.connect(websocket, game_id, player_id)
+        # 客户端通过子协议选择JSON或MessagePack
+        protocol = negotiate_protocol(websocket.scope.get("subprotocols", []))
+        # 视图决定连接看到的内容：本人（出示席位令牌）看到自己的完整信息，对手和观众只看到公开信息
+        is_admin = _is_admin(admin_token)
+        player_ids = [p.id for p in game_state.players]
+        seat_verified = verify_seat_token(SEAT_TOKEN_SECRET, game_id, player_id, seat_token)
+        if player_id in player_ids and not (is_admin or seat_verified):
+            # 只知道玩家ID不能以该玩家身份连接（否则会收到本人视图并替换真正玩家的连接）
+            print(f"WebSocket连接错误: 玩家ID={player_id}没有有效的席位令牌")
+            await websocket.close(code=1008, reason="invalid seat token")
+            return
+        view = connection_view(player_id, player_ids, is_admin, seat_verified)
+        # version为客户端重连前已有的状态版本，cursor为收到的最后一个动作的游标，session为观众的会话ID
+        connection_key = await connection_manager.connect(
+            websocket, game_id, player_id, state_version=version, cursor=cursor, session_id=session,
+            protocol=protocol, view=view
+        )
         print(f"WebSocket连接成功: 游戏ID={game_id}, 玩家ID={player_id}")
         
         try:
             while True:
-                data = await websocket.receive_text()
-                print(f"收到WebSocket消息: {data}")
                 # 处理接收到的消息
-                message = json.loads(data)
+                if protocol == MSGPACK_PROTOCOL:
+                    message = decode_client_message(await websocket.receive_bytes())
+                else:
+                    message = json.loads(await websocket.receive_text())
+                received_at = time.perf_counter()
+                # 任何消息都说明连接仍然存活
+                connection_manager.touch(game_id, connection_key, message)
+                if message["type"] == "pong":
+                    continue
+                print(f"收到WebSocket消息: {message}")
                 if message["type"] == "game_action":
-                    # 处理游戏动作
+                    # 人类席位提交的决策，校验后交给等待它的游戏阶段
                     print(f"处理游戏动作: {message}")
+                    await _submit_player_input(game_id, connection_key, message.get("data"), received_at)
+                elif message["type"] == "sync":
+                    # 客户端发现状态版本缺失或校验和不一致
+                    data = message.get("data") or {}
+                    connection_manager.sync_state(game_id, connection_key, data.get("version"))
         except Exception as e:
             print(f"WebSocket消息处理错误: {e}")
     except Exception as e:
@@ -538,87 +967,118 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str, player_id: str)
         traceback.print_exc()
     finally:
         print(f"WebSocket连接关闭: 游戏ID={game_id}, 玩家ID={player_id}")
-        connection_manager.disconnect(game_id, player_id)
+        connection_manager.disconnect(game_id, connection_key, websocket)
+
+async def _submit_player_input(game_id: str, player_id: str, data, received_at: float):
+    """把玩家通过WebSocket提交的决策放入游戏的输入队列，并回复 input_ack
+
+    准备阶段的决策不进入输入队列（准备阶段不等待输入）：buy_item 与 /buy_item 一样立即在游戏的actor中购买，
+    pass 表示不购买，准备阶段结束时不再由AI代为购买。
+    """
+    game_state = game_system.games.get(game_id)
+    try:
+        if not game_state or not game_state.is_active:
+            raise InvalidActionError("game_action", "game is not active")
+        if not isinstance(data, dict):
+            raise InvalidActionError("game_action", "data must be an object")
+        if game_system.game_preparation.get(game_id, False):
+            ack = await _submit_preparation_input(game_id, game_state, player_id, data)
+        else:
+            submitted = human_inputs.submit(game_state, player_id, data, received_at)
+            ack = {"accepted": True, "request_id": submitted.request_id, "phase": submitted.phase}
+    except InvalidActionError as e:
+        ack = {"accepted": False, "error": e.detail}
+    await connection_manager.send_personal_message(game_id, player_id, {"type": "input_ack", "data": ack})
+
+async def _submit_preparation_input(game_id: str, game_state: GameState, player_id: str, data: dict) -> dict:
+    """处理人类席位在准备阶段提交的决策，返回 input_ack 的内容
+
+    Raises:
+        InvalidActionError: 动作不属于准备阶段、不是人类席位，或购买失败
+    """
+    action_type = data.get("action_type")
+    if action_type not in PHASE_ACTIONS["preparation"]:
+        raise InvalidActionError(str(action_type), "unsupported action for this phase")
+    validate_action(game_state, player_id, "preparation", data)
+    if action_type == "pass":
+        preparation_passes.setdefault(game_id, set()).add(player_id)
+        return {"accepted": True, "phase": "preparation"}
+    try:
+        result = await actors.call(game_id, "buy_item", _buy_item, game_id, game_state, player_id)
+    except HTTPException as e:
+        raise InvalidActionError(action_type, e.detail)
+    preparation_passes.get(game_id, set()).discard(player_id)
+    return {"accepted": True, "phase": "preparation", **result}
 
 class BuyItemRequest(BaseModel):
     player_id: str
+    # 与 /ws 相同，只知道玩家ID不能替该玩家购买（管理员令牌可代替席位令牌）
+    seat_token: Optional[str] = None
+    admin_token: Optional[str] = None
 
 @app.post("/api/games/{game_id}/buy_item")
 async def buy_item(game_id: str, request: BuyItemRequest):
     print(f"【调试】接收到购买道具请求: 游戏ID={game_id}, 玩家ID={request.player_id}")
     
+    # 校验席位令牌：响应包含买到的道具类型，只能返回给本人（或管理员）
+    _request_view(game_id, request.player_id, request.seat_token, request.admin_token)
+    
     # 检查游戏是否存在
     game_state = game_system.games.get(game_id)
     if not game_state:
         print(f"【错误】找不到游戏: 游戏ID={game_id}")
         raise HTTPException(status_code=404, detail="Game not found")
     
-    # 检查是否处于准备阶段
+    # 检查是否处于准备阶段（不在时直接拒绝，不进入邮箱）
+    if not game_system.game_preparation.get(game_id, False):
+        print(f"【错误】游戏不在准备阶段，无法购买道具: 游戏ID={game_id}")
+        raise HTTPException(status_code=400, detail="Game is not in preparation phase")
+    
+    # 检查和购买在游戏的actor中执行，与AI购买和准备阶段结束依次进行，余额和奖池不会被并发修改
+    return await actors.call(game_id, "buy_item", _buy_item, game_id, game_state, request.player_id)
+
+async def _buy_item(game_id: str, game_state: GameState, player_id: str):
+    """为玩家购买一个道具（在游戏的actor中执行）
+
+    返回值包含本人视图的内容（买到的道具类型），调用方必须已经校验过席位令牌。
+    """
+    # 排队期间准备阶段可能已经结束
     if not game_system.game_preparation.get(game_id, False):
         print(f"【错误】游戏不在准备阶段，无法购买道具: 游戏ID={game_id}")
         raise HTTPException(status_code=400, detail="Game is not in preparation phase")
     
     # 查找玩家
-    player = next((p for p in game_state.players if p.id == request.player_id), None)
+    player = next((p for p in game_state.players if p.id == player_id), None)
     if not player:
-        print(f"【错误】找不到玩家: 游戏ID={game_id}, 玩家ID={request.player_id}")
+        print(f"【错误】找不到玩家: 游戏ID={game_id}, 玩家ID={player_id}")
         raise HTTPException(status_code=404, detail="Player not found")
     
     # 检查玩家是否已经有3种不同类型的道具
     player_items = game_system.player_item_types.get(game_id, {}).get(player.id, set())
     if len(player_items) >= 3:
-        print(f"【错误】玩家已有3种不同类型的道具: 游戏ID={game_id}, 玩家ID={request.player_id}")
+        print(f"【错误】玩家已有3种不同类型的道具: 游戏ID={game_id}, 玩家ID={player_id}")
         raise HTTPException(status_code=400, detail="Player already has 3 different item types")
     
     # 检查玩家是否有足够的余额
-    if player.balance < 10:
-        print(f"【错误】玩家余额不足: 游戏ID={game_id}, 玩家ID={request.player_id}, 余额={player.balance}")
+    if player.balance < min(ItemSystem.ITEM_PRICES.values()):
+        print(f"【错误】玩家余额不足: 游戏ID={game_id}, 玩家ID={player_id}, 余额={player.balance}")
         raise HTTPException(status_code=400, detail="Player does not have enough balance")
     
-    # 生成一个新的道具类型
-    item_type = ItemSystem.get_random_item()
-    
-    # 确保不重复购买同一类型的道具
-    attempts = 0
-    while item_type.value in player_items and attempts < 10:
-        item_type = ItemSystem.get_random_item()
-        attempts += 1
-    
-    if item_type.value in player_items and attempts >= 10:
-        print(f"【错误】无法找到新的道具类型: 游戏ID={game_id}, 玩家ID={request.player_id}")
-        raise HTTPException(status_code=500, detail="Failed to find new item type")
-    
-    # 购买道具
-    cost = 10
-    player.balance -= cost
-    game_state.prize_pool += cost
-    
-    # 添加道具到玩家库存
-    item = ItemSystem.create_item(item_type)
-    player.items.append(item)
-    
-    # 记录玩家已购买的道具类型
-    if game_id in game_system.player_item_types and player.id in game_system.player_item_types[game_id]:
-        game_system.player_item_types[game_id][player.id].add(item_type.value)
-    
-    # 记录动作
-    action = GameAction(
-        player_id=player.id,
-        action_type="buy_item",
-        amount=cost,
-        item_type=item_type,
-        description=f"玩家 {player.name} 花费 {cost} 代币购买了道具: {item_type.value}，当前余额: {player.balance}",
-        timestamp=datetime.now()
-    )
+    # 从尚未拥有且买得起的类型中抽取一个新道具，资金经由账本流入奖池
+    action = game_system.buy_item(game_state, player)
+    if action is None:
+        print(f"【错误】玩家没有可购买的道具类型: 游戏ID={game_id}, 玩家ID={player_id}")
+        raise HTTPException(status_code=400, detail="No affordable item type left for player")
     
     # 广播动作
-    await connection_manager.broadcast_game_action(game_id, action)
+    await publish_action(game_id, action)
+    recovery_manager.snapshot(game_id)
     
-    print(f"【调试】玩家成功购买道具: 游戏ID={game_id}, 玩家ID={request.player_id}, 道具={item_type.value}")
+    print(f"【调试】玩家成功购买道具: 游戏ID={game_id}, 玩家ID={player_id}, 道具={action.item_type.value}")
     
     return {
         "success": True,
-        "item_type": item_type.value,
+        "item_type": action.item_type.value,
         "player_balance": player.balance,
         "player_items": [{"type": item.type.value, "used": item.used} for item in player.items],
         "prize_pool": game_state.prize_pool
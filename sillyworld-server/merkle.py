@@ -0,0 +1,126 @@
+"""游戏事件日志的增量Merkle承诺
+
+树的结构和哈希规则与 RFC 6962（证书透明度）相同：叶子哈希为 SHA256(0x00 || 数据)，
+内部节点为 SHA256(0x01 || 左 || 右)，树大小不是2的幂时在不超过它的最大2的幂处切分。
+
+每追加一片叶子只合并新形成的完整子树（均摊O(1)次哈希），任意时刻都可以在O(log n)内
+得到根哈希，游戏结束时无需一次性哈希整局日志。由于树只追加，
+也可以对历史上任一树大小（如写入GameResult时的大小）生成包含证明。
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+
+def leaf_hash(data: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + data).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def canonical_json(data: Dict[str, Any]) -> bytes:
+    """叶子数据的规范编码：键排序、无多余空白"""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _split(size: int) -> int:
+    """小于size的最大2的幂"""
+    return 1 << ((size - 1).bit_length() - 1)
+
+
+class MerkleAccumulator:
+    """仅追加的Merkle树"""
+
+    def __init__(self):
+        # levels[k][i] 为第i棵大小为2^k的完整子树的哈希，levels[0]为叶子哈希
+        self.levels: List[List[bytes]] = [[]]
+
+    @property
+    def size(self) -> int:
+        return len(self.levels[0])
+
+    def append(self, data: bytes) -> int:
+        """追加一片叶子，返回其下标"""
+        index = self.size
+        node = leaf_hash(data)
+        self.levels[0].append(node)
+        # 新叶子使若干棵同样大小的相邻子树成对，逐层向上合并
+        level, position = 0, index
+        while position % 2 == 1:
+            node = node_hash(self.levels[level][position - 1], node)
+            level += 1
+            position //= 2
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].append(node)
+        return index
+
+    def root(self, size: Optional[int] = None) -> bytes:
+        """树大小为size（默认当前大小）时的根哈希"""
+        size = self.size if size is None else size
+        if size == 0:
+            return hashlib.sha256(b"").digest()
+        return self._subtree(0, size)
+
+    def proof(self, index: int, size: Optional[int] = None) -> List[bytes]:
+        """第index片叶子在大小为size的树中的包含证明（从叶子到根的兄弟节点哈希）
+
+        Raises:
+            ValueError: 下标或树大小超出范围
+        """
+        size = self.size if size is None else size
+        if not 0 <= index < size <= self.size:
+            raise ValueError(f"Invalid proof request: index={index}, size={size}, tree size={self.size}")
+        path = []
+        start, width = 0, size
+        # 自顶向下记录兄弟子树，最后反转为自底向上的顺序
+        while width > 1:
+            k = _split(width)
+            if index < start + k:
+                path.append(self._subtree(start + k, width - k))
+                width = k
+            else:
+                path.append(self._subtree(start, k))
+                start, width = start + k, width - k
+        path.reverse()
+        return path
+
+    def _subtree(self, start: int, width: int) -> bytes:
+        """叶子区间[start, start + width)构成的子树哈希，完整子树直接查表"""
+        if width & (width - 1) == 0 and start % width == 0:
+            return self.levels[width.bit_length() - 1][start // width]
+        k = _split(width)
+        return node_hash(self._subtree(start, k), self._subtree(start + k, width - k))
+
+
+def verify_proof(leaf: bytes, index: int, size: int, proof: List[bytes], root: bytes) -> bool:
+    """验证包含证明（RFC 9162 第2.1.3.2节的算法）
+
+    Args:
+        leaf: 叶子哈希
+        index: 叶子下标
+        size: 生成证明时的树大小
+        proof: 自底向上的兄弟节点哈希
+        root: 期望的根哈希
+    """
+    if index >= size:
+        return False
+    fn, sn = index, size - 1
+    node = leaf
+    for sibling in proof:
+        if sn == 0:
+            return False
+        if fn % 2 == 1 or fn == sn:
+            node = node_hash(sibling, node)
+            if fn % 2 == 0:
+                # 右侧没有兄弟的节点直接上移，跳过这些层
+                while fn % 2 == 0 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            node = node_hash(node, sibling)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and node == root
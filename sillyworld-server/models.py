@@ -28,6 +28,8 @@ class Player(BaseModel):
     items: List[Item] = []
     is_active: bool = True
     last_action_time: Optional[datetime] = None
+    # 人类席位：由玩家通过WebSocket提交决策，截止时间内没有提交时由AI按prompt代为决策
+    is_human: bool = False
 
 class GameState(BaseModel):
     game_id: str
@@ -71,4 +73,7 @@ class GameResult(BaseModel):
     prize_pool: int
     total_rounds: int
     end_time: datetime
-    winner_prompt: str 
\ No newline at end of file
+    winner_prompt: str
+    # 截至游戏结束动作的事件日志Merkle根及其覆盖的事件数
+    log_root: Optional[str] = None
+    log_size: Optional[int] = None
\ No newline at end of file
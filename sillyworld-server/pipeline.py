@@ -0,0 +1,142 @@
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from models import GameState, GameAction
+from game import Game
+
+
+class ActionSink:
+    """阶段流水线的动作接收端"""
+
+    async def on_action(self, game_state: GameState, action: GameAction):
+        """收到一个刚产生的动作"""
+
+    async def on_phase_end(self, game_state: GameState, phase: str, action_count: int):
+        """一个阶段执行完毕"""
+
+
+class RecorderSink(ActionSink):
+    """把动作以及随之发生的状态变更写入事件日志"""
+
+    def __init__(self, game: Game):
+        self.game = game
+
+    async def on_action(self, game_state: GameState, action: GameAction):
+        self.game.record(game_state.game_id, [action])
+
+    async def on_phase_end(self, game_state: GameState, phase: str, action_count: int):
+        # 阶段末尾可能有不伴随动作的状态变更（如阶段切换）
+        self.game.record(game_state.game_id)
+
+
+class BroadcastSink(ActionSink):
+    """通过WebSocket把动作立即推送给观众"""
+
+    def __init__(self, connection_manager):
+        self.connection_manager = connection_manager
+
+    async def on_action(self, game_state: GameState, action: GameAction):
+        await self.connection_manager.broadcast_game_action(game_state.game_id, action)
+
+
+class MetricsSink(ActionSink):
+    """统计各类动作数量，以及各阶段的耗时和首个动作的产出延迟"""
+
+    def __init__(self):
+        self.actions_by_type: Counter = Counter()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        # 游戏ID -> (阶段, 阶段开始时间, 是否已产出动作)
+        self._current: Dict[str, List[Any]] = {}
+
+    def phase_started(self, game_id: str, phase: str):
+        self._current[game_id] = [phase, time.perf_counter(), False]
+
+    async def on_action(self, game_state: GameState, action: GameAction):
+        self.actions_by_type[action.action_type] += 1
+        current = self._current.get(game_state.game_id)
+        if current and not current[2]:
+            current[2] = True
+            stats = self._phase_stats(current[0])
+            stats["first_action_total"] += time.perf_counter() - current[1]
+            stats["first_action_count"] += 1
+
+    async def on_phase_end(self, game_state: GameState, phase: str, action_count: int):
+        current = self._current.pop(game_state.game_id, None)
+        if not current:
+            return
+        elapsed = time.perf_counter() - current[1]
+        stats = self._phase_stats(phase)
+        stats["count"] += 1
+        stats["actions"] += action_count
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        phases = {}
+        for phase, stats in self.phases.items():
+            count = stats["count"] or 1
+            first_count = stats["first_action_count"] or 1
+            phases[phase] = {
+                "count": int(stats["count"]),
+                "actions": int(stats["actions"]),
+                "avg_time": round(stats["total_time"] / count, 4),
+                "max_time": round(stats["max_time"], 4),
+                "avg_first_action_latency": round(stats["first_action_total"] / first_count, 4),
+            }
+        return {"actions_by_type": dict(self.actions_by_type), "phases": phases}
+
+    def _phase_stats(self, phase: str) -> Dict[str, float]:
+        if phase not in self.phases:
+            self.phases[phase] = {
+                "count": 0, "actions": 0, "total_time": 0.0, "max_time": 0.0,
+                "first_action_total": 0.0, "first_action_count": 0,
+            }
+        return self.phases[phase]
+
+
+class PhasePipeline:
+    """单一的阶段流水线
+
+    Game.stream_phase 每产生一个动作，就按顺序交给所有接收端（记录、广播、统计），
+    观众无需等待整个阶段结束即可看到事件。
+    """
+
+    def __init__(self, game: Game, sinks: List[ActionSink], metrics: Optional[MetricsSink] = None):
+        """初始化流水线
+
+        Args:
+            game: 游戏系统实例
+            sinks: 动作接收端，按顺序调用
+            metrics: 可选的统计接收端（追加在其他接收端之后）
+        """
+        self.game = game
+        self.metrics = metrics
+        self.sinks = list(sinks) + ([metrics] if metrics else [])
+
+    async def emit(self, game_id: str, action: GameAction):
+        """把流水线之外产生的单个动作（如回合开始公告）交给所有接收端"""
+        game_state = self.game.games.get(game_id)
+        if not game_state:
+            return
+        for sink in self.sinks:
+            await sink.on_action(game_state, action)
+
+    async def run_phase(self, game_id: str, phase: str) -> int:
+        """执行一个阶段并实时分发其动作，返回动作数量"""
+        game_state = self.game.games.get(game_id)
+        if not game_state:
+            return 0
+        if self.metrics:
+            self.metrics.phase_started(game_id, phase)
+
+        count = 0
+        async for action in self.game.stream_phase(game_id, phase):
+            count += 1
+            for sink in self.sinks:
+                await sink.on_action(game_state, action)
+            print(f"【调试/Pipeline】{phase} 动作: {action.action_type} - {action.description}")
+
+        for sink in self.sinks:
+            await sink.on_phase_end(game_state, phase, count)
+        return count
@@ -0,0 +1,156 @@
+"""按受众投影广播内容
+
+同一条广播对不同受众可见的内容不同：
+- 本人(owner): 自己的完整信息（策略prompt、道具类型、思考过程）；
+- 对手(opponent): 其他玩家的公开信息，与观众相同；
+- 观众(spectator): 只有公开信息；
+- 管理员(admin): 全部信息。
+
+每个连接有一个视图: "admin"、"player:<玩家ID>"（游戏中的玩家）或 "public"（观众及其他连接）。
+玩家视图需要该席位的令牌（seat_token，创建游戏时返回给创建者），只知道玩家ID得不到本人视图。
+广播消息带一个受众标记，决定哪些视图的连接收到它：
+- "all": 所有连接；
+- "public" / "admin" / "player:<ID>": 只有该视图的连接（用于状态，每个视图有自己的版本序列）；
+- "owner:<ID>": 管理员和该玩家（私密动作的完整内容）；
+- "others:<ID>[,<ID>...]": 除管理员和这些玩家之外的连接（私密动作的公开内容）。
+每个投影只计算和编码一次，由所有匹配的连接共享。
+
+HTTP接口返回的历史状态、事件日志和代币账本分录同样按请求的视图投影（project_state / project_event / project_ledger_entry）。
+"""
+import hashlib
+import hmac
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from ledger import HOUSE, POOL
+from models import GameAction
+
+PUBLIC_VIEW = "public"
+ADMIN_VIEW = "admin"
+
+# 只对本人可见的动作字段
+PRIVATE_ACTION_FIELDS = {
+    "ai_thinking": ("thinking_process",),
+    "buy_item": ("item_type",),
+}
+
+# 金额只对本人可见的账本分录原因（道具价格各不相同，购买金额会暴露道具类型）
+PRIVATE_LEDGER_REASONS = {"buy_item"}
+
+
+def player_view(player_id: str) -> str:
+    return f"player:{player_id}"
+
+
+def seat_token(secret: str, game_id: str, player_id: str) -> str:
+    """玩家席位的令牌，由服务端密钥派生（不需要保存，重启后只要密钥不变仍然有效）"""
+    return hmac.new(secret.encode(), f"{game_id}:{player_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def verify_seat_token(secret: str, game_id: str, player_id: str, token: Optional[str]) -> bool:
+    """令牌是否属于该游戏的该席位"""
+    return token is not None and hmac.compare_digest(token, seat_token(secret, game_id, player_id))
+
+
+def connection_view(player_id: Optional[str], player_ids: Iterable[str], is_admin: bool = False,
+                    seat_verified: bool = False) -> str:
+    """连接的视图：管理员、出示了席位令牌的游戏玩家，或公开视图"""
+    if is_admin:
+        return ADMIN_VIEW
+    if player_id is not None and seat_verified and player_id in player_ids:
+        return player_view(player_id)
+    return PUBLIC_VIEW
+
+
+def audience_filter(audience: str) -> Optional[Callable[[str], bool]]:
+    """受众对应的视图判断函数，所有连接都属于受众时返回None（每条消息只解析一次受众）"""
+    if audience == "all":
+        return None
+    if audience.startswith("owner:"):
+        owner_view = player_view(audience[len("owner:"):])
+        return lambda view: view == ADMIN_VIEW or view == owner_view
+    if audience.startswith("others:"):
+        excluded = {ADMIN_VIEW} | {player_view(owner) for owner in audience[len("others:"):].split(",")}
+        return lambda view: view not in excluded
+    return lambda view: view == audience
+
+
+def matches(view: str, audience: str) -> bool:
+    """该视图的连接是否属于受众"""
+    accept = audience_filter(audience)
+    return accept is None or accept(view)
+
+
+def is_private(action: GameAction) -> bool:
+    """动作是否带有只对本人可见的内容"""
+    return any(getattr(action, field) is not None for field in PRIVATE_ACTION_FIELDS.get(action.action_type, ()))
+
+
+def redact_action(action: GameAction) -> GameAction:
+    """动作的公开投影"""
+    return action.model_copy(update={field: None for field in PRIVATE_ACTION_FIELDS.get(action.action_type, ())})
+
+
+def _view_owner(view: str) -> Optional[str]:
+    return view[len("player:"):] if view.startswith("player:") else None
+
+
+def _project_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    # 已使用的道具已经公开
+    return item if item.get("used") else {**item, "type": None}
+
+
+def _project_player(player: Dict[str, Any], owner: Optional[str]) -> Dict[str, Any]:
+    if player["id"] == owner:
+        return player
+    public = {key: value for key, value in player.items() if key != "prompt"}
+    public["items"] = [_project_item(item) for item in player["items"]]
+    return public
+
+
+def project_state(state: Dict[str, Any], view: str) -> Dict[str, Any]:
+    """状态（JSON形式）在视图下的投影，不修改原状态
+
+    非本人的玩家去掉策略prompt，未使用的道具隐藏类型（已使用的道具已经公开）。
+    """
+    if view == ADMIN_VIEW:
+        return state
+    owner = _view_owner(view)
+    return {**state, "players": [_project_player(player, owner) for player in state["players"]]}
+
+
+def project_event(event: Dict[str, Any], view: str) -> Dict[str, Any]:
+    """事件日志中的事件（JSON形式）在视图下的投影，不修改原事件；没有需要隐藏的内容时返回原事件
+
+    动作去掉非本人的私密字段，快照按 project_state 投影，新加入的玩家和道具隐藏prompt和未使用道具的类型。
+    """
+    if view == ADMIN_VIEW:
+        return event
+    owner = _view_owner(view)
+    event_type, data = event["event_type"], event["data"]
+    if event_type == "action":
+        fields = PRIVATE_ACTION_FIELDS.get(data.get("action_type"), ())
+        if data.get("player_id") == owner or all(data.get(field) is None for field in fields):
+            return event
+        data = {**data, **{field: None for field in fields}}
+    elif event_type == "snapshot":
+        data = {**data, "state": project_state(data["state"], view)}
+    elif event_type == "player_added" and data["player"]["id"] != owner:
+        data = {**data, "player": _project_player(data["player"], owner)}
+    elif event_type == "item_added" and data["player_id"] != owner and not data["item"].get("used"):
+        data = {**data, "item": _project_item(data["item"])}
+    else:
+        return event
+    return {**event, "data": data}
+
+
+def project_ledger_entry(entry: Dict[str, Any], view: str) -> Dict[str, Any]:
+    """账本分录（JSON形式）在视图下的投影，不修改原分录
+
+    私密分录只对管理员和涉及的玩家显示金额，其他视图保留涉及的账户但金额为None。
+    """
+    if view == ADMIN_VIEW or entry["reason"] not in PRIVATE_LEDGER_REASONS:
+        return entry
+    owner = _view_owner(view)
+    if owner is not None and owner in entry["legs"] and owner not in (POOL, HOUSE):
+        return entry
+    return {**entry, "legs": {account: None for account in entry["legs"]}}
@@ -0,0 +1,282 @@
+"""游戏事件的发布/订阅总线
+
+多个工作进程部署时，游戏在持有它的分片进程中运行，而观众的WebSocket可能连到任意进程。
+ConnectionManager 把编码后的消息发布到总线，每个进程订阅总线并投递给本进程的连接。
+
+- MemoryPubSub: 单进程，发布即投递；
+- UnixSocketPubSub: 本机多进程，通过Unix域套接字互联。持有锁文件的进程作为中转并监听套接字，
+  其他进程连接到它；中转进程退出后锁自动释放，其余进程重新选出新的中转。
+
+每条消息带发布时间（墙钟时间，同一台机器上的进程可比较），订阅端统计发布到投递的延迟。
+"""
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+# 订阅回调: (game_id, 消息类型, 编码后的消息, 受众, 是否来自其他进程)，受众见 projection.py
+Subscriber = Callable[[str, str, str, str, bool], None]
+
+# 单行消息的长度上限（完整游戏状态可能有几十KB）
+MAX_LINE = 16 * 1024 * 1024
+
+
+class PubSub:
+    """发布/订阅总线"""
+
+    # 是否连接了其他进程：是时即使本进程没有连接也要发布
+    shared = False
+
+    def __init__(self, latency_samples: int = 1000):
+        self.node_id = uuid.uuid4().hex[:12]
+        self._subscribers: List[Subscriber] = []
+        self.published = 0
+        self.delivered = 0
+        # 最近若干条其他进程消息的发布到投递延迟(秒)
+        self._latencies: Deque[float] = deque(maxlen=max(1, latency_samples))
+
+    def subscribe(self, callback: Subscriber):
+        self._subscribers.append(callback)
+
+    def publish(self, game_id: str, message_type: str, message: str, audience: str = "all"):
+        """发布一条编码后的消息（本进程的订阅者立即收到）"""
+        raise NotImplementedError
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def _deliver(self, game_id: str, message_type: str, message: str, audience: str, remote: bool,
+                 published_at: float):
+        if remote:
+            self._latencies.append(max(0.0, time.time() - published_at))
+        self.delivered += 1
+        for callback in self._subscribers:
+            try:
+                callback(game_id, message_type, message, audience, remote)
+            except Exception as e:
+                print(f"【错误/PubSub】订阅者处理消息时出错: 游戏ID={game_id}, 类型={message_type}, 错误={e}")
+
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+
+        return {
+            "backend": type(self).__name__,
+            "node_id": self.node_id,
+            "published": self.published,
+            "delivered": self.delivered,
+            # 其他进程发布的消息的延迟(毫秒)
+            "latency_ms": {
+                "samples": len(samples),
+                "avg": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+                "p50": percentile(0.5),
+                "p99": percentile(0.99),
+                "max": round(samples[-1] * 1000, 3) if samples else 0.0,
+            },
+        }
+
+
+class MemoryPubSub(PubSub):
+    """单进程总线"""
+
+    def publish(self, game_id: str, message_type: str, message: str, audience: str = "all"):
+        self.published += 1
+        self._deliver(game_id, message_type, message, audience, False, time.time())
+
+
+class UnixSocketPubSub(PubSub):
+    """本机多进程总线
+
+    每条消息一行：JSON头 [来源节点, game_id, 消息类型, 受众, 发布时间]，制表符，编码后的消息。
+    编码后的JSON消息中不含换行和制表符。
+    """
+
+    shared = True
+
+    def __init__(self, path: str = "/tmp/sillyworld-pubsub.sock", reconnect_delay: float = 0.5,
+                 max_buffer: int = 10000, latency_samples: int = 1000):
+        """初始化总线
+
+        Args:
+            path: Unix域套接字文件路径
+            reconnect_delay: 与中转进程断开后重新连接或选举的间隔(秒)
+            max_buffer: 每个对端未写出数据的上限(KB)，超过时断开该对端
+        """
+        super().__init__(latency_samples)
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.max_buffer = max_buffer * 1024
+        self.is_broker = False
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lock_fd: Optional[int] = None
+        # 中转进程: 所有已连接的对端；普通进程: 只有中转进程
+        self._peers: List[asyncio.StreamWriter] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.dropped_peers = 0
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_all()
+
+    def publish(self, game_id: str, message_type: str, message: str, audience: str = "all"):
+        self.published += 1
+        published_at = time.time()
+        self._deliver(game_id, message_type, message, audience, False, published_at)
+        line = self._frame(self.node_id, game_id, message_type, audience, published_at, message)
+        for writer in list(self._peers):
+            self._write(writer, line)
+
+    @staticmethod
+    def _frame(origin: str, game_id: str, message_type: str, audience: str, published_at: float,
+               message: str) -> bytes:
+        head = json.dumps([origin, game_id, message_type, audience, published_at], separators=(",", ":"))
+        return f"{head}\t{message}\n".encode("utf-8")
+
+    def _write(self, writer: asyncio.StreamWriter, data: bytes):
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > self.max_buffer:
+            # 对端读取过慢，断开它（它会重新连接）
+            print("【警告/PubSub】对端读取过慢，断开连接")
+            self.dropped_peers += 1
+            writer.close()
+            return
+        writer.write(data)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if await self._become_broker():
+                    # 作为中转进程一直运行到停止
+                    await asyncio.Event().wait()
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            print(f"【调试/PubSub】已连接到中转进程: {self.path}")
+            self._peers = [writer]
+            await self._read_loop(reader, writer, relay=False)
+            self._peers = []
+            if not self._stopping:
+                print("【警告/PubSub】与中转进程断开，准备重新连接")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _become_broker(self) -> bool:
+        # 锁由中转进程持有，进程退出时由操作系统释放
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # 另一个进程是中转（或正在启动）
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        # 持有锁时残留的套接字文件一定属于已退出的中转进程
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        try:
+            self._server = await asyncio.start_unix_server(self._on_peer, path=self.path, limit=MAX_LINE)
+        except OSError as e:
+            print(f"【错误/PubSub】监听套接字失败: {self.path}, 错误={e}")
+            self._release_lock()
+            return False
+        self.is_broker = True
+        print(f"【调试/PubSub】作为中转进程监听: {self.path}")
+        return True
+
+    async def _on_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.append(writer)
+        try:
+            await self._read_loop(reader, writer, relay=True)
+        finally:
+            if writer in self._peers:
+                self._peers.remove(writer)
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, relay: bool):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                head, _, message = line.decode("utf-8").rstrip("\n").partition("\t")
+                origin, game_id, message_type, audience, published_at = json.loads(head)
+                if origin == self.node_id:
+                    continue
+                if relay:
+                    # 中转给其他对端（不回发给来源）
+                    for peer in list(self._peers):
+                        if peer is not writer:
+                            self._write(peer, line)
+                self._deliver(game_id, message_type, message, audience, True, published_at)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"【错误/PubSub】读取总线消息时出错: {e}")
+        finally:
+            writer.close()
+
+    async def _close_all(self):
+        for writer in list(self._peers):
+            writer.close()
+        self._peers = []
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self._release_lock()
+        self.is_broker = False
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({
+            "path": self.path,
+            "is_broker": self.is_broker,
+            "peers": len(self._peers),
+            "dropped_peers": self.dropped_peers,
+        })
+        return stats
+
+
+def create_pubsub(kind: str = "memory", **kwargs) -> PubSub:
+    """按名称创建总线：memory(单进程) / unix(本机多进程，Unix域套接字)"""
+    if kind == "memory":
+        return MemoryPubSub(**kwargs)
+    if kind == "unix":
+        return UnixSocketPubSub(**kwargs)
+    raise ValueError(f"Unknown pubsub backend: {kind}")
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from models import GameState, ItemType
+from game import Game
+from ledger import TokenLedger
+
+# 一个回合内可提交的步骤，顺序即执行顺序
+ROUND_STEPS = [
+    "round_start",
+    "item_phase",
+    "persuasion_phase",
+    "settlement_phase",
+    "statistics_phase",
+    "round_end",
+]
+# 不再需要恢复的游戏状态
+FINISHED_STATUSES = ("completed", "cancelled")
+
+
+class RecoveryManager:
+    """运行中游戏的崩溃恢复管理器
+
+    回合循环提交一个步骤时（在游戏actor的命令中，步骤已完整执行）抓取游戏的运行时状态
+    （GameState + Game中的道具跟踪器、代币账本分录和结算账本 + 最近提交的步骤）的副本，
+    后台任务定期把新抓取的副本写入挂载卷。已结束或取消的游戏在写入时删除快照。
+    写入的总是某个步骤边界上的状态，恢复后重新执行下一步骤不会重复执行到一半的阶段。
+    写入采用临时文件+原子替换，进程在任意时刻被杀死都不会留下损坏的快照。
+    """
+
+    def __init__(self, game_system: Game, snapshot_dir: str = "game_records/recovery", interval: float = 1.0):
+        """初始化恢复管理器
+
+        Args:
+            game_system: 游戏系统实例
+            snapshot_dir: 快照目录（应位于挂载卷上）
+            interval: 后台写入间隔(秒)
+        """
+        self.game_system = game_system
+        self.snapshot_dir = Path(snapshot_dir)
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+
+        # 回合循环最近提交的步骤
+        self.committed_steps: Dict[str, str] = {}
+        # 提交时抓取、尚未写入的快照
+        self._captured: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def checkpoint(self, game_id: str, step: Optional[str]):
+        """记录回合循环已完成的步骤并抓取此刻的状态，下一次写入时生效
+
+        必须在修改游戏状态的命令中调用（此时没有执行到一半的阶段）。
+        """
+        self.committed_steps[game_id] = step
+        self.snapshot(game_id)
+
+    def snapshot(self, game_id: str):
+        """抓取游戏在两个步骤之间的状态（如准备阶段的购买），最近提交的步骤不变"""
+        snapshot = self.capture(game_id)
+        if snapshot is not None:
+            self._captured[game_id] = snapshot
+
+    def capture(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """抓取一局游戏的运行时状态（JSON安全）"""
+        game_state = self.game_system.games.get(game_id)
+        if not game_state:
+            return None
+        gs = self.game_system
+        ledger = gs.ledgers.get(game_id)
+        return {
+            "game_state": game_state.model_dump(mode="json"),
+            "player_item_types": {pid: sorted(types) for pid, types in gs.player_item_types.get(game_id, {}).items()},
+            "round_item_usage": dict(gs.round_item_usage.get(game_id, {})),
+            "game_preparation": gs.game_preparation.get(game_id, False),
+            "item_effects": {
+                item_type.value: dict(marks) for item_type, marks in gs.item_effects.get(game_id, {}).items()
+            },
+            # 分录写入后不再修改，只复制列表
+            "ledger_entries": [entry.to_dict() for entry in ledger.entries] if ledger else None,
+            "settlement_ledgers": list(gs.settlement_ledgers.get(game_id, [])),
+            "committed_step": self.committed_steps.get(game_id),
+            "event_seq": gs.event_log.last_seq(game_id),
+            "saved_at": gs.clock.now().isoformat(),
+        }
+
+    async def flush(self) -> int:
+        """写入提交后抓取的快照，返回写入的数量"""
+        written = 0
+        captured, self._captured = self._captured, {}
+        for game_id, snapshot in captured.items():
+            path = self.snapshot_dir / f"{game_id}.json"
+            game_state = self.game_system.games.get(game_id)
+            # 已结束、已取消或已从游戏系统中移除的游戏无需恢复
+            if (game_state is None or game_state.status in FINISHED_STATUSES
+                    or snapshot["game_state"]["status"] in FINISHED_STATUSES):
+                if path.exists():
+                    path.unlink()
+                self.committed_steps.pop(game_id, None)
+                continue
+            data = json.dumps(snapshot, ensure_ascii=False)
+            await asyncio.to_thread(self._atomic_write, path, data)
+            written += 1
+        return written
+
+    def restore(self, owns: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, Optional[str]]]:
+        """从快照目录恢复所有未完成的游戏
+
+        Args:
+            owns: 判断游戏是否归本进程持有（分片模式），为None时恢复全部
+
+        Returns:
+            List[Tuple[str, Optional[str]]]: 需要继续运行的 (游戏ID, 最近提交的步骤)
+        """
+        resumable = []
+        for path in sorted(self.snapshot_dir.glob("*.json")):
+            if owns and not owns(path.stem):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                game_state = GameState(**snapshot["game_state"])
+            except Exception as e:
+                print(f"【错误/Recovery】无法读取快照 {path.name}: {e}")
+                continue
+            if game_state.status in FINISHED_STATUSES:
+                # 结束后还没来得及删除的快照
+                print(f"【调试/Recovery】删除已结束游戏的快照: {path.name}")
+                path.unlink()
+                continue
+
+            game_id = game_state.game_id
+            gs = self.game_system
+            gs.games[game_id] = game_state
+            gs.player_item_types[game_id] = {pid: set(types) for pid, types in snapshot["player_item_types"].items()}
+            gs.round_item_usage[game_id] = dict(snapshot["round_item_usage"])
+            gs.game_preparation[game_id] = snapshot["game_preparation"]
+            gs.item_effects[game_id] = {
+                ItemType(value): dict(marks) for value, marks in snapshot["item_effects"].items()
+            }
+            if snapshot.get("ledger_entries") is not None:
+                gs.ledgers[game_id] = TokenLedger.restore(game_state, snapshot["ledger_entries"])
+            gs.settlement_ledgers[game_id] = list(snapshot.get("settlement_ledgers", []))
+            gs.event_log.restore(game_state)
+
+            step = snapshot.get("committed_step")
+            if step:
+                self.committed_steps[game_id] = step
+            print(f"【调试/Recovery】已恢复游戏: 游戏ID={game_id}, 状态={game_state.status}, 回合={game_state.current_round}, 最近提交步骤={step}")
+            if game_state.status in ("preparation", "active"):
+                resumable.append((game_id, step))
+        return resumable
+
+    def start(self):
+        """启动后台定期写入任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并做最后一次写入"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"【错误/Recovery】写入快照失败: {e}")
+
+    @staticmethod
+    def _atomic_write(path: Path, data: str):
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def next_step(committed_step: Optional[str]) -> str:
+    """根据最近提交的步骤返回恢复后应执行的第一个步骤"""
+    if committed_step is None or committed_step == ROUND_STEPS[-1]:
+        return ROUND_STEPS[0]
+    return ROUND_STEPS[ROUND_STEPS.index(committed_step) + 1]
@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import itertools
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from recovery import ROUND_STEPS, next_step
+
+# 单回合执行函数: (游戏ID, 起始步骤) -> 游戏是否继续
+RoundRunner = Callable[[str, str], Awaitable[bool]]
+# 放弃游戏时的清理函数: (游戏ID) -> None
+FailureHandler = Callable[[str], Awaitable[None]]
+
+
+class ScheduledGame:
+    """调度器中一局游戏的回合循环记录"""
+
+    def __init__(self, game_id: str, start_step: str, due_at: float):
+        self.game_id = game_id
+        self.next_step = start_step
+        self.due_at = due_at
+        self.state = "waiting"  # waiting / running / failed
+        self.rounds = 0
+        self.failures = 0
+        # 最近一次取得进展（开始回合或提交步骤）的时间
+        self.last_progress = due_at
+        self.committed_step: Optional[str] = None
+        # 每次重新入队时递增，用于使堆中的旧条目失效
+        self.generation = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class RoundScheduler:
+    """统一管理所有游戏回合循环的调度器
+
+    每局游戏在最小堆中只有一个"下一回合到期时间"。单个分发任务按到期顺序取出游戏，
+    在并发上限内执行一个回合，回合结束后以 round_interval 的间隔重新入队，
+    因此同时运行的上千局游戏按到期先后轮流获得CPU和LLM，不会出现某局游戏长期占用。
+    """
+
+    def __init__(self, run_round: RoundRunner, round_interval: float = 3.0, max_concurrent: int = 32,
+                 stall_timeout: float = 120.0, retry_delay: float = 5.0, max_failures: int = 3,
+                 on_failed: Optional[FailureHandler] = None):
+        """初始化调度器
+
+        Args:
+            run_round: 执行一个回合的协程函数，返回游戏是否继续
+            round_interval: 两个回合之间的间隔(秒)
+            max_concurrent: 同时执行的回合数上限
+            stall_timeout: 超过该时间(秒)没有进展的游戏视为停滞
+            retry_delay: 回合出错后重试的延迟(秒)
+            max_failures: 连续出错多少次后放弃该游戏
+            on_failed: 放弃游戏后调用，释放游戏占用的资源（与正常结束时相同的清理）
+        """
+        self.run_round = run_round
+        self.round_interval = round_interval
+        self.max_concurrent = max(1, max_concurrent)
+        self.stall_timeout = stall_timeout
+        self.retry_delay = retry_delay
+        self.max_failures = max_failures
+        self.on_failed = on_failed
+
+        self._games: Dict[str, ScheduledGame] = {}
+        # 属于某局游戏的其他后台任务（如准备阶段），可能在游戏加入调度之前登记，因此单独保存
+        self._extra_tasks: Dict[str, List[asyncio.Task]] = {}
+        # 堆条目: (到期时间, 序号, 游戏ID, generation)
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    # ---- 调度接口 ----
+
+    def schedule(self, game_id: str, start_step: str = ROUND_STEPS[0], delay: float = 0.0):
+        """安排一局游戏的回合循环，已在调度中的游戏只更新其下一步骤和到期时间"""
+        due_at = self._now() + delay
+        entry = self._games.get(game_id)
+        if entry is None:
+            entry = self._games[game_id] = ScheduledGame(game_id, start_step, due_at)
+            print(f"【调试/Scheduler】游戏加入调度: 游戏ID={game_id}, 起始步骤={start_step}, 延迟={delay}秒")
+        elif entry.state == "running":
+            print(f"【警告/Scheduler】游戏回合正在执行，忽略重复调度: 游戏ID={game_id}")
+            return
+        entry.next_step = start_step
+        entry.state = "waiting"
+        self._push(entry, due_at)
+
+    def track(self, game_id: str, task: asyncio.Task):
+        """登记属于某局游戏的其他后台任务，使其可以随游戏一起被取消"""
+        tasks = self._extra_tasks.setdefault(game_id, [])
+        tasks[:] = [t for t in tasks if not t.done()]
+        tasks.append(task)
+
+    def cancel(self, game_id: str) -> bool:
+        """取消一局游戏的回合循环（包括正在执行的回合和已登记的后台任务）"""
+        entry = self._games.pop(game_id, None)
+        tasks = self._extra_tasks.pop(game_id, [])
+        if entry and entry.task and not entry.task.done():
+            tasks.append(entry.task)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        if entry or tasks:
+            print(f"【调试/Scheduler】已取消游戏回合循环: 游戏ID={game_id}")
+            return True
+        return False
+
+    def checkpoint(self, game_id: str, step: str):
+        """回合循环提交了一个步骤，记录进展（出错重试时从下一步骤继续）"""
+        entry = self._games.get(game_id)
+        if entry:
+            entry.committed_step = step
+            entry.last_progress = self._now()
+
+    def is_scheduled(self, game_id: str) -> bool:
+        return game_id in self._games
+
+    # ---- 查询 ----
+
+    def games(self) -> List[Dict[str, Any]]:
+        """列出所有处于调度中的游戏"""
+        now = self._now()
+        return [self._describe(entry, now) for entry in self._games.values()]
+
+    def stalled(self) -> List[Dict[str, Any]]:
+        """列出停滞的游戏：执行中但长时间没有提交步骤、到期后长时间未被执行，或已放弃"""
+        now = self._now()
+        result = []
+        for entry in self._games.values():
+            if entry.state == "failed":
+                result.append(self._describe(entry, now))
+            elif entry.state == "running" and now - entry.last_progress > self.stall_timeout:
+                result.append(self._describe(entry, now))
+            elif entry.state == "waiting" and now - entry.due_at > self.stall_timeout:
+                result.append(self._describe(entry, now))
+        return result
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        """启动分发任务（需在事件循环中调用）"""
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        """停止分发并取消所有正在执行的回合（崩溃恢复会从最近提交的步骤继续）"""
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        running = [entry.task for entry in self._games.values() if entry.task and not entry.task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    # ---- 内部实现 ----
+
+    def _now(self) -> float:
+        return asyncio.get_event_loop().time()
+
+    def _push(self, entry: ScheduledGame, due_at: float):
+        entry.generation += 1
+        entry.due_at = due_at
+        heapq.heappush(self._heap, (due_at, next(self._counter), entry.game_id, entry.generation))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _describe(self, entry: ScheduledGame, now: float) -> Dict[str, Any]:
+        return {
+            "game_id": entry.game_id,
+            "state": entry.state,
+            "next_step": entry.next_step,
+            "committed_step": entry.committed_step,
+            "rounds": entry.rounds,
+            "failures": entry.failures,
+            "due_in": round(entry.due_at - now, 3),
+            "idle_for": round(now - entry.last_progress, 3),
+        }
+
+    async def _dispatch(self):
+        while True:
+            # 清理已失效的堆顶条目
+            while self._heap:
+                _, _, game_id, generation = self._heap[0]
+                entry = self._games.get(game_id)
+                if entry and entry.generation == generation and entry.state == "waiting":
+                    break
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - self._now()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # 并发已满时在此等待，到期的游戏保持在堆中按顺序排队
+            await self._slots.acquire()
+            if not self._heap or self._heap[0][0] > self._now():
+                # 等待期间堆顶发生了变化，重新检查
+                self._slots.release()
+                continue
+            _, _, game_id, generation = heapq.heappop(self._heap)
+            entry = self._games.get(game_id)
+            if not entry or entry.generation != generation or entry.state != "waiting":
+                self._slots.release()
+                continue
+            entry.state = "running"
+            entry.last_progress = self._now()
+            entry.task = asyncio.create_task(self._run_one(entry))
+
+    async def _run_one(self, entry: ScheduledGame):
+        game_id = entry.game_id
+        start_step = entry.next_step
+        entry.committed_step = None
+        try:
+            keep_running = await self.run_round(game_id, start_step)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            entry.failures += 1
+            print(f"【错误/Scheduler】回合执行出错: 游戏ID={game_id}, 第{entry.failures}次, 错误={e}")
+            traceback.print_exc()
+            if self._games.get(game_id) is not entry:
+                return
+            if entry.failures >= self.max_failures:
+                # 保留记录，在停滞列表中可见
+                entry.state = "failed"
+                print(f"【错误/Scheduler】连续出错次数过多，停止调度: 游戏ID={game_id}")
+                self._extra_tasks.pop(game_id, None)
+                if self.on_failed:
+                    try:
+                        await self.on_failed(game_id)
+                    except Exception as cleanup_error:
+                        print(f"【错误/Scheduler】放弃游戏后的清理出错: 游戏ID={game_id}, 错误={cleanup_error}")
+                return
+            # 从最近提交步骤的下一步重试，避免重复执行已完成的阶段
+            resume_step = next_step(entry.committed_step) if entry.committed_step else start_step
+            entry.next_step = resume_step
+            entry.state = "waiting"
+            self._push(entry, self._now() + self.retry_delay)
+            return
+        finally:
+            self._slots.release()
+
+        if self._games.get(game_id) is not entry:
+            return  # 执行期间已被取消
+        entry.rounds += 1
+        entry.failures = 0
+        if not keep_running:
+            self._games.pop(game_id, None)
+            self._extra_tasks.pop(game_id, None)
+            print(f"【调试/Scheduler】游戏回合循环结束: 游戏ID={game_id}, 共执行{entry.rounds}个回合")
+            return
+        entry.next_step = ROUND_STEPS[0]
+        entry.state = "waiting"
+        self._push(entry, self._now() + self.round_interval)
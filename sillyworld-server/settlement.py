@@ -0,0 +1,135 @@
+"""回合结算引擎
+
+结算规则:
+1. 每个已接受且未处理的说服请求产生一笔 付款方(被说服者) -> 收款方(发起者) 的支付，
+   金额先经过付款方生效中的道具修正（如护盾卡减半）。
+2. 同一对玩家之间相反方向的支付互相轧差，只保留一笔净额义务。
+3. 优先级：净额义务按其中最早请求的先后顺序处理；付款方只能使用结算前的余额，
+   本轮收到的资金不计入；余额不足以支付整笔净额时该义务被拒绝。
+   被拒绝的义务中两个方向的请求都保持未处理（包括该付款方作为收款方的反向请求，
+   反向支付不会按总额单独支付），下一回合与新的请求一起重新轧差结算。
+4. 所有余额变动汇总后一次性写回（作为代币账本中的一条分录）。
+5. 涉及已出局玩家的请求无法再结算，直接丢弃（不标记为已处理）。
+
+结算结果中的 pending 即下一回合的待结算索引：调用方只需保存它并与下一回合新的请求一起传入，
+不必保留和扫描全部历史请求。整体复杂度为 O(P + R)，P为玩家数，R为本回合新请求数与待结算请求数之和。
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from models import Player, PersuasionRequest
+from ledger import TokenLedger
+
+# 支付金额修正: (付款方ID, 原始金额) -> 实际金额
+PaymentAdjuster = Callable[[str, int], int]
+
+
+class Obligation:
+    """一对玩家之间轧差后的支付义务"""
+
+    __slots__ = ("payer", "payee", "amount", "gross", "original", "requests")
+
+    def __init__(self, payer: str, payee: str, amount: int, gross: int, original: int,
+                 requests: List[PersuasionRequest]):
+        self.payer = payer
+        self.payee = payee
+        self.amount = amount  # 轧差后的净额
+        self.gross = gross  # 付款方方向修正后的总额
+        self.original = original  # 付款方方向修正前的总额
+        self.requests = requests
+
+
+class SettlementResult:
+    """一次结算的结果"""
+
+    def __init__(self):
+        self.transfers: List[Obligation] = []
+        self.offset: List[Obligation] = []  # 完全抵消、无需转账的义务
+        self.rejected: List[Obligation] = []
+        self.deltas: Dict[str, int] = {}
+        # 仍待结算的请求（被拒绝义务中两个方向的请求），按请求顺序
+        self.pending: List[PersuasionRequest] = []
+
+    def ledger(self) -> Dict[str, Any]:
+        """紧凑账本：[付款方, 收款方, 净额, 请求数]"""
+        return {
+            "transfers": [[o.payer, o.payee, o.amount, len(o.requests)] for o in self.transfers],
+            "offset": [[o.payer, o.payee, len(o.requests)] for o in self.offset],
+            "rejected": [[o.payer, o.payee, o.amount, len(o.requests)] for o in self.rejected],
+            "deltas": dict(self.deltas),
+            "pending": len(self.pending),
+        }
+
+
+def settle(players: List[Player], requests: List[PersuasionRequest],
+           adjust_payment: PaymentAdjuster, ledger: Optional[TokenLedger] = None) -> SettlementResult:
+    """结算一个回合的说服转账，原地更新玩家余额和请求的processed标记
+
+    Args:
+        players: 游戏中的全部玩家
+        requests: 本回合新的说服请求和上一次结算的 pending（只处理已接受且未处理的）
+        adjust_payment: 支付金额修正函数
+        ledger: 代币账本，提供时余额变动作为一条分录写入
+
+    Returns:
+        SettlementResult: 结算结果，pending 为下一回合需要重新结算的请求
+    """
+    active = {p.id: p for p in players if p.is_active}
+
+    # 1. 构建转账矩阵：以无序玩家对为键，分别累计两个方向的金额（字典保持首次出现的顺序）
+    # 值: [低->高 金额, 高->低 金额, 低->高 修正前金额, 高->低 修正前金额, 请求列表]
+    pairs: Dict[Tuple[str, str], List[Any]] = {}
+    for request in requests:
+        if not request.accepted or request.processed:
+            continue
+        payer, payee = request.to_player, request.from_player
+        if payer == payee or payer not in active or payee not in active:
+            continue
+        amount = adjust_payment(payer, request.amount)
+        key = (payer, payee) if payer < payee else (payee, payer)
+        flows = pairs.get(key)
+        if flows is None:
+            flows = pairs[key] = [0, 0, 0, 0, []]
+        direction = 0 if payer == key[0] else 1
+        flows[direction] += amount
+        flows[direction + 2] += request.amount
+        flows[4].append(request)
+
+    # 2. 轧差，并按优先级顺序归入各付款方
+    result = SettlementResult()
+    outgoing: Dict[str, List[Obligation]] = {}
+    for (low, high), (low_out, high_out, low_orig, high_orig, pair_requests) in pairs.items():
+        if low_out >= high_out:
+            obligation = Obligation(low, high, low_out - high_out, low_out, low_orig, pair_requests)
+        else:
+            obligation = Obligation(high, low, high_out - low_out, high_out, high_orig, pair_requests)
+        if obligation.amount == 0:
+            result.offset.append(obligation)
+            continue
+        outgoing.setdefault(obligation.payer, []).append(obligation)
+
+    # 3. 按结算前余额检查支付能力
+    for payer, obligations in outgoing.items():
+        available = active[payer].balance
+        for obligation in obligations:
+            if obligation.amount <= available:
+                available -= obligation.amount
+                result.transfers.append(obligation)
+            else:
+                result.rejected.append(obligation)
+
+    # 4. 汇总余额变动并一次性写回
+    deltas = result.deltas
+    for obligation in result.transfers:
+        deltas[obligation.payer] = deltas.get(obligation.payer, 0) - obligation.amount
+        deltas[obligation.payee] = deltas.get(obligation.payee, 0) + obligation.amount
+    if ledger is not None:
+        ledger.post(deltas, "settlement")
+    else:
+        for player_id, delta in deltas.items():
+            active[player_id].balance += delta
+    for obligation in result.transfers + result.offset:
+        for request in obligation.requests:
+            request.processed = True
+    rejected = {id(request) for obligation in result.rejected for request in obligation.requests}
+    result.pending = [request for request in requests if id(request) in rejected]
+    return result
@@ -0,0 +1,227 @@
+"""多进程分片模式
+
+每局游戏由唯一一个工作进程持有，持有者由 game_id 的稳定哈希决定。
+前端路由进程把HTTP和WebSocket请求转发给持有该游戏的工作进程，
+从而可以使用机器上的全部CPU核心，同时保持单局游戏状态只在一个进程中修改。
+
+用法:
+    python sharding.py --workers 4 --port 8007
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import uuid
+import zlib
+from typing import List
+
+# 转发时需要丢弃的逐跳(hop-by-hop)头
+_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+# 每个工作进程各自统计的全局接口：路由向所有工作进程请求并按分片列出结果
+SHARDED_STATS_PATHS = (
+    "api/admission", "api/scheduler/games", "api/actors", "api/ws/stats",
+    "api/metrics/phases", "api/metrics/inputs", "api/chain", "api/state_store",
+)
+
+
+def shard_for(game_id: str, shard_count: int) -> int:
+    """返回持有该游戏的分片编号（跨进程稳定，不依赖Python的随机化hash）"""
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(game_id.encode("utf-8")) % shard_count
+
+
+def new_game_id(shard_index: int = 0, shard_count: int = 1) -> str:
+    """生成一个归属于指定分片的游戏ID（期望尝试 shard_count 次）"""
+    while True:
+        game_id = str(uuid.uuid4())
+        if shard_for(game_id, shard_count) == shard_index:
+            return game_id
+
+
+def create_router_app(worker_urls: List[str]):
+    """创建前端路由应用，按game_id把请求转发给持有该游戏的工作进程
+
+    Args:
+        worker_urls: 工作进程的HTTP基础地址，下标即分片编号
+    """
+    import httpx
+    import websockets
+    from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+    from fastapi.responses import Response
+
+    app = FastAPI(title="Agent Arena Router")
+    shard_count = len(worker_urls)
+    # 新游戏按轮询分配给工作进程，工作进程生成的ID保证归属于自己
+    create_cycle = itertools.cycle(range(shard_count))
+    client = httpx.AsyncClient(timeout=60.0)
+
+    def owner_url(path: str) -> str:
+        parts = path.strip("/").split("/")
+        # /api/games/{game_id}/... 与 /ws/{game_id}/...
+        if len(parts) >= 3 and parts[0] == "api" and parts[1] == "games":
+            return worker_urls[shard_for(parts[2], shard_count)]
+        if len(parts) >= 2 and parts[0] == "ws":
+            return worker_urls[shard_for(parts[1], shard_count)]
+        return worker_urls[0]
+
+    @app.on_event("shutdown")
+    async def close_client():
+        await client.aclose()
+
+    @app.get("/api/shards")
+    async def list_shards():
+        """列出所有工作进程及其健康状态"""
+        shards = []
+        for index, url in enumerate(worker_urls):
+            try:
+                response = await client.get(f"{url}/", timeout=2.0)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            shards.append({"index": index, "url": url, "healthy": healthy})
+        return {"shard_count": shard_count, "shards": shards}
+
+    async def gather_stats(path: str):
+        """向所有工作进程请求同一个统计接口，结果按分片编号列出"""
+        async def fetch(index: int, url: str):
+            try:
+                response = await client.get(f"{url}/{path}", timeout=5.0)
+                response.raise_for_status()
+                return {"index": index, "stats": response.json()}
+            except (httpx.HTTPError, ValueError) as e:
+                return {"index": index, "error": str(e)}
+
+        shards = await asyncio.gather(*(fetch(index, url) for index, url in enumerate(worker_urls)))
+        return {"shard_count": shard_count, "shards": list(shards)}
+
+    def stats_route(path: str):
+        async def route():
+            return await gather_stats(path)
+        return route
+
+    for stats_path in SHARDED_STATS_PATHS:
+        app.add_api_route(f"/{stats_path}", stats_route(stats_path), methods=["GET"])
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+    async def proxy_http(path: str, request: Request):
+        if request.method == "POST" and path.strip("/") == "api/games":
+            base_url = worker_urls[next(create_cycle)]
+        else:
+            base_url = owner_url(path)
+
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS}
+        try:
+            upstream = await client.request(
+                request.method,
+                f"{base_url}/{path}",
+                params=request.query_params,
+                headers=headers,
+                content=await request.body()
+            )
+        except httpx.HTTPError as e:
+            print(f"【错误/Router】转发请求失败: {request.method} /{path} -> {base_url}: {e}")
+            return Response(status_code=502, content=f"Shard unavailable: {e}")
+
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_HEADERS}
+        return Response(content=upstream.content, status_code=upstream.status_code, headers=response_headers)
+
+    @app.websocket("/ws/{game_id}/{player_id}")
+    async def proxy_websocket(websocket: WebSocket, game_id: str, player_id: str):
+        base_url = worker_urls[shard_for(game_id, shard_count)]
+        upstream_url = base_url.replace("http://", "ws://", 1) + f"/ws/{game_id}/{player_id}"
+        if websocket.url.query:
+            upstream_url += f"?{websocket.url.query}"
+
+        # 客户端提供的子协议原样交给工作进程协商，再用工作进程选中的子协议接受客户端连接
+        subprotocols = websocket.scope.get("subprotocols") or []
+        try:
+            upstream = await websockets.connect(upstream_url, subprotocols=subprotocols or None)
+        except Exception as e:
+            print(f"【错误/Router】无法连接工作进程WebSocket: {upstream_url}: {e}")
+            await websocket.close(code=1011)
+            return
+        await websocket.accept(subprotocol=upstream.subprotocol)
+
+        async def client_to_upstream():
+            try:
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    if message.get("text") is not None:
+                        await upstream.send(message["text"])
+                    elif message.get("bytes") is not None:
+                        await upstream.send(message["bytes"])
+            except WebSocketDisconnect:
+                pass
+
+        async def upstream_to_client():
+            async for message in upstream:
+                if isinstance(message, bytes):
+                    await websocket.send_bytes(message)
+                else:
+                    await websocket.send_text(message)
+
+        tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+            try:
+                await websocket.close()
+            except RuntimeError:
+                pass  # 客户端已断开
+
+    return app
+
+
+def _run_worker(shard_index: int, shard_count: int, port: int):
+    # 必须在导入main之前设置，main在导入时读取分片配置
+    os.environ["SHARD_INDEX"] = str(shard_index)
+    os.environ["SHARD_COUNT"] = str(shard_count)
+    import uvicorn
+    uvicorn.run("main:app", host="127.0.0.1", port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以多进程分片模式运行服务器")
+    parser.add_argument("--workers", type=int, default=0, help="工作进程数，0表示CPU核心数")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--worker-base-port", type=int, default=0, help="工作进程起始端口，默认为 port+1")
+    args = parser.parse_args()
+
+    shard_count = args.workers or os.cpu_count() or 1
+    base_port = args.worker_base_port or args.port + 1
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    worker_urls = []
+    for index in range(shard_count):
+        port = base_port + index
+        process = ctx.Process(target=_run_worker, args=(index, shard_count, port), daemon=True)
+        process.start()
+        workers.append(process)
+        worker_urls.append(f"http://127.0.0.1:{port}")
+        print(f"【调试/Router】已启动工作进程: 分片={index}, 端口={port}, PID={process.pid}")
+
+    import uvicorn
+    try:
+        uvicorn.run(create_router_app(worker_urls), host=args.host, port=args.port)
+    finally:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
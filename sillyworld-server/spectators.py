@@ -0,0 +1,161 @@
+"""观众中心：每局游戏的观众连接分片管理
+
+每个观众连接有自己的会话ID（重连时带上同一个会话ID会替换旧连接），
+观众按固定大小分片，每个分片有自己的分发任务。广播时只需把编码后的消息放入每个分片的队列，
+广播方的开销与分片数成正比而不是与观众数成正比，观众再多也不会拖慢游戏循环。
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from websocket import ClientConnection
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class SpectatorShard:
+    """一组观众连接及其分发任务"""
+
+    def __init__(self, index: int):
+        self.index = index
+        # 会话ID -> (连接, 加入时的发布序号)
+        self.connections: Dict[str, Tuple["ClientConnection", int]] = {}
+        # 队列元素: (发布序号, 消息类型, 编码后的消息, 受众判断函数)
+        self._queue: Deque[Tuple[int, str, str, Optional[Callable[[str], bool]]]] = deque()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.last_fan_out = 0.0
+        self.max_fan_out = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._queue.clear()
+
+    def publish(self, seq: int, message_type: str, message: str, accept: Optional[Callable[[str], bool]] = None):
+        self._queue.append((seq, message_type, message, accept))
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            seq, message_type, message, accept = self._queue.popleft()
+            started = time.perf_counter()
+            for connection, joined in list(self.connections.values()):
+                # 加入之前发布的消息已包含在该连接的补发消息中；只投递给属于受众的视图
+                if seq <= joined or (accept is not None and not accept(connection.view)):
+                    continue
+                if connection.enqueue(message_type, message):
+                    self.delivered += 1
+            self.last_fan_out = time.perf_counter() - started
+            self.max_fan_out = max(self.max_fan_out, self.last_fan_out)
+            # 每个分片分发一条消息后让出事件循环，分片之间交替进行
+            await asyncio.sleep(0)
+
+
+class SpectatorHub:
+    """一局游戏的所有观众"""
+
+    def __init__(self, game_id: str, shard_size: int = 256):
+        self.game_id = game_id
+        self.shard_size = max(1, shard_size)
+        self.shards: Dict[int, SpectatorShard] = {}
+        # 会话ID -> 所在分片
+        self._sessions: Dict[str, SpectatorShard] = {}
+        self.published = 0
+        self.joined = 0
+        self.replaced = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional["ClientConnection"]:
+        shard = self._sessions.get(session_id)
+        return shard.connections[session_id][0] if shard is not None else None
+
+    def add(self, session_id: str, connection: "ClientConnection") -> Optional["ClientConnection"]:
+        """加入观众，返回被替换的同一会话的旧连接"""
+        previous = self.remove(session_id)
+        if previous is not None:
+            self.replaced += 1
+        shard = next((s for s in self.shards.values() if len(s.connections) < self.shard_size), None)
+        if shard is None:
+            index = next(i for i in range(len(self.shards) + 1) if i not in self.shards)
+            shard = self.shards[index] = SpectatorShard(index)
+            shard.start()
+        shard.connections[session_id] = (connection, self.published)
+        self._sessions[session_id] = shard
+        self.joined += 1
+        return previous
+
+    def remove(self, session_id: str, connection: Optional["ClientConnection"] = None) -> Optional["ClientConnection"]:
+        """移除观众；指定connection时只在它仍是该会话的当前连接时移除"""
+        shard = self._sessions.get(session_id)
+        if shard is None:
+            return None
+        current = shard.connections[session_id][0]
+        if connection is not None and current is not connection:
+            return None
+        del shard.connections[session_id]
+        del self._sessions[session_id]
+        if not shard.connections:
+            shard.stop()
+            del self.shards[shard.index]
+        return current
+
+    def publish(self, message_type: str, message: str, accept: Optional[Callable[[str], bool]] = None) -> int:
+        """把消息交给每个分片分发，返回观众数
+
+        Args:
+            accept: 受众的视图判断函数（见 projection.audience_filter），None为所有观众
+        """
+        self.published += 1
+        for shard in self.shards.values():
+            shard.publish(self.published, message_type, message, accept)
+        return len(self._sessions)
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.stop()
+        self.shards.clear()
+        self._sessions.clear()
+
+    def connections(self):
+        for shard in self.shards.values():
+            for connection, _ in shard.connections.values():
+                yield connection
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "spectators": len(self._sessions),
+            "shards": len(self.shards),
+            "shard_size": self.shard_size,
+            "published": self.published,
+            "joined": self.joined,
+            "replaced": self.replaced,
+            "per_shard": [
+                {
+                    "index": shard.index,
+                    "spectators": len(shard.connections),
+                    "pending": len(shard._queue),
+                    "delivered": shard.delivered,
+                    "last_fan_out_ms": round(shard.last_fan_out * 1000, 3),
+                    "max_fan_out_ms": round(shard.max_fan_out * 1000, 3),
+                }
+                for shard in self.shards.values()
+            ],
+        }
@@ -0,0 +1,317 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, MutableMapping, Optional, Set, Tuple
+
+from models import GameState
+from exceptions import VersionConflictError
+
+try:
+    import fcntl  # 仅POSIX可用，用于跨进程文件锁
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+class StateStore:
+    """外部键值状态存储接口，每个键带有单调递增的版本号"""
+
+    def get(self, key: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """读取 (版本号, 值)，键不存在时返回None"""
+        raise NotImplementedError
+
+    def put(self, key: str, value: Dict[str, Any], expected_version: int) -> int:
+        """乐观写入：仅当当前版本等于expected_version(不存在视为0)时写入，返回新版本号
+
+        Raises:
+            VersionConflictError: 当前版本与预期不一致
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def keys(self) -> List[str]:
+        raise NotImplementedError
+
+
+class InMemoryStateStore(StateStore):
+    """进程内存储，用于单进程部署和测试"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        return self._data.get(key)
+
+    def put(self, key: str, value: Dict[str, Any], expected_version: int) -> int:
+        with self._lock:
+            current = self._data.get(key, (0, None))[0]
+            if current != expected_version:
+                raise VersionConflictError(key, expected_version, current)
+            self._data[key] = (current + 1, value)
+            return current + 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self) -> List[str]:
+        return list(self._data)
+
+
+class FileStateStore(StateStore):
+    """基于文件的存储，可供同一台机器上的多个进程共享
+
+    每个键一个JSON文件，写入时持有该键的文件锁并通过原子替换落盘。
+    """
+
+    def __init__(self, root_dir: str = "game_records/state"):
+        self.root = Path(root_dir)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def _read(self, path: Path) -> Optional[Tuple[int, Dict[str, Any]]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        return record["version"], record["value"]
+
+    def get(self, key: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        return self._read(self._path(key))
+
+    def put(self, key: str, value: Dict[str, Any], expected_version: int) -> int:
+        path = self._path(key)
+        with open(self.root / f"{key}.lock", "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                current = self._read(path)
+                current_version = current[0] if current else 0
+                if current_version != expected_version:
+                    raise VersionConflictError(key, expected_version, current_version)
+
+                tmp_path = path.with_suffix(".json.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"version": current_version + 1, "value": value}, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                return current_version + 1
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def delete(self, key: str):
+        for path in (self._path(key), self.root / f"{key}.lock"):
+            if path.exists():
+                path.unlink()
+
+    def keys(self) -> List[str]:
+        return [p.stem for p in self.root.glob("*.json")]
+
+
+def create_state_store(kind: str = "memory", root_dir: str = "game_records/state") -> StateStore:
+    """按名称创建状态存储：memory 或 file"""
+    if kind == "memory":
+        return InMemoryStateStore()
+    if kind == "file":
+        return FileStateStore(root_dir)
+    raise ValueError(f"未知的状态存储类型: {kind}")
+
+
+class GameStateCache(MutableMapping):
+    """Game.games 背后的写回缓存
+
+    本进程创建或恢复的游戏（持有者）常驻内存，由后台任务定期按乐观版本写回存储；
+    不属于本进程的游戏按需从存储读取为只读副本，并在 replica_ttl 秒后过期，
+    因此无状态的API进程也能提供 GET /api/games/{id} 之类的读取。
+    结束的游戏在最后一次写回后被逐出（evict），之后同样以只读副本的方式读取。
+    """
+
+    def __init__(self, store: StateStore, replica_ttl: float = 1.0, max_replicas: int = 1024,
+                 change_marker: Optional[Callable[[str], Any]] = None):
+        """初始化缓存
+
+        Args:
+            store: 底层状态存储
+            replica_ttl: 只读副本的有效期(秒)
+            max_replicas: 最多缓存的只读副本数量
+            change_marker: 返回游戏的变更标记（如事件日志的最新seq），标记不变的游戏不会被序列化；
+                为None时每次写回都序列化后比较内容
+        """
+        self.store = store
+        self.replica_ttl = replica_ttl
+        self.max_replicas = max_replicas
+        self.change_marker = change_marker
+
+        # 本进程持有的游戏
+        self._owned: Dict[str, GameState] = {}
+        # 已写入存储的版本号，以及写入时的变更标记（或内容），用于乐观并发和脏检查
+        self._versions: Dict[str, int] = {}
+        self._written: Dict[str, Any] = {}
+        # 最后一次写回后逐出的游戏
+        self._evicting: Set[str] = set()
+        # 写回时发生版本冲突的游戏：其他进程写入了更新的版本，不再写回，等待处理
+        self.conflicts: Dict[str, VersionConflictError] = {}
+        # 只读副本: 游戏ID -> (读取时间, 状态)
+        self._replicas: "OrderedDict[str, Tuple[float, GameState]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- MutableMapping ----
+
+    def __getitem__(self, key: str) -> GameState:
+        if key in self._owned:
+            return self._owned[key]
+        replica = self._replicas.get(key)
+        if replica and time.monotonic() - replica[0] < self.replica_ttl:
+            return replica[1]
+
+        record = self.store.get(key)
+        if record is None:
+            self._replicas.pop(key, None)
+            raise KeyError(key)
+        game_state = GameState(**record[1])
+        self._replicas[key] = (time.monotonic(), game_state)
+        self._replicas.move_to_end(key)
+        while len(self._replicas) > self.max_replicas:
+            self._replicas.popitem(last=False)
+        return game_state
+
+    def __setitem__(self, key: str, game_state: GameState):
+        # 写入即成为持有者
+        self._replicas.pop(key, None)
+        self._owned[key] = game_state
+        if key not in self._versions:
+            record = self.store.get(key)
+            self._versions[key] = record[0] if record else 0
+
+    def __delitem__(self, key: str):
+        del self._owned[key]
+        self._versions.pop(key, None)
+        self._written.pop(key, None)
+        self._evicting.discard(key)
+        self.conflicts.pop(key, None)
+
+    def __iter__(self) -> Iterator[str]:
+        # 只遍历本进程持有的游戏
+        return iter(list(self._owned))
+
+    def __len__(self) -> int:
+        return len(self._owned)
+
+    def is_owned(self, key: str) -> bool:
+        return key in self._owned
+
+    def evict(self, key: str):
+        """游戏结束后放弃在内存中持有它：最后一次写回成功后逐出，之后按只读副本读取"""
+        if key not in self._owned:
+            return
+        self._evicting.add(key)
+        if key not in self.conflicts and self._written.get(key) == self._marker(key):
+            # 最新内容已经写入
+            del self[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owned": len(self._owned),
+            "replicas": len(self._replicas),
+            "evicting": len(self._evicting),
+            "conflicts": {key: e.detail for key, e in self.conflicts.items()},
+        }
+
+    # ---- 写回 ----
+
+    def flush(self) -> int:
+        """把内容发生变化的持有游戏写回存储，返回写入数量
+
+        Raises:
+            VersionConflictError: 有游戏被其他进程写入了更新的版本（其余游戏照常写入）
+        """
+        return self._apply(self._write(self._collect_dirty()))
+
+    async def flush_async(self) -> int:
+        """与flush相同，但存储IO在线程中执行，不阻塞事件循环"""
+        dirty = self._collect_dirty()
+        if not dirty:
+            return 0
+        return self._apply(await asyncio.to_thread(self._write, dirty))
+
+    def _marker(self, key: str) -> Any:
+        if self.change_marker is not None:
+            return self.change_marker(key)
+        return self._owned[key].model_dump_json()
+
+    def _collect_dirty(self) -> List[Tuple[str, str, int, Any]]:
+        # 在事件循环中序列化，保证写入的是某一时刻的一致状态；变更标记不变的游戏不序列化
+        dirty = []
+        for key, game_state in list(self._owned.items()):
+            if key in self.conflicts:
+                continue
+            marker = self._marker(key)
+            if self._written.get(key) == marker:
+                continue
+            payload = marker if self.change_marker is None else game_state.model_dump_json()
+            dirty.append((key, payload, self._versions.get(key, 0), marker))
+        return dirty
+
+    def _write(self, dirty: List[Tuple[str, str, int, Any]]) -> List[Tuple[str, Any, Any]]:
+        results = []
+        for key, payload, expected_version, marker in dirty:
+            try:
+                results.append((key, marker, self.store.put(key, json.loads(payload), expected_version)))
+            except VersionConflictError as e:
+                results.append((key, marker, e))
+        return results
+
+    def _apply(self, results: List[Tuple[str, Any, Any]]) -> int:
+        written = 0
+        conflict = None
+        for key, marker, version in results:
+            if key not in self._owned:
+                continue
+            if isinstance(version, VersionConflictError):
+                # 其他进程已经写入了更新的版本：保留持有（游戏仍在本进程运行），停止写回以免覆盖，交由调用方处理
+                print(f"【错误/StateStore】写回游戏 {key} 时版本冲突，停止写回: {version.detail}")
+                self.conflicts[key] = conflict = version
+                continue
+            self._versions[key] = version
+            self._written[key] = marker
+            written += 1
+            if key in self._evicting:
+                del self[key]
+        if conflict is not None:
+            raise conflict
+        return written
+
+    def start(self, interval: float = 0.5):
+        """启动后台写回任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            self.flush()
+        except VersionConflictError:
+            pass  # 冲突已记录在 conflicts 中
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush_async()
+            except Exception as e:
+                print(f"【错误/StateStore】写回失败: {e}")
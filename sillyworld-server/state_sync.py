@@ -0,0 +1,228 @@
+"""带版本号的游戏状态增量同步
+
+每次广播游戏状态时，服务端为该局游戏生成一个单调递增的版本号(seq)，
+并只发送与上一版本的差异；客户端应用差异后用校验和核对，发现缺失版本或校验和不一致时
+带上自己最后的版本号请求同步，服务端回复缺失的差异或完整状态。
+
+差异格式（JSON）:
+- 对象: {键: 子差异}，被删除的键列在 "$del" 中；
+- 数组: {"$list": {"len": 新长度, "set": {下标: 子差异}, "append": [新增元素]}}；
+- 其他情况直接给出新值。
+
+校验和为状态规范JSON（键排序、无空白、非ASCII字符不转义）UTF-8编码的CRC32。
+
+游戏动作保存在每局游戏有界的环形缓冲区 ActionHistory 中，每个动作有单调递增的游标
+（私密动作同时保存公开投影和完整内容，见 projection.py）；
+每次广播状态时记录检查点（该状态版本对应的动作游标）。新连接带上游标时只补发之后的动作，
+没有游标或游标已被覆盖时，先发送检查点状态，再发送检查点之后的动作，动作按批合并为少量帧。
+"""
+import json
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from models import GameState
+from projection import ADMIN_VIEW, player_view
+
+_DEL = "$del"
+_LIST = "$list"
+# 表示"无差异"的哨兵
+_SAME = object()
+
+
+def compact(game_state: GameState) -> Dict[str, Any]:
+    """GameState 的JSON安全字典"""
+    return game_state.model_dump(mode="json")
+
+
+def checksum(state: Dict[str, Any]) -> int:
+    """状态的CRC32校验和（客户端以相同规则计算）"""
+    data = json.dumps(state, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return zlib.crc32(data.encode("utf-8"))
+
+
+def diff(old: Any, new: Any) -> Any:
+    """计算从old到new的差异，两者相同时返回 _SAME"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes: Dict[str, Any] = {}
+        for key, value in new.items():
+            if key not in old:
+                changes[key] = value
+                continue
+            sub = diff(old[key], value)
+            if sub is not _SAME:
+                changes[key] = sub
+        removed = [key for key in old if key not in new]
+        if removed:
+            changes[_DEL] = removed
+        return changes if changes else _SAME
+
+    if isinstance(old, list) and isinstance(new, list):
+        updates = {}
+        for index in range(min(len(old), len(new))):
+            sub = diff(old[index], new[index])
+            if sub is not _SAME:
+                updates[str(index)] = sub
+        if not updates and len(old) == len(new):
+            return _SAME
+        ops: Dict[str, Any] = {"len": len(new)}
+        if updates:
+            ops["set"] = updates
+        if len(new) > len(old):
+            ops["append"] = new[len(old):]
+        return {_LIST: ops}
+
+    if old == new and type(old) is type(new):
+        return _SAME
+    return new
+
+
+def apply_diff(old: Any, change: Any) -> Any:
+    """把差异应用到old上，返回新值（不修改old）"""
+    if isinstance(change, dict) and isinstance(old, list) and _LIST in change:
+        ops = change[_LIST]
+        result = list(old[:ops["len"]])
+        for index, sub in ops.get("set", {}).items():
+            result[int(index)] = apply_diff(result[int(index)], sub)
+        result.extend(ops.get("append", []))
+        return result
+    if isinstance(change, dict) and isinstance(old, dict):
+        result = dict(old)
+        for key, sub in change.items():
+            if key == _DEL:
+                continue
+            result[key] = apply_diff(old[key], sub) if key in old else sub
+        for key in change.get(_DEL, []):
+            result.pop(key, None)
+        return result
+    return change
+
+
+class VersionedState:
+    """一局游戏的状态版本序列，保留最近若干个版本的差异供客户端补齐"""
+
+    def __init__(self, history: int = 32):
+        self.seq = 0
+        self.state: Optional[Dict[str, Any]] = None
+        self.checksum = 0
+        # (版本号, 与上一版本的差异)
+        self._deltas: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=max(1, history))
+
+    def update(self, game_state: Union[GameState, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """记录新状态（GameState或其JSON形式的投影），返回增量消息的data；状态没有变化时返回None"""
+        new = game_state if isinstance(game_state, dict) else compact(game_state)
+        if self.state is None:
+            self.seq, self.state, self.checksum = 1, new, checksum(new)
+            return None
+        change = diff(self.state, new)
+        if change is _SAME:
+            return None
+        self.seq += 1
+        self.state = new
+        self.checksum = checksum(new)
+        self._deltas.append((self.seq, change))
+        return self.delta_message(self.seq - 1, self.seq, change, self.checksum)
+
+    def load(self, state: Dict[str, Any], seq: int, crc: int):
+        """用其他进程广播的完整状态重置版本序列"""
+        self.seq, self.state, self.checksum = seq, state, crc
+        self._deltas.clear()
+
+    def apply_delta(self, delta: Dict[str, Any]) -> bool:
+        """应用其他进程广播的增量消息，版本不连续时返回False"""
+        if self.state is None or delta["base"] != self.seq:
+            return False
+        self.state = apply_diff(self.state, delta["diff"])
+        self.seq = delta["seq"]
+        self.checksum = delta["checksum"] if "checksum" in delta else checksum(self.state)
+        self._deltas.append((self.seq, delta["diff"]))
+        return True
+
+    def since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """从version补齐到最新版本所需的增量消息，历史已不足时返回None"""
+        if version == self.seq:
+            return []
+        if version > self.seq or not self._deltas or self._deltas[0][0] > version + 1:
+            return None
+        messages = []
+        for seq, change in self._deltas:
+            if seq > version:
+                # 中间版本的校验和未保存，只有最后一条携带校验和
+                messages.append(self.delta_message(seq - 1, seq, change, self.checksum if seq == self.seq else None))
+        return messages
+
+    @staticmethod
+    def delta_message(base: int, seq: int, change: Dict[str, Any], crc: Optional[int]) -> Dict[str, Any]:
+        message = {"base": base, "seq": seq, "diff": change}
+        if crc is not None:
+            message["checksum"] = crc
+        return message
+
+
+class ActionHistory:
+    """一局游戏最近动作的环形缓冲区
+
+    元素为 [游标, 编码后的公开内容, 编码后的完整内容, 所属玩家]，公开动作的后两项为None；
+    游标从1开始单调递增。
+    """
+
+    def __init__(self, size: int = 500):
+        self._buffer: Deque[List[Any]] = deque(maxlen=max(1, size))
+        self.cursor = 0
+        # 最近一次状态检查点对应的动作游标
+        self.checkpoint_cursor: Optional[int] = None
+
+    def append(self, data_text: str, private_text: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """追加动作，返回分配的游标
+
+        Args:
+            data_text: 公开内容
+            private_text: 私密动作的完整内容（只对owner和管理员可见）
+            owner: 私密动作所属的玩家
+        """
+        self.cursor += 1
+        self._buffer.append([self.cursor, data_text, private_text, owner])
+        return self.cursor
+
+    def record(self, cursor: int, data_text: Optional[str] = None, private_text: Optional[str] = None,
+               owner: Optional[str] = None):
+        """记录其他进程广播的动作，同一游标的公开内容和完整内容分别到达时合并"""
+        for entry in reversed(self._buffer):
+            if entry[0] == cursor:
+                break
+            if entry[0] < cursor:
+                entry = None
+                break
+        else:
+            entry = None
+        if entry is None:
+            if cursor <= self.cursor:
+                # 乱序到达的旧动作，缓冲区中已没有它的位置
+                return
+            entry = [cursor, None, None, None]
+            self._buffer.append(entry)
+            self.cursor = cursor
+        if data_text is not None:
+            entry[1] = data_text
+        if private_text is not None:
+            entry[2], entry[3] = private_text, owner
+
+    @staticmethod
+    def text_for(entry: List[Any], view: str) -> Optional[str]:
+        """动作在视图下的内容（只收到了完整内容而不可见时为None）"""
+        if entry[2] is not None and (view == ADMIN_VIEW or view == player_view(entry[3])):
+            return entry[2]
+        return entry[1]
+
+    def checkpoint(self):
+        """记录当前游标为状态检查点"""
+        self.checkpoint_cursor = self.cursor
+
+    def since(self, cursor: int) -> Optional[List[List[Any]]]:
+        """游标之后的动作，已被环形缓冲区覆盖时返回None"""
+        if cursor >= self.cursor:
+            return []
+        oldest = self._buffer[0][0] if self._buffer else self.cursor + 1
+        if cursor + 1 < oldest:
+            return None
+        return [entry for entry in self._buffer if entry[0] > cursor]
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 服务端模块是扁平布局（没有包），测试直接从 sillyworld-server 目录导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from actor import ActorSystem
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+def test_commands_run_one_at_a_time_in_submission_order():
+    trace = []
+
+    async def command(index):
+        trace.append(("start", index))
+        await asyncio.sleep(0)
+        trace.append(("end", index))
+        return index
+
+    async def main():
+        actors = ActorSystem()
+        futures = [actors.tell("g", "cmd", command, i) for i in range(20)]
+        results = await asyncio.gather(*futures)
+        stats = actors.stats()
+        await actors.stop()
+        return results, stats
+
+    results, stats = run(main())
+
+    assert results == list(range(20))
+    # 每个命令开始和结束之间没有其他命令交错
+    assert trace == [(event, i) for i in range(20) for event in ("start", "end")]
+    assert stats["processed"] == 20 and stats["games"][0]["commands"] == {"cmd": 20}
+
+
+def test_games_have_independent_mailboxes():
+    order = []
+    release = None
+
+    async def blocked():
+        await release.wait()
+        order.append("g1")
+
+    async def quick():
+        order.append("g2")
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        actors = ActorSystem()
+        first = actors.tell("g1", "blocked", blocked)
+        await actors.call("g2", "quick", quick)
+        release.set()
+        await first
+        await actors.stop()
+
+    run(main())
+
+    assert order == ["g2", "g1"]
+
+
+def test_nested_call_on_the_same_actor_runs_inline():
+    async def main():
+        actors = ActorSystem()
+
+        async def inner():
+            return "inner"
+
+        async def outer():
+            # 已经在该actor中执行，再次调用不能等待自己
+            return await actors.call("g", "inner", inner)
+
+        result = await actors.call("g", "outer", outer)
+        stats = actors.stats()["games"][0]
+        await actors.stop()
+        return result, stats
+
+    result, stats = run(main())
+
+    assert result == "inner"
+    assert stats["commands"] == {"outer": 1}
+
+
+def test_command_errors_reach_the_caller_and_the_actor_keeps_running():
+    async def fail():
+        raise ValueError("boom")
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        actors = ActorSystem()
+        with pytest.raises(ValueError, match="boom"):
+            await actors.call("g", "fail", fail)
+        result = await actors.call("g", "ok", ok)
+        stats = actors.stats()["games"][0]
+        await actors.stop()
+        return result, stats
+
+    result, stats = run(main())
+
+    assert result == "ok"
+    assert stats["failed"] == 1 and stats["processed"] == 2
+
+
+def test_cancelled_caller_drops_its_queued_command():
+    ran = []
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        ran.append("slow")
+
+    async def queued():
+        ran.append("queued")
+
+    async def main():
+        actors = ActorSystem()
+        first = asyncio.ensure_future(actors.call("g", "slow", slow))
+        await asyncio.sleep(0)
+        caller = asyncio.ensure_future(actors.call("g", "queued", queued))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await first
+        await actors.call("g", "slow", slow)
+        stats = actors.stats()["games"][0]
+        await actors.stop()
+        return stats
+
+    stats = run(main())
+
+    assert ran == ["slow", "slow"]
+    assert stats["dropped"] == 1
+
+
+def test_close_cancels_running_and_queued_commands():
+    async def forever():
+        await asyncio.Event().wait()
+
+    async def main():
+        actors = ActorSystem()
+        running = actors.tell("g", "forever", forever)
+        queued = actors.tell("g", "forever", forever)
+        await asyncio.sleep(0)
+        await actors.close("g")
+        return running, queued, actors.stats()
+
+    running, queued, stats = run(main())
+
+    assert running.cancelled() and queued.cancelled()
+    assert stats["actors"] == 0 and stats["closed"] == 1
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from admission import AdmissionController, LLMLimiter
+from exceptions import AdmissionRejectedError
+
+
+def test_games_queue_fifo_and_are_admitted_on_release():
+    admitted = []
+    admission = AdmissionController(max_active_games=2, max_waiting_games=2, on_admit=admitted.append)
+
+    assert [admission.admit(game_id) for game_id in ("a", "b", "c", "d")] == [0, 0, 1, 2]
+    assert admission.admit("c") == 1  # 重复申请返回原来的位置
+
+    admission.release("a")
+
+    assert admitted == ["c"]
+    assert admission.position("c") == 0 and admission.position("d") == 1
+    assert admission.position("a") is None
+
+
+def test_full_waiting_queue_rejects_with_429_and_retry_after():
+    admission = AdmissionController(max_active_games=1, max_waiting_games=1, retry_after=30)
+    admission.admit("a")
+    admission.admit("b")
+
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        admission.admit("c")
+
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers == {"Retry-After": "30"}
+    assert admission.stats()["rejected"] == 1
+    # 恢复的游戏不受上限限制
+    assert admission.admit("recovered", force=True) == 0
+
+
+def test_create_game_returns_429_when_the_queue_is_full(monkeypatch):
+    admission = AdmissionController(max_active_games=1, max_waiting_games=0, retry_after=7)
+    admission.admit("running")
+    monkeypatch.setattr(main, "admission", admission)
+    players = [{"id": "p1", "name": "A", "prompt": ""}, {"id": "p2", "name": "B", "prompt": ""}]
+
+    response = TestClient(main.app).post("/api/games", json={"players": players})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "7"
+    assert admission.stats()["rejected"] == 1
+
+
+def test_llm_limiter_bounds_concurrent_calls_in_each_event_loop():
+    limiter = LLMLimiter(max_in_flight=2)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter:
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def burst():
+        await asyncio.gather(*(call() for _ in range(8)))
+
+    # 与 main 一样在事件循环之外创建，并在两个不同的事件循环中使用
+    asyncio.run(burst())
+    asyncio.run(burst())
+
+    assert peak == 2
+    assert limiter.stats() == {"max_in_flight": 2, "in_flight": 0, "waiting": 0, "completed": 16}
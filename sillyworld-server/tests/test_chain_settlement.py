@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+
+from chain_settlement import ChainSettlementQueue, MockChainBackend
+from models import GameResult
+
+
+def make_result(game_id):
+    return GameResult(game_id=game_id, winner_id="p1", final_balance=120, prize_pool=40, total_rounds=3,
+                      end_time=datetime(2025, 1, 1), winner_prompt="")
+
+
+def test_queue_created_outside_the_loop_runs_under_asyncio_run():
+    # 与 main 一样在事件循环之外创建队列
+    backend = MockChainBackend(latency=0.01)
+    queue = ChainSettlementQueue(backend, batch_size=4, linger=0.01, max_in_flight=2)
+
+    async def run(game_ids):
+        queue.start()
+        jobs = [queue.enqueue(make_result(game_id)) for game_id in game_ids]
+        await asyncio.wait_for(queue.drain(), 5)
+        await queue.stop()
+        return jobs
+
+    first = asyncio.run(run([f"g{i}" for i in range(10)]))
+    # 同一个队列在新的事件循环中重新启动
+    second = asyncio.run(run([f"h{i}" for i in range(3)]))
+
+    assert all(job.status == "confirmed" for job in first + second)
+    assert queue.stats()["confirmed"] == 13
+    assert len(backend.ended_games) == 13
+
+
+def test_results_enqueued_before_start_are_submitted():
+    backend = MockChainBackend(latency=0.0)
+    queue = ChainSettlementQueue(backend, linger=0.0)
+    job = queue.enqueue(make_result("early"))
+
+    async def run():
+        queue.start()
+        await asyncio.wait_for(queue.drain(), 5)
+        await queue.stop()
+
+    asyncio.run(run())
+
+    assert job.status == "confirmed"
+    assert queue.enqueue(make_result("early")) is job
+
+
+def test_transient_failures_are_retried():
+    backend = MockChainBackend(latency=0.0, failure_rate=0.5, seed=7)
+    queue = ChainSettlementQueue(backend, batch_size=2, linger=0.0, retry_delay=0.001, max_retries=20)
+
+    async def run():
+        queue.start()
+        for i in range(8):
+            queue.enqueue(make_result(f"r{i}"))
+        await asyncio.wait_for(queue.drain(), 5)
+        await queue.stop()
+
+    asyncio.run(run())
+
+    stats = queue.stats()
+    assert stats["confirmed"] == 8
+    assert stats["retries"] > 0
@@ -0,0 +1,82 @@
+import random
+from datetime import datetime, timedelta
+
+from clock import VirtualClock
+from event_log import EventLog
+from models import GamePhase, GameState, Item, ItemType, PersuasionRequest, Player
+
+
+def make_game():
+    start = datetime(2025, 1, 1)
+    players = [Player(id=f"p{i}", name=f"P{i}", prompt=f"secret{i}") for i in range(4)]
+    return GameState(game_id="g", phase=GamePhase.ITEM_PHASE, players=players, prize_pool=40,
+                     total_resources=440, start_time=start, last_update=start)
+
+
+def play_round(game_state, rng, event_log, now):
+    """随机修改状态并在每一步之后记录，覆盖所有状态变更事件类型"""
+    active = [p for p in game_state.players if p.is_active]
+    for player in active:
+        if rng.random() < 0.4 and len(player.items) < 3:
+            player.items.append(Item(type=rng.choice(list(ItemType)), price=10))
+            event_log.record(game_state)
+        unused = [item for item in player.items if not item.used]
+        if unused and rng.random() < 0.5:
+            unused[0].used = True
+            event_log.record(game_state)
+
+    game_state.phase = GamePhase.PERSUASION_PHASE
+    for player in active:
+        target = rng.choice(active)
+        if target is not player:
+            game_state.persuasion_requests.append(PersuasionRequest(
+                from_player=player.id, to_player=target.id, amount=rng.randint(1, 10), message="m"))
+            event_log.record(game_state)
+    for request in game_state.persuasion_requests:
+        request.accepted = rng.random() < 0.5
+    event_log.record(game_state)
+
+    game_state.phase = GamePhase.SETTLEMENT_PHASE
+    for request in game_state.persuasion_requests:
+        if request.accepted:
+            payer = next(p for p in game_state.players if p.id == request.to_player)
+            payee = next(p for p in game_state.players if p.id == request.from_player)
+            amount = min(request.amount, payer.balance)
+            payer.balance -= amount
+            payee.balance += amount
+            request.processed = True
+    # 已结算的请求从状态中移除，未接受的留到下一回合
+    game_state.persuasion_requests = [r for r in game_state.persuasion_requests if not r.processed]
+    event_log.record(game_state)
+    for player in active:
+        if player.balance < 95 and len(active) > 2:
+            player.is_active = False
+            player.last_action_time = now
+
+    game_state.current_round += 1
+    game_state.last_update = now
+    game_state.phase = GamePhase.ITEM_PHASE
+    event_log.record(game_state)
+
+
+def test_state_at_each_round_equals_the_live_state(tmp_path):
+    rng = random.Random(7)
+    clock = VirtualClock(datetime(2025, 1, 1))
+    event_log = EventLog(snapshot_interval=3, persist_dir=str(tmp_path), clock=clock)
+    game_state = make_game()
+    event_log.start(game_state)
+    live = {0: game_state.model_dump(mode="json")}
+
+    for round_no in range(1, 11):
+        play_round(game_state, rng, event_log, datetime(2025, 1, 1) + timedelta(minutes=round_no))
+        live[round_no] = game_state.model_dump(mode="json")
+
+    for round_no, expected in live.items():
+        assert event_log.state_at("g", round_no).model_dump(mode="json") == expected
+    assert event_log.state_at("g").model_dump(mode="json") == live[10]
+
+    # 释放内存后从文件重新加载，重建结果不变
+    event_log.forget("g")
+    assert event_log.load("g")
+    for round_no, expected in live.items():
+        assert event_log.state_at("g", round_no).model_dump(mode="json") == expected
@@ -0,0 +1,210 @@
+import asyncio
+import random
+
+import pytest
+
+from exceptions import InvalidActionError
+from game import Game
+from human_input import GameInputQueue, HumanInputHub
+from models import GameAction, Item, ItemType, Player
+
+
+class RecordingAI:
+    """固定决策的AI，记录调用顺序、同时进行的调用数以及决策时已有的说服请求数"""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.decisions = []
+
+    async def _call(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+
+    async def make_decision(self, player, game_state, phase, available_actions):
+        self.decisions.append((player.id, len(game_state.persuasion_requests)))
+        await self._call()
+        return GameAction(player_id=player.id, action_type=available_actions[0], public_message="hi")
+
+    async def evaluate_persuasion(self, target_player, request, game_state):
+        await self._call()
+        return True, None, None
+
+
+def make_game(ai, hub=None, humans=()):
+    game = Game(ai, inputs=hub)
+    players = [Player(id=f"p{i}", name=f"P{i}", prompt="x", is_human=f"p{i}" in humans) for i in range(3)]
+    game_state = game.create_game(players)
+    game.game_preparation[game_state.game_id] = False
+    return game, game_state
+
+
+def seat(game_state, player_id):
+    return next(p for p in game_state.players if p.id == player_id)
+
+
+@pytest.fixture
+def fixed_persuasion(monkeypatch):
+    # 每个席位都发起说服，目标为其他席位中的最后一个
+    monkeypatch.setattr(random, "random", lambda: 0.5)
+    monkeypatch.setattr(random, "choice", lambda seq: seq[-1])
+
+
+def test_input_submitted_before_the_request_is_used_immediately():
+    async def run():
+        _, game_state = make_game(None, humans=("p0",))
+        queue = GameInputQueue(game_state.game_id)
+        early = queue.submit(game_state, "p0", {"action_type": "persuade", "target_player": "p1", "amount": 5}, 1.0)
+        submitted, response = await queue.wait("p0", "persuasion", game_state.current_round, timeout=5)
+        # 上一回合提前提交的输入不再有效
+        queue.submit(game_state, "p0", {"action_type": "persuade", "target_player": "p1", "amount": 6}, 1.0)
+        stale, _ = await queue.wait("p0", "persuasion", game_state.current_round + 1, timeout=0.01)
+        return early, submitted, response, stale
+
+    early, submitted, response, stale = asyncio.run(run())
+
+    assert submitted is early and early.request_id is None and response == 0.0
+    assert stale is None
+
+
+def test_input_for_an_open_request_resolves_the_wait():
+    async def run():
+        _, game_state = make_game(None, humans=("p0", "p1"))
+        queue = GameInputQueue(game_state.game_id)
+        requests = []
+
+        async def notify(game_id, player_id, message):
+            requests.append(message["data"]["request_id"])
+
+        waiting = asyncio.ensure_future(queue.wait("p0", "persuasion_response", 0, timeout=5, notify=notify))
+        await asyncio.sleep(0)
+        with pytest.raises(InvalidActionError):
+            queue.submit(game_state, "p0", {"action_type": "accept", "request_id": "nope"}, 0.0)
+        with pytest.raises(InvalidActionError):
+            # 其他玩家不能回应该请求
+            queue.submit(game_state, "p1", {"action_type": "accept", "request_id": requests[0]}, 0.0)
+        queue.submit(game_state, "p0", {"action_type": "reject", "request_id": requests[0]}, 0.0)
+        submitted, _ = await waiting
+        with pytest.raises(InvalidActionError):
+            # 已回应的请求不能再次回应
+            queue.submit(game_state, "p0", {"action_type": "accept", "request_id": requests[0]}, 0.0)
+        return submitted, requests
+
+    submitted, requests = asyncio.run(run())
+
+    assert submitted.request_id == requests[0]
+    assert submitted.action.action_type == "reject"
+
+
+def test_response_without_an_open_request_is_rejected():
+    _, game_state = make_game(None, humans=("p0",))
+
+    with pytest.raises(InvalidActionError):
+        GameInputQueue(game_state.game_id).submit(game_state, "p0", {"action_type": "accept"}, 0.0)
+
+
+@pytest.mark.parametrize("data", [
+    {"action_type": "persuade", "target_player": "p0", "amount": 10},
+    {"action_type": "persuade", "target_player": "p1", "amount": 99},
+    {"action_type": "persuade", "target_player": "p1", "amount": True},
+    {"action_type": "persuade", "amount": 10},
+    {"action_type": "persuade", "target_player": "p1", "amount": 10, "message": "x" * 501},
+    {"action_type": "use_item"},
+    {"action_type": "use_item", "item_type": "intel"},
+    {"action_type": "use_item", "item_type": "unknown"},
+    {"action_type": "pass"},
+    {"action_type": "fly"},
+])
+def test_invalid_inputs_are_rejected_and_counted(data):
+    _, game_state = make_game(None, humans=("p0",))
+    seat(game_state, "p0").items = [Item(type=ItemType.SHIELD, price=10, used=True)]
+    hub = HumanInputHub()
+
+    with pytest.raises(InvalidActionError):
+        hub.submit(game_state, "p0", data)
+
+    assert hub.rejected == {str(data["action_type"]): 1}
+    assert hub.received == 0
+
+
+def test_inputs_from_ai_and_eliminated_seats_are_rejected():
+    _, game_state = make_game(None, humans=("p0",))
+    seat(game_state, "p0").is_active = False
+    hub = HumanInputHub()
+
+    for player_id in ("p0", "p1"):
+        with pytest.raises(InvalidActionError):
+            hub.submit(game_state, player_id, {"action_type": "persuade", "target_player": "p2", "amount": 10})
+
+
+def test_ai_decides_for_a_human_seat_after_the_deadline():
+    async def run():
+        ai = RecordingAI()
+        hub = HumanInputHub(deadlines={"persuasion": 0.05})
+        game, game_state = make_game(ai, hub, humans=("p0",))
+        _, decision, submitted = await game._decide(game_state, seat(game_state, "p0"), "persuasion", ["persuade"])
+        return ai, hub, decision, submitted
+
+    ai, hub, decision, submitted = asyncio.run(run())
+
+    assert submitted is None
+    assert decision.player_id == "p0" and decision.action_type == "persuade"
+    assert ai.decisions == [("p0", 0)]
+    assert hub.timeouts == 1
+
+
+def test_ai_persuasion_runs_sequentially_in_seat_order(fixed_persuasion):
+    async def run():
+        ai = RecordingAI()
+        game, game_state = make_game(ai)
+        actions = [a async for a in game.stream_phase(game_state.game_id, "persuasion_phase")]
+        return ai, actions
+
+    ai, actions = asyncio.run(run())
+
+    assert [a.player_id for a in actions if a.action_type == "persuade"] == ["p0", "p1", "p2"]
+    # 每个发起方决策时，前面席位的说服请求已经加入游戏状态
+    assert ai.decisions == [("p0", 0), ("p1", 1), ("p2", 2)]
+    assert ai.max_in_flight == 1
+
+
+def test_waiting_human_seat_does_not_block_ai_persuasion(fixed_persuasion):
+    async def run():
+        ai = RecordingAI()
+        hub = HumanInputHub(deadlines={"persuasion": 0.3})
+        game, game_state = make_game(ai, hub, humans=("p0",))
+        actions = [a async for a in game.stream_phase(game_state.game_id, "persuasion_phase")]
+        return hub, actions
+
+    hub, actions = asyncio.run(run())
+
+    # p1 -> p2 和 p2 -> p1 只涉及AI席位，不等待人类席位 p0 的截止时间；p0 超时后由AI代为发起说服
+    assert [(a.player_id, a.target_player) for a in actions if a.action_type == "persuade"] == [
+        ("p1", "p2"), ("p2", "p1"), ("p0", "p2")
+    ]
+    assert hub.timeouts == 1
+
+
+def test_seat_decisions_apply_ai_seats_in_order_and_human_input_as_it_arrives():
+    async def run():
+        ai = RecordingAI(delay=0.05)
+        hub = HumanInputHub(deadlines={"item_usage": 5})
+        game, game_state = make_game(ai, hub, humans=("p1",))
+        seats = game_state.players
+        seat(game_state, "p1").items = [Item(type=ItemType.SHIELD, price=10)]
+        order = []
+        decisions = game._seat_decisions(game_state, seats, "item_usage", ["use_item"])
+        handle = asyncio.get_running_loop().call_later(
+            0.01, hub.submit, game_state, "p1", {"action_type": "use_item", "item_type": "shield"})
+        async for player, decision, submitted in decisions:
+            order.append((player.id, submitted is not None))
+        handle.cancel()
+        return ai, order
+
+    ai, order = asyncio.run(run())
+
+    assert order == [("p1", True), ("p0", False), ("p2", False)]
+    assert ai.max_in_flight == 1
@@ -0,0 +1,125 @@
+import random
+from datetime import datetime
+
+from items import ITEM_REGISTRY, ItemSpec, ItemSystem, _compile_draw_table
+from ledger import POOL, TokenLedger
+from models import GamePhase, GameState, ItemType, PersuasionRequest, Player
+
+NOW = datetime(2025, 1, 1)
+
+
+def make_game(*balances, prize_pool=0):
+    players = [Player(id=f"p{i}", name=f"P{i}", prompt="abcdefghi", balance=balance)
+               for i, balance in enumerate(balances)]
+    return GameState(game_id="g", phase=GamePhase.ITEM_PHASE, players=players, prize_pool=prize_pool,
+                     total_resources=sum(balances) + prize_pool, start_time=NOW, last_update=NOW)
+
+
+def use(game_state, effects, item_type, player_index, target_index=1):
+    player, target = game_state.players[player_index], game_state.players[target_index]
+    item = ItemSystem.create_item(item_type)
+    item.used = True
+    player.items.append(item)
+    return ItemSystem.apply_use(game_state, effects, player, target, item)
+
+
+def test_draw_table_covers_every_owned_combination_with_cumulative_weights():
+    registry = {
+        ItemType.SHIELD: ItemSpec(ItemType.SHIELD, "护盾卡", price=10, weight=1.0),
+        ItemType.INTEL: ItemSpec(ItemType.INTEL, "情报卡", price=8, weight=3.0),
+    }
+
+    table = _compile_draw_table(registry)
+
+    assert len(table) == 4
+    assert table[frozenset()] == ([ItemType.SHIELD, ItemType.INTEL], [1.0, 4.0])
+    assert table[frozenset({"shield"})] == ([ItemType.INTEL], [3.0])
+    assert table[frozenset({"shield", "intel"})] == ([], [])
+
+
+def test_draw_never_returns_an_owned_type():
+    random.seed(0)
+    owned = {"aggressive", "intel"}
+
+    draws = {ItemSystem.draw_item_type(owned) for _ in range(200)}
+
+    assert draws == {ItemType.SHIELD, ItemType.EQUALIZER}
+    assert ItemSystem.draw_item_type([t.value for t in ItemType]) is None
+
+
+def test_affordable_draw_excludes_types_priced_above_the_balance():
+    random.seed(0)
+
+    # 价格：激进15、均富12、护盾10、情报8
+    assert {ItemSystem.draw_affordable_item_type((), 10) for _ in range(200)} == {ItemType.SHIELD, ItemType.INTEL}
+    assert ItemSystem.draw_affordable_item_type({"intel"}, 9) is None
+    assert ItemSystem.draw_affordable_item_type((), 7) is None
+
+
+def test_aggressive_penalty_applies_only_without_a_successful_persuasion():
+    game_state = make_game(100, 100, 100)
+    effects = ItemSystem.new_effect_marks()
+    ledger = TokenLedger(game_state)
+    use(game_state, effects, ItemType.AGGRESSIVE, 0)
+    use(game_state, effects, ItemType.AGGRESSIVE, 2)
+    game_state.persuasion_requests = [
+        PersuasionRequest(from_player="p2", to_player="p1", amount=5, message="", accepted=True, processed=True)
+    ]
+
+    actions = ItemSystem.run_settlement(game_state, effects, NOW, ledger)
+
+    price = ITEM_REGISTRY[ItemType.AGGRESSIVE].price
+    assert [(a.action_type, a.player_id, a.amount) for a in actions] == [("aggressive_penalty", "p0", price)]
+    assert [p.balance for p in game_state.players] == [100 - price, 100, 100]
+    assert game_state.prize_pool == price
+    assert effects[ItemType.AGGRESSIVE] == {}
+    assert ledger.check()
+
+
+def test_shield_halves_payments_for_one_round():
+    game_state = make_game(100, 100)
+    effects = ItemSystem.new_effect_marks()
+    use(game_state, effects, ItemType.SHIELD, 0)
+
+    assert ItemSystem.adjust_payment(effects, "p0", 9) == 4
+    assert ItemSystem.adjust_payment(effects, "p0", 1) == 1
+    assert ItemSystem.adjust_payment(effects, "p1", 9) == 9
+
+    ItemSystem.run_settlement(game_state, effects, NOW, TokenLedger(game_state))
+
+    assert ItemSystem.adjust_payment(effects, "p0", 9) == 9
+
+
+def test_intel_reveals_a_third_of_the_target_prompt():
+    game_state = make_game(100, 100)
+
+    description = use(game_state, ItemSystem.new_effect_marks(), ItemType.INTEL, 0)
+
+    assert "'abc...'" in description
+
+
+def test_equalizer_splits_with_the_richest_and_sends_an_odd_remainder_to_the_pool():
+    game_state = make_game(20, 51, 30)
+    effects = ItemSystem.new_effect_marks()
+    ledger = TokenLedger(game_state)
+    use(game_state, effects, ItemType.EQUALIZER, 0)
+
+    assert effects[ItemType.EQUALIZER] == {"p0": "p1"}
+    actions = ItemSystem.run_round_start(game_state, effects, NOW, ledger)
+
+    assert [(a.action_type, a.player_id, a.target_player) for a in actions] == [("equalizer_effect", "p0", "p1")]
+    assert [p.balance for p in game_state.players] == [35, 35, 30]
+    assert game_state.prize_pool == 1
+    assert ledger.entries[-1].legs == {"p0": 15, "p1": -16, POOL: 1}
+    assert effects[ItemType.EQUALIZER] == {}
+    assert ledger.check()
+
+
+def test_hooks_skip_players_eliminated_before_the_effect():
+    game_state = make_game(20, 60)
+    effects = ItemSystem.new_effect_marks()
+    use(game_state, effects, ItemType.EQUALIZER, 0)
+    game_state.players[1].is_active = False
+
+    assert ItemSystem.run_round_start(game_state, effects, NOW, TokenLedger(game_state)) == []
+    assert [p.balance for p in game_state.players] == [20, 60]
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+from ledger import HOUSE, POOL, TokenLedger
+from models import GamePhase, GameState, Player
+
+
+def make_game(*balances, prize_pool=0):
+    players = [Player(id=f"p{i}", name=f"P{i}", prompt="", balance=balance) for i, balance in enumerate(balances)]
+    return GameState(game_id="g", phase=GamePhase.ITEM_PHASE, players=players, prize_pool=prize_pool,
+                     total_resources=sum(balances) + prize_pool,
+                     start_time=datetime(2025, 1, 1), last_update=datetime(2025, 1, 1))
+
+
+def test_entries_move_tokens_between_accounts_and_into_the_state():
+    game_state = make_game(100, 100)
+    ledger = TokenLedger(game_state)
+
+    ledger.post({"p0": -10, "p1": -10, POOL: 20}, "entry_fee")
+    ledger.transfer("p1", "p0", 15, "settlement")
+    ledger.transfer(POOL, HOUSE, 2, "tax")
+
+    assert [p.balance for p in game_state.players] == [105, 75]
+    assert game_state.prize_pool == 18
+    assert ledger.accounts[HOUSE] == 2
+    assert ledger.check() and ledger.audit()
+    assert sum(ledger.accounts.values()) == ledger.total == 200
+    assert [entry.reason for entry in ledger.entries_since(0)] == ["settlement", "tax"]
+
+
+def test_unbalanced_entries_and_unknown_accounts_are_rejected():
+    game_state = make_game(100, 100)
+    ledger = TokenLedger(game_state)
+
+    with pytest.raises(ValueError):
+        ledger.post({"p0": -10, POOL: 5}, "buy_item")
+    with pytest.raises(ValueError):
+        ledger.transfer("p0", "nobody", 5, "buy_item")
+    assert ledger.entries == []
+    assert [p.balance for p in game_state.players] == [100, 100]
+
+
+def test_zero_transfer_posts_nothing():
+    ledger = TokenLedger(make_game(100, 100))
+
+    assert ledger.transfer("p0", "p1", 0, "settlement") is None
+    assert ledger.entries == []
+
+
+def test_check_detects_changes_that_bypass_the_ledger():
+    game_state = make_game(100, 100)
+    ledger = TokenLedger(game_state)
+    ledger.transfer("p0", POOL, 10, "buy_item")
+
+    game_state.players[0].balance += 50
+
+    assert not ledger.check()
+    assert any("p0" in violation for violation in ledger.violations)
+
+
+def test_audit_checks_accounts_not_touched_since_the_last_check():
+    game_state = make_game(100, 100)
+    ledger = TokenLedger(game_state)
+    assert ledger.check()
+
+    game_state.players[0].balance += 30
+    game_state.players[1].balance -= 30
+
+    # 总额不变时 check() 只核对上次检查以来被分录改动的账户
+    assert ledger.check()
+    assert not ledger.audit()
+
+
+def test_check_detects_total_drift_on_untouched_accounts():
+    game_state = make_game(100, 100, prize_pool=20)
+    ledger = TokenLedger(game_state)
+    assert ledger.check()
+
+    game_state.prize_pool += 5
+
+    assert not ledger.check()
+    assert "总额不守恒" in ledger.violations[0]
+
+
+def test_negative_balances_are_violations():
+    game_state = make_game(5, 100)
+    ledger = TokenLedger(game_state)
+
+    ledger.transfer("p0", "p1", 10, "settlement")
+
+    assert not ledger.check()
+    assert any("余额为负" in violation for violation in ledger.violations)
@@ -0,0 +1,87 @@
+import hashlib
+
+import pytest
+
+from event_log import EventLog
+from merkle import MerkleAccumulator, canonical_json, leaf_hash, node_hash, verify_proof
+
+
+def reference_root(leaves):
+    """RFC 6962 的递归定义"""
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    if len(leaves) == 1:
+        return leaf_hash(leaves[0])
+    k = 1 << ((len(leaves) - 1).bit_length() - 1)
+    return node_hash(reference_root(leaves[:k]), reference_root(leaves[k:]))
+
+
+def make_tree(count):
+    leaves = [f"leaf-{i}".encode() for i in range(count)]
+    tree = MerkleAccumulator()
+    for leaf in leaves:
+        tree.append(leaf)
+    return tree, leaves
+
+
+def test_roots_match_the_rfc6962_definition_at_every_size():
+    tree, leaves = make_tree(40)
+
+    for size in range(41):
+        assert tree.root(size) == reference_root(leaves[:size])
+
+
+def test_every_leaf_has_a_valid_proof_at_every_historical_size():
+    tree, leaves = make_tree(33)
+
+    for size in range(1, 34):
+        root = tree.root(size)
+        for index in range(size):
+            assert verify_proof(leaf_hash(leaves[index]), index, size, tree.proof(index, size), root)
+
+
+def test_proofs_fail_for_tampered_leaf_wrong_index_or_root():
+    tree, leaves = make_tree(13)
+    proof = tree.proof(5)
+    root = tree.root()
+
+    assert not verify_proof(leaf_hash(b"forged"), 5, 13, proof, root)
+    assert not verify_proof(leaf_hash(leaves[5]), 6, 13, proof, root)
+    assert not verify_proof(leaf_hash(leaves[5]), 5, 13, proof, tree.root(12))
+    assert not verify_proof(leaf_hash(leaves[5]), 13, 13, proof, root)
+    assert not verify_proof(leaf_hash(leaves[5]), 5, 13, proof[:-1], root)
+
+
+def test_proof_requests_out_of_range_raise():
+    tree, _ = make_tree(4)
+
+    with pytest.raises(ValueError):
+        tree.proof(4)
+    with pytest.raises(ValueError):
+        tree.proof(0, 5)
+
+
+def test_event_log_proofs_verify_against_the_committed_root(tmp_path):
+    from datetime import datetime
+    from models import GameAction, GamePhase, GameState, Player
+
+    game_state = GameState(game_id="g", phase=GamePhase.ITEM_PHASE,
+                           players=[Player(id="p1", name="A", prompt=""), Player(id="p2", name="B", prompt="")],
+                           start_time=datetime(2025, 1, 1), last_update=datetime(2025, 1, 1))
+    log = EventLog(persist_dir=str(tmp_path))
+    log.start(game_state)
+    for i in range(6):
+        game_state.players[0].balance -= 1
+        log.record(game_state, [GameAction(player_id="p1", action_type="note", description=str(i),
+                                           timestamp=datetime(2025, 1, 1))])
+    committed = log.commitment("g")
+
+    for seq in range(committed["size"]):
+        proof = log.proof("g", seq)
+        assert proof["root"] == committed["root"]
+        assert proof["leaf"] == leaf_hash(canonical_json(proof["event"])).hex()
+        assert EventLog.verify(proof)
+
+    proof = log.proof("g", 2)
+    proof["event"]["data"]["description"] = "forged"
+    assert not EventLog.verify(proof)
@@ -0,0 +1,70 @@
+from projection import (ADMIN_VIEW, PUBLIC_VIEW, connection_view, player_view, project_event,
+                        project_ledger_entry, project_state, seat_token, verify_seat_token)
+
+
+def make_state():
+    return {"players": [
+        {"id": "p1", "prompt": "secret1", "items": [{"type": "shield", "used": False}, {"type": "spy", "used": True}]},
+        {"id": "p2", "prompt": "secret2", "items": [{"type": "aggressive", "used": False}]},
+    ]}
+
+
+def test_seat_token_is_bound_to_game_and_seat():
+    token = seat_token("s", "g1", "p1")
+
+    assert verify_seat_token("s", "g1", "p1", token)
+    assert not verify_seat_token("s", "g1", "p2", token)
+    assert not verify_seat_token("s", "g2", "p1", token)
+    assert not verify_seat_token("other", "g1", "p1", token)
+    assert not verify_seat_token("s", "g1", "p1", None)
+
+
+def test_player_view_requires_verified_seat():
+    seats = ["p1", "p2"]
+
+    assert connection_view("p1", seats) == PUBLIC_VIEW
+    assert connection_view("p1", seats, seat_verified=True) == player_view("p1")
+    assert connection_view("p3", seats, seat_verified=True) == PUBLIC_VIEW
+    assert connection_view("p1", seats, is_admin=True) == ADMIN_VIEW
+
+
+def test_state_projection_hides_other_players_prompt_and_unused_items():
+    state = make_state()
+
+    projected = project_state(state, player_view("p1"))
+
+    assert projected["players"][0] is state["players"][0]
+    assert "prompt" not in projected["players"][1]
+    assert projected["players"][1]["items"] == [{"type": None, "used": False}]
+    public = project_state(state, PUBLIC_VIEW)["players"][0]
+    assert [item["type"] for item in public["items"]] == [None, "spy"]
+    assert state["players"][1]["prompt"] == "secret2"
+
+
+def test_event_projection():
+    buy = {"event_type": "action", "data": {"player_id": "p1", "action_type": "buy_item", "item_type": "shield"}}
+    snapshot = {"event_type": "snapshot", "data": {"state": make_state()}}
+    item_added = {"event_type": "item_added", "data": {"player_id": "p2", "item": {"type": "spy", "used": False}}}
+    balance = {"event_type": "player_set", "data": {"player_id": "p2", "field": "balance", "value": 5}}
+
+    assert project_event(buy, player_view("p1")) is buy
+    assert project_event(buy, PUBLIC_VIEW)["data"]["item_type"] is None
+    assert buy["data"]["item_type"] == "shield"
+    assert all("prompt" not in p for p in project_event(snapshot, PUBLIC_VIEW)["data"]["state"]["players"])
+    assert project_event(item_added, player_view("p1"))["data"]["item"]["type"] is None
+    assert project_event(item_added, player_view("p2")) is item_added
+    assert project_event(balance, PUBLIC_VIEW) is balance
+    assert project_event(snapshot, ADMIN_VIEW) is snapshot
+
+
+def test_ledger_projection_hides_item_prices_from_others():
+    buy = {"seq": 1, "round": 0, "reason": "buy_item", "legs": {"p1": -3, "pool": 3}}
+    transfer = {"seq": 2, "round": 1, "reason": "settlement", "legs": {"p1": -2, "p2": 2}}
+
+    assert project_ledger_entry(buy, player_view("p1")) is buy
+    assert project_ledger_entry(buy, ADMIN_VIEW) is buy
+    assert project_ledger_entry(buy, player_view("p2"))["legs"] == {"p1": None, "pool": None}
+    assert project_ledger_entry(buy, PUBLIC_VIEW)["legs"] == {"p1": None, "pool": None}
+    assert project_ledger_entry(buy, player_view("pool"))["legs"] == {"p1": None, "pool": None}
+    assert project_ledger_entry(transfer, PUBLIC_VIEW) is transfer
+    assert buy["legs"] == {"p1": -3, "pool": 3}
@@ -0,0 +1,62 @@
+import asyncio
+
+from event_log import EventLog
+from game import Game
+from models import Player
+from recovery import RecoveryManager
+
+
+def make_system():
+    game_system = Game(ai_system=None, event_log=EventLog())
+    game_state = game_system.create_game([Player(id=f"p{i}", name=f"P{i}", prompt="") for i in range(3)])
+    return game_system, game_state
+
+
+def test_cancelled_game_snapshot_is_deleted_and_not_restored(tmp_path):
+    game_system, game_state = make_system()
+    recovery = RecoveryManager(game_system, snapshot_dir=str(tmp_path))
+    recovery.checkpoint(game_state.game_id, "round_start")
+    asyncio.run(recovery.flush())
+    assert (tmp_path / f"{game_state.game_id}.json").exists()
+
+    game_state.status = "cancelled"
+    recovery.snapshot(game_state.game_id)
+    asyncio.run(recovery.flush())
+
+    assert not (tmp_path / f"{game_state.game_id}.json").exists()
+
+
+def test_restore_skips_and_deletes_snapshots_of_finished_games(tmp_path):
+    game_system, game_state = make_system()
+    recovery = RecoveryManager(game_system, snapshot_dir=str(tmp_path))
+    recovery.checkpoint(game_state.game_id, "round_start")
+    asyncio.run(recovery.flush())
+    # 之前的版本取消游戏后不删除快照
+    path = tmp_path / f"{game_state.game_id}.json"
+    path.write_text(path.read_text(encoding="utf-8").replace('"status": "waiting"', '"status": "cancelled"'),
+                    encoding="utf-8")
+
+    restored = RecoveryManager(Game(ai_system=None, event_log=EventLog()), snapshot_dir=str(tmp_path))
+
+    assert restored.restore() == []
+    assert not path.exists()
+
+
+def test_ledger_entries_and_settlement_ledgers_survive_a_restart(tmp_path):
+    game_system, game_state = make_system()
+    game_id = game_state.game_id
+    game_state.status = "active"
+    game_system.get_ledger(game_id).transfer("p0", "p1", 5, "settlement")
+    game_system.settlement_ledgers[game_id] = [{"round": 1, "transfers": [["p0", "p1", 5, 1]]}]
+    recovery = RecoveryManager(game_system, snapshot_dir=str(tmp_path))
+    recovery.checkpoint(game_id, "settlement_phase")
+    asyncio.run(recovery.flush())
+
+    restarted = Game(ai_system=None, event_log=EventLog())
+    assert RecoveryManager(restarted, snapshot_dir=str(tmp_path)).restore() == [(game_id, "settlement_phase")]
+
+    ledger = restarted.get_ledger(game_id)
+    assert [entry.reason for entry in ledger.entries] == ["entry_fee", "settlement"]
+    assert ledger.accounts["p0"] == 85 and ledger.accounts["p1"] == 95
+    assert ledger.audit()
+    assert restarted.settlement_ledgers[game_id] == game_system.settlement_ledgers[game_id]
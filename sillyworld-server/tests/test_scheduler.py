@@ -0,0 +1,80 @@
+import asyncio
+
+from scheduler import RoundScheduler
+
+
+def test_rescheduling_invalidates_the_earlier_heap_entry():
+    calls = []
+
+    async def run_round(game_id, start_step):
+        calls.append((game_id, start_step))
+        return False
+
+    async def run():
+        scheduler = RoundScheduler(run_round, round_interval=0.01)
+        scheduler.start()
+        scheduler.schedule("g", delay=0.02)
+        # 重新调度后，0.02秒到期的旧条目不再执行
+        scheduler.schedule("g", "item_phase", delay=0.2)
+        await asyncio.sleep(0.1)
+        early = list(calls)
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return early, scheduler
+
+    early, scheduler = asyncio.run(run())
+
+    assert early == []
+    assert calls == [("g", "item_phase")]
+    assert not scheduler.is_scheduled("g")
+
+
+def test_failed_round_retries_after_the_committed_step():
+    calls = []
+
+    async def run_round(game_id, start_step):
+        calls.append(start_step)
+        if len(calls) == 1:
+            scheduler.checkpoint(game_id, "round_start")
+            scheduler.checkpoint(game_id, "item_phase")
+            raise RuntimeError("LLM timeout")
+        return False
+
+    async def run():
+        scheduler.start()
+        scheduler.schedule("g")
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+
+    scheduler = RoundScheduler(run_round, round_interval=0.01, retry_delay=0.01)
+    asyncio.run(run())
+
+    assert calls == ["round_start", "persuasion_phase"]
+    assert not scheduler.is_scheduled("g")
+
+
+def test_game_is_marked_failed_and_released_after_max_failures():
+    calls = []
+    released = []
+
+    async def run_round(game_id, start_step):
+        calls.append(start_step)
+        raise RuntimeError("boom")
+
+    async def on_failed(game_id):
+        released.append(game_id)
+
+    async def run():
+        scheduler = RoundScheduler(run_round, retry_delay=0.01, max_failures=3, on_failed=on_failed)
+        scheduler.start()
+        scheduler.schedule("g")
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return scheduler.stalled()
+
+    stalled = asyncio.run(run())
+
+    assert len(calls) == 3
+    assert released == ["g"]
+    # 放弃的游戏保留在停滞列表中
+    assert [(game["game_id"], game["state"], game["failures"]) for game in stalled] == [("g", "failed", 3)]
@@ -0,0 +1,131 @@
+from datetime import datetime
+
+from ledger import TokenLedger
+from models import GamePhase, GameState, PersuasionRequest, Player
+from settlement import settle
+
+
+def make_players(**balances):
+    return [Player(id=player_id, name=player_id, prompt="", balance=balance) for player_id, balance in balances.items()]
+
+
+def request(payee, payer, amount):
+    """payer（被说服者）向 payee（发起者）支付 amount 的已接受请求"""
+    return PersuasionRequest(from_player=payee, to_player=payer, amount=amount, message="", accepted=True)
+
+
+def unchanged(payer_id, amount):
+    return amount
+
+
+def test_opposite_payments_are_netted():
+    players = make_players(a=100, b=100)
+    requests = [request("b", "a", 30), request("a", "b", 10)]
+
+    result = settle(players, requests, unchanged)
+
+    assert [(o.payer, o.payee, o.amount, o.gross) for o in result.transfers] == [("a", "b", 20, 30)]
+    assert result.deltas == {"a": -20, "b": 20}
+    assert [p.balance for p in players] == [80, 120]
+    assert all(r.processed for r in requests)
+    assert result.pending == []
+
+
+def test_fully_offset_pair_needs_no_transfer():
+    players = make_players(a=0, b=0)
+    requests = [request("b", "a", 15), request("a", "b", 15)]
+
+    result = settle(players, requests, unchanged)
+
+    assert result.transfers == []
+    assert len(result.offset) == 1
+    assert all(r.processed for r in requests)
+
+
+def test_rejected_netted_obligation_keeps_both_directions_pending():
+    players = make_players(a=5, b=100)
+    a_pays_b = request("b", "a", 30)
+    b_pays_a = request("a", "b", 10)
+
+    result = settle(players, [a_pays_b, b_pays_a], unchanged)
+
+    # a 付不起净额20：整笔义务被拒绝，b -> a 的反向请求也不单独按总额支付
+    assert [(o.payer, o.payee, o.amount) for o in result.rejected] == [("a", "b", 20)]
+    assert result.transfers == []
+    assert result.deltas == {}
+    assert [p.balance for p in players] == [5, 100]
+    assert result.pending == [a_pays_b, b_pays_a]
+    assert not a_pays_b.processed and not b_pays_a.processed
+
+    # 下一回合与新的请求一起重新轧差
+    players[0].balance = 50
+    new = request("a", "b", 5)
+    result = settle(players, result.pending + [new], unchanged)
+
+    assert [(o.payer, o.payee, o.amount) for o in result.transfers] == [("a", "b", 15)]
+    assert result.pending == []
+    assert a_pays_b.processed and b_pays_a.processed and new.processed
+
+
+def test_incoming_funds_do_not_count_towards_balance():
+    players = make_players(a=10, b=0, c=100)
+    requests = [request("b", "c", 50), request("c", "b", 20)]
+
+    result = settle(players, requests, unchanged)
+
+    # c -> b 净额30可以支付，但 b 只能使用结算前的余额0
+    assert [(o.payer, o.payee, o.amount) for o in result.transfers] == [("c", "b", 30)]
+    assert result.rejected == []
+
+    requests = [request("a", "b", 10), request("b", "c", 40)]
+    players = make_players(a=10, b=0, c=100)
+    result = settle(players, requests, unchanged)
+    assert [(o.payer, o.payee) for o in result.transfers] == [("c", "b")]
+    assert [(o.payer, o.payee) for o in result.rejected] == [("b", "a")]
+    assert result.pending == [requests[0]]
+
+
+def test_earliest_request_has_priority_for_the_same_payer():
+    players = make_players(a=25, b=0, c=0)
+    first, second = request("b", "a", 20), request("c", "a", 20)
+
+    result = settle(players, [first, second], unchanged)
+
+    assert [o.payee for o in result.transfers] == ["b"]
+    assert [o.payee for o in result.rejected] == ["c"]
+    assert result.pending == [second]
+
+
+def test_payment_adjustment_applies_to_the_payer_direction():
+    players = make_players(a=100, b=100)
+    halved = lambda payer_id, amount: amount // 2 if payer_id == "a" else amount
+
+    result = settle(players, [request("b", "a", 40)], halved)
+
+    assert [(o.amount, o.gross, o.original) for o in result.transfers] == [(20, 20, 40)]
+
+
+def test_requests_with_eliminated_players_are_dropped():
+    players = make_players(a=100, b=100)
+    players[1].is_active = False
+    dropped = request("b", "a", 10)
+
+    result = settle(players, [dropped], unchanged)
+
+    assert result.transfers == [] and result.rejected == [] and result.pending == []
+    assert not dropped.processed
+
+
+def test_settlement_posts_one_balanced_ledger_entry():
+    players = make_players(a=100, b=100, c=100)
+    game_state = GameState(game_id="g", phase=GamePhase.SETTLEMENT_PHASE, players=players, prize_pool=30,
+                           total_resources=330, start_time=datetime(2025, 1, 1), last_update=datetime(2025, 1, 1))
+    ledger = TokenLedger(game_state)
+    requests = [request("b", "a", 30), request("c", "b", 50), request("a", "c", 5)]
+
+    result = settle(players, requests, unchanged, ledger=ledger)
+
+    assert len(ledger.entries) == 1
+    assert ledger.entries[0].legs == result.deltas
+    assert sum(p.balance for p in players) + game_state.prize_pool == 330
+    assert ledger.audit()
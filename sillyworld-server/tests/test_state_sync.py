@@ -0,0 +1,75 @@
+import random
+
+from state_sync import VersionedState, apply_diff, checksum, diff
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(4 if depth < 3 else 2)
+    if kind == 0:
+        return rng.randrange(100)
+    if kind == 1:
+        return rng.choice(["a", "b", "中文", None, True])
+    if kind == 2:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {rng.choice("wxyz"): random_value(rng, depth + 1) for _ in range(rng.randrange(4))}
+
+
+def test_apply_diff_reproduces_the_new_value():
+    rng = random.Random(7)
+    for _ in range(500):
+        old, new = random_value(rng), random_value(rng)
+        change = diff(old, new)
+        result = old if change is diff(new, new) else apply_diff(old, change)
+        assert result == new
+
+
+def test_diff_describes_only_the_changes():
+    old = {"round": 1, "players": [{"id": "p1", "balance": 90}, {"id": "p2", "balance": 80}], "winner": None}
+    new = {"round": 1, "players": [{"id": "p1", "balance": 85}, {"id": "p2", "balance": 80}, {"id": "p3"}]}
+
+    change = diff(old, new)
+
+    assert change == {
+        "players": {"$list": {"len": 3, "set": {"0": {"balance": 85}}, "append": [{"id": "p3"}]}},
+        "$del": ["winner"],
+    }
+    assert apply_diff(old, change) == new
+    assert old["players"][0]["balance"] == 90
+
+
+def test_checksum_ignores_key_order_and_detects_changes():
+    state = {"b": [1, 2], "a": {"名字": "玩家"}}
+
+    assert checksum(state) == checksum({"a": {"名字": "玩家"}, "b": [1, 2]})
+    assert checksum(state) != checksum({"a": {"名字": "玩家"}, "b": [2, 1]})
+
+
+def test_client_follows_server_versions_and_detects_gaps():
+    server, client = VersionedState(history=4), VersionedState()
+    state = {"round": 0, "pool": 0}
+    assert server.update(state) is None
+    client.load(dict(state), server.seq, server.checksum)
+
+    deltas = []
+    for round_no in range(1, 4):
+        deltas.append(server.update({"round": round_no, "pool": round_no * 10}))
+    assert server.update({"round": 3, "pool": 30}) is None
+
+    assert client.apply_delta(deltas[0])
+    assert not client.apply_delta(deltas[2])  # 缺少版本3
+    for message in server.since(client.seq):
+        assert client.apply_delta(message)
+    assert client.seq == server.seq == 4
+    assert client.state == server.state
+    assert checksum(client.state) == server.checksum == deltas[-1]["checksum"]
+
+
+def test_since_returns_none_when_history_is_exhausted():
+    server = VersionedState(history=2)
+    for round_no in range(6):
+        server.update({"round": round_no})
+
+    assert server.since(server.seq) == []
+    assert server.since(server.seq - 2) is not None
+    assert server.since(1) is None
+    assert server.since(server.seq + 1) is None
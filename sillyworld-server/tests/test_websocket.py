@@ -0,0 +1,192 @@
+import asyncio
+import json
+from datetime import datetime
+
+from models import GameAction
+from projection import player_view
+from websocket import ClientConnection, ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+    def of_type(self, *types):
+        return [message for message in self.sent if message["type"] in types]
+
+
+def action(player_id, action_type="persuade", **fields):
+    return GameAction(player_id=player_id, action_type=action_type, description=action_type,
+                      timestamp=datetime(2025, 1, 1), **fields)
+
+
+def make_manager(**kwargs):
+    kwargs.setdefault("heartbeat_interval", 0)
+    kwargs.setdefault("idle_timeout", 0)
+    return ConnectionManager(**kwargs)
+
+
+def test_actions_within_the_coalesce_window_are_sent_as_one_frame():
+    async def run():
+        manager = make_manager(coalesce_window=0.05)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "g", "observer")
+        for player_id in ("p1", "p2", "p3"):
+            await manager.broadcast_game_action("g", action(player_id))
+        # 窗口结束之前什么都不发送
+        await asyncio.sleep(0.01)
+        before = list(websocket.of_type("game_action", "game_actions"))
+        await asyncio.sleep(0.1)
+        return manager, websocket, before
+
+    manager, websocket, before = asyncio.run(run())
+
+    assert before == []
+    frames = websocket.of_type("game_action", "game_actions")
+    assert [frame["type"] for frame in frames] == ["game_actions"]
+    assert [a["player_id"] for a in frames[0]["data"]] == ["p1", "p2", "p3"]
+    assert frames[0]["cursor"] == 3
+    assert (manager.coalesced_frames, manager.coalesced_actions) == (1, 3)
+
+
+def test_state_broadcast_flushes_pending_actions_first():
+    async def run():
+        manager = make_manager(coalesce_window=10)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "g", "observer")
+        await manager.broadcast_game_action("g", action("p1"))
+        await manager.broadcast_game_end("g", "p1")
+        await asyncio.sleep(0.01)
+        return manager, websocket
+
+    manager, websocket = asyncio.run(run())
+
+    assert [message["type"] for message in websocket.sent if message["type"] != "session"] == ["game_action", "game_end"]
+    # 窗口提前结束后定时发送已取消
+    assert manager._flush_handles == {}
+
+
+def test_coalesced_private_actions_are_projected_per_audience():
+    async def run():
+        manager = make_manager(coalesce_window=0.02)
+        owner, other = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(owner, "g", "p1", view=player_view("p1"))
+        await manager.connect(other, "g", "p2", view=player_view("p2"))
+        await manager.broadcast_game_action("g", action("p1", "buy_item", item_type="shield"))
+        await manager.broadcast_game_action("g", action("p2"))
+        await asyncio.sleep(0.1)
+        return owner, other
+
+    owner, other = asyncio.run(run())
+
+    [owner_frame] = owner.of_type("game_actions")
+    [other_frame] = other.of_type("game_actions")
+    assert [a.get("item_type") for a in owner_frame["data"]] == ["shield", None]
+    assert [a.get("item_type") for a in other_frame["data"]] == [None, None]
+
+
+def test_heartbeat_pings_live_connections_and_reaps_idle_ones():
+    async def run():
+        manager = make_manager(heartbeat_interval=0.02, idle_timeout=0.1)
+        live, idle = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(live, "g", "p1")
+        await manager.connect(idle, "g", "p2")
+        manager.start()
+        for _ in range(10):
+            await asyncio.sleep(0.02)
+            manager.touch("g", "p1")
+        pings = live.of_type("ping")
+        manager.touch("g", "p1", {"type": "pong", "data": {"t": pings[-1]["data"]["t"]}})
+        rtt = manager.active_connections["g"]["p1"].rtt
+        await manager.stop()
+        return manager, live, idle, pings, rtt
+
+    manager, live, idle, pings, rtt = asyncio.run(run())
+
+    assert len(pings) >= 3
+    assert live.closed is None
+    assert idle.closed == (1001, "idle timeout")
+    assert list(manager.active_connections["g"]) == ["p1"]
+    assert manager.closes == {"idle_timeout": 1}
+    assert rtt is not None and rtt >= 0
+
+
+def test_heartbeat_without_idle_timeout_never_reaps():
+    async def run():
+        manager = make_manager(heartbeat_interval=1)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "g", "p1")
+        manager.active_connections["g"]["p1"].last_seen -= 3600
+        reaped = manager.heartbeat()
+        await asyncio.sleep(0.01)
+        return reaped, websocket
+
+    reaped, websocket = asyncio.run(run())
+
+    assert reaped == 0
+    assert len(websocket.of_type("ping")) == 1
+
+
+def test_drop_oldest_keeps_the_newest_messages():
+    connection = ClientConnection(FakeWebSocket(), "g", "p1", max_queue=2, policy="drop_oldest")
+
+    assert all(connection.enqueue("game_action", text) for text in ("a", "b", "c"))
+
+    assert [entry[1] for entry in connection._queue] == ["b", "c"]
+    assert connection.dropped == 1
+
+
+def test_coalesce_replaces_the_queued_state():
+    connection = ClientConnection(FakeWebSocket(), "g", "p1", max_queue=3, policy="coalesce")
+
+    connection.enqueue("game_state", "s1")
+    connection.enqueue("game_action", "a")
+    connection.enqueue("game_state", "s2")
+
+    assert [entry[1] for entry in connection._queue] == ["s2", "a"]
+    assert connection.coalesced == 1
+
+
+def test_disconnect_closes_a_full_connection():
+    async def run():
+        websocket = FakeWebSocket()
+        closed = []
+        connection = ClientConnection(websocket, "g", "p1", max_queue=2, policy="disconnect")
+        connection.on_close = closed.append
+        results = [connection.enqueue("game_action", text) for text in ("a", "b", "c", "d")]
+        await asyncio.sleep(0)
+        return connection, websocket, closed, results
+
+    connection, websocket, closed, results = asyncio.run(run())
+
+    assert results == [True, True, False, False]
+    assert connection.close_reason == "slow_consumer"
+    assert closed == [connection]
+    assert websocket.closed == (1013, "slow consumer")
+
+
+def test_writer_sends_queued_messages_in_order():
+    async def run():
+        websocket = FakeWebSocket()
+        connection = ClientConnection(websocket, "g", "p1")
+        for index in range(3):
+            connection.enqueue("game_action", json.dumps({"type": "game_action", "data": index}))
+        connection.start()
+        await asyncio.sleep(0.01)
+        connection.close()
+        return connection, websocket
+
+    connection, websocket = asyncio.run(run())
+
+    assert [message["data"] for message in websocket.sent] == [0, 1, 2]
+    assert connection.sent == 3
@@ -1,204 +1,755 @@
-from typing import Dict, Set, List, Optional, Any
+from typing import Dict, Set, List, Optional, Any, Callable, Deque, Tuple
+from collections import deque
 import json
+import time
 from fastapi import WebSocket
 from models import GameState, Player, GameAction, GamePhase
 from datetime import datetime
-from enum import Enum
 import asyncio
+from clock import Clock, SystemClock
+from encoder import MessageEncoder, dumps, MSGPACK_PROTOCOL
+from pubsub import PubSub
+from state_sync import VersionedState, ActionHistory, compact
+from projection import (ADMIN_VIEW, PUBLIC_VIEW, PRIVATE_ACTION_FIELDS, audience_filter, is_private,
+                        player_view, project_state, redact_action)
+from spectators import SpectatorHub, new_session_id
 from llm_client import get_llm_client, get_prompt_manager, create_example_templates
 from game_record import GameRecord
 
-# 自定义JSON编码器，处理datetime对象
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super(DateTimeEncoder, self).default(obj)
-
-class EnhancedJSONEncoder(json.JSONEncoder):
-    """扩展JSON编码器，处理自定义类型"""
-    def default(self, obj):
-        if isinstance(obj, Enum):
-            # 将枚举类型转换为它的值
-            return obj.value
-        elif isinstance(obj, datetime):
-            # 将datetime对象转换为ISO格式字符串
-            return obj.isoformat()
-        # 让默认编码器处理其他类型
-        return super(EnhancedJSONEncoder, self).default(obj)
-
-def serialize_for_json(obj):
-    """将对象序列化为JSON安全的形式"""
-    if isinstance(obj, dict):
-        return {k: serialize_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [serialize_for_json(item) for item in obj]
-    elif isinstance(obj, Enum):
-        return obj.value
-    elif isinstance(obj, datetime):
-        return obj.isoformat()
-    elif hasattr(obj, "dict") and callable(getattr(obj, "dict")):
-        # 处理Pydantic模型
-        return serialize_for_json(obj.dict())
-    else:
-        return obj
+# 慢消费者策略：发送队列满时的处理方式
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+# 服务端主动断开时的关闭码
+CLOSE_CODES = {
+    "slow_consumer": (1013, "slow consumer"),
+    "replaced": (1000, "session replaced"),
+    "idle_timeout": (1001, "idle timeout"),
+}
+
+
+class ClientConnection:
+    """一个WebSocket连接及其有界发送队列
+
+    广播只把消息放入队列（O(1)），由该连接自己的写任务按顺序发送，
+    一个慢速或半断开的客户端不会拖慢其他客户端和游戏循环。
+    """
+
+    def __init__(self, websocket: WebSocket, game_id: str, player_id: str,
+                 max_queue: int = 256, policy: str = "drop_oldest",
+                 packer: Optional[Callable[[str], bytes]] = None, view: str = PUBLIC_VIEW):
+        """
+        Args:
+            packer: 二进制协议的连接把JSON消息转换为二进制帧，为None时发送JSON文本帧
+            view: 连接的视图（见 projection.py），决定收到哪些投影
+        """
+        self.websocket = websocket
+        self.game_id = game_id
+        self.player_id = player_id
+        self.view = view
+        # 观众连接的会话ID，玩家连接为None
+        self.session_id: Optional[str] = None
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.packer = packer
+        # 队列元素: [消息类型, 编码后的消息文本, 入队时间]
+        self._queue: Deque[List[Any]] = deque()
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        self.on_close: Optional[Callable[["ClientConnection"], None]] = None
+
+        self.connected_at = time.perf_counter()
+        # 最后一次收到客户端消息（包括心跳回复）的时间
+        self.last_seen = self.connected_at
+        self.rtt: Optional[float] = None
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.lag_total = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        """启动写任务"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, message_type: str, message: str) -> bool:
+        """放入一条待发送消息，按慢消费者策略处理队列已满的情况
+
+        Returns:
+            bool: 连接是否仍然可用
+        """
+        if self.closed:
+            return False
+        now = time.perf_counter()
+        if self.policy == "coalesce" and message_type == "game_state":
+            # 只保留最新的状态：替换队列中尚未发送的旧状态
+            for entry in self._queue:
+                if entry[0] == "game_state":
+                    entry[1] = message
+                    self.coalesced += 1
+                    return True
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                print(f"【警告/WebSocket】发送队列已满，断开慢速连接: 游戏ID={self.game_id}, 玩家ID={self.player_id}")
+                self.close("slow_consumer")
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append([message_type, message, now])
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._ready.set()
+        return True
+
+    def close(self, reason: str = "disconnected"):
+        """停止写任务并从管理器中移除
+
+        Args:
+            reason: disconnected(客户端断开) / send_failed(发送失败) / slow_consumer(队列已满) /
+                replaced(同一会话建立了新连接) / idle_timeout(心跳超时)
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        self._queue.clear()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if self.on_close:
+            self.on_close(self)
+        if reason in CLOSE_CODES:
+            # 主动断开客户端（客户端已失联时忽略错误）
+            asyncio.ensure_future(self._close_socket(*CLOSE_CODES[reason]))
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _write_loop(self):
+        while not self.closed:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            message_type, message, enqueued_at = self._queue.popleft()
+            try:
+                await self.send(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"【错误/WebSocket】发送{message_type}时出错，移除连接: 游戏ID={self.game_id}, 玩家ID={self.player_id}, 错误={e}")
+                self.close("send_failed")
+                return
+            lag = time.perf_counter() - enqueued_at
+            self.sent += 1
+            self.lag_total += lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def touch(self, rtt: Optional[float] = None):
+        """收到客户端消息"""
+        self.last_seen = time.perf_counter()
+        if rtt is not None:
+            self.rtt = rtt
+
+    async def send(self, message: str):
+        """按连接协商的编码发送一条消息"""
+        if self.packer is not None:
+            await self.websocket.send_bytes(self.packer(message))
+        else:
+            await self.websocket.send_text(message)
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = self._queue[0][2] if self._queue else None
+        return {
+            "game_id": self.game_id,
+            "player_id": self.player_id,
+            "session_id": self.session_id,
+            "view": self.view,
+            "protocol": "msgpack" if self.packer is not None else "json",
+            "policy": self.policy,
+            "queue_depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            # 队首消息已等待的时间，即当前滞后
+            "lag": round(time.perf_counter() - oldest, 4) if oldest is not None else 0.0,
+            "avg_lag": round(self.lag_total / self.sent, 4) if self.sent else 0.0,
+            "max_lag": round(self.max_lag, 4),
+            "idle": round(time.perf_counter() - self.last_seen, 3),
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+        }
+
 
 class ConnectionManager:
-    def __init__(self):
-        # 存储所有活跃连接
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
-        # 存储玩家ID到WebSocket的映射
-        self.player_connections: Dict[str, WebSocket] = {}
-        # 游戏活动日志
-        self.game_logs: Dict[str, List[Dict[str, Any]]] = {}
-
-    async def connect(self, websocket: WebSocket, game_id: str, player_id: str):
+    def __init__(self, max_queue: int = 256, policy: str = "drop_oldest",
+                 encoder: Optional[MessageEncoder] = None, history_size: int = 500,
+                 replay_batch: int = 100, coalesce_window: float = 0.0,
+                 spectator_shard_size: int = 256, bus: Optional[PubSub] = None,
+                 heartbeat_interval: float = 15.0, idle_timeout: float = 45.0,
+                 clock: Optional[Clock] = None):
+        """初始化连接管理器
+
+        Args:
+            max_queue: 每个连接的发送队列长度上限
+            policy: 慢消费者策略 drop_oldest / coalesce / disconnect
+            encoder: 消息编码器，每条广播只编码一次
+            history_size: 每局游戏保留的最近动作数（环形缓冲区）
+            replay_batch: 补发历史动作时每帧合并的动作数
+            coalesce_window: 动作合并窗口(秒)，大于0时窗口内产生的动作合并为一个 game_actions 帧发送
+            spectator_shard_size: 每个观众分片的连接数，每个分片由自己的任务分发消息
+            bus: 发布/订阅总线，广播经总线投递给本进程及其他进程的连接
+            heartbeat_interval: 向每个连接发送心跳(ping)的间隔(秒)，0为不发送
+            idle_timeout: 超过该时间没有收到客户端任何消息（包括pong）的连接被断开，0为不断开
+            clock: 消息时间戳使用的时钟，与游戏使用同一个时钟
+        """
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.clock = clock or SystemClock()
+        self.encoder = encoder or MessageEncoder()
+        # 存储所有活跃的玩家连接: 游戏ID -> 玩家ID -> 连接（不同游戏可以使用相同的玩家ID）
+        self.active_connections: Dict[str, Dict[str, ClientConnection]] = {}
+        # 每局游戏的观众（按会话ID区分，分片分发）
+        self.spectator_shard_size = spectator_shard_size
+        self.spectators: Dict[str, SpectatorHub] = {}
+        # 每局游戏最近动作的环形缓冲区（编码后的动作内容）
+        self.history_size = history_size
+        self.replay_batch = max(1, replay_batch)
+        self.game_logs: Dict[str, ActionHistory] = {}
+        # 每局游戏每个视图带版本号的状态，广播时只发送差异
+        self.state_versions: Dict[str, Dict[str, VersionedState]] = {}
+        # 每局游戏最近一次广播的完整状态（JSON形式），新视图的连接从它投影出第一个版本
+        self._latest_states: Dict[str, Dict[str, Any]] = {}
+        # 因队列已满被断开的连接数
+        self.slow_disconnects = 0
+        # 动作合并：每局游戏等待发送的动作（ActionHistory的元素）以及定时发送的句柄
+        self.coalesce_window = coalesce_window
+        self._pending_actions: Dict[str, List[List[Any]]] = {}
+        self._flush_handles: Dict[str, asyncio.TimerHandle] = {}
+        self.coalesced_frames = 0
+        self.coalesced_actions = 0
+        self.bus = bus
+        if bus is not None:
+            bus.subscribe(self._on_bus_message)
+        # 心跳与空闲连接回收
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self._reaper: Optional[asyncio.Task] = None
+        # 连接变动统计：建立数、按原因的断开数、最近一分钟的建立/断开时间
+        self.connects = 0
+        self.closes: Dict[str, int] = {}
+        self.lifetime_total = 0.0
+        self._recent_connects: Deque[float] = deque()
+        self._recent_closes: Deque[float] = deque()
+
+    def start(self):
+        """启动心跳和空闲连接回收任务"""
+        if self._reaper is None and (self.heartbeat_interval > 0 or self.idle_timeout > 0):
+            self._reaper = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+
+    async def _heartbeat_loop(self):
+        # 没有心跳时按空闲超时的一部分间隔检查
+        interval = self.heartbeat_interval if self.heartbeat_interval > 0 else max(1.0, self.idle_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"【错误/WebSocket】心跳检查出错: {e}")
+
+    def heartbeat(self) -> int:
+        """断开空闲超时的连接，并向其余连接发送心跳，返回断开的连接数"""
+        now = time.perf_counter()
+        ping = None
+        if self.heartbeat_interval > 0:
+            ping = self.encoder.encode("ping", {"t": int(time.time() * 1000)})
+        reaped = 0
+        # 先取快照，遍历过程中断开连接不会影响迭代
+        for connection in list(self._all_connections()):
+            if self.idle_timeout > 0 and now - connection.last_seen > self.idle_timeout:
+                print(f"【警告/WebSocket】连接空闲超时，断开: 游戏ID={connection.game_id}, 玩家ID={connection.player_id}, "
+                      f"会话ID={connection.session_id}, 空闲={now - connection.last_seen:.1f}s")
+                connection.close("idle_timeout")
+                reaped += 1
+            elif ping is not None:
+                connection.enqueue("ping", ping)
+        return reaped
+
+    def touch(self, game_id: str, player_id: str, message: Optional[Dict[str, Any]] = None):
+        """收到客户端消息时调用；心跳回复(pong)同时记录往返时间"""
+        connection = self._find(game_id, player_id)
+        if connection is None:
+            return
+        rtt = None
+        if message is not None and message.get("type") == "pong":
+            sent_at = (message.get("data") or {}).get("t")
+            if isinstance(sent_at, (int, float)):
+                rtt = max(0.0, time.time() - sent_at / 1000)
+        connection.touch(rtt)
+
+    def _all_connections(self):
+        for connections in list(self.active_connections.values()):
+            yield from list(connections.values())
+        for hub in list(self.spectators.values()):
+            yield from list(hub.connections())
+
+    async def connect(self, websocket: WebSocket, game_id: str, player_id: str,
+                      state_version: Optional[int] = None, cursor: Optional[int] = None,
+                      session_id: Optional[str] = None, protocol: Optional[str] = None,
+                      view: Optional[str] = None) -> str:
+        """接受连接，发送当前状态和缺失的动作
+
+        Args:
+            player_id: 玩家ID，观众为 "observer"
+            state_version: 客户端已有的状态版本（重连时），可补齐时只发送缺失的差异
+            cursor: 客户端收到的最后一个动作的游标（重连时），可补齐时只发送之后的动作
+            session_id: 观众重连时带上的会话ID，未提供时分配新的会话ID
+            protocol: 协商出的WebSocket子协议（见 encoder.negotiate_protocol），None为JSON
+            view: 连接的视图（见 projection.connection_view），未提供时观众为公开视图，玩家为本人视图
+
+        Returns:
+            str: 连接的标识，玩家为玩家ID，观众为会话ID
+        """
         try:
             print(f"尝试接受WebSocket连接: 游戏ID={game_id}, 玩家ID={player_id}")
-            await websocket.accept()
-            print(f"WebSocket连接已接受")
-            if game_id not in self.active_connections:
-                self.active_connections[game_id] = {}
-            self.active_connections[game_id][player_id] = websocket
+            await websocket.accept(subprotocol=protocol)
+            print(f"WebSocket连接已接受: 协议={protocol or 'json'}")
+            packer = self.encoder.pack if protocol == MSGPACK_PROTOCOL else None
+            if view is None:
+                view = PUBLIC_VIEW if player_id == "observer" else player_view(player_id)
+            view = self._serve_view(game_id, view)
+            connection = ClientConnection(websocket, game_id, player_id, self.max_queue, self.policy, packer, view)
+            connection.on_close = self._on_connection_closed
+            # 合并窗口中的动作已在缓冲区中，先发给已有连接，避免新连接重复收到
+            self._flush_actions(game_id)
+            # 先生成补发消息再注册，之后的广播进入该连接的发送队列，不会重复或遗漏
+            history = self._resume_messages(game_id, view, state_version, cursor)
             
-            # 特殊处理observer连接，不添加到player_connections
-            if player_id != "observer":
-                self.player_connections[player_id] = websocket
-                print(f"WebSocket玩家连接已注册: 游戏ID={game_id}, 玩家ID={player_id}")
+            # observer连接进入观众中心，每个观众有自己的会话ID，不添加到active_connections
+            if player_id == "observer":
+                key = connection.session_id = session_id or new_session_id()
+                history.insert(0, self.encoder.encode("session", {"session_id": key}))
+                hub = self.spectators.get(game_id)
+                if hub is None:
+                    hub = self.spectators[game_id] = SpectatorHub(game_id, self.spectator_shard_size)
+                previous = hub.add(key, connection)
+                if previous is not None:
+                    # 同一会话的旧连接（通常已失联）
+                    previous.close("replaced")
+                print(f"WebSocket观察者连接已注册: 游戏ID={game_id}, 会话ID={key}, 观众数={len(hub)}")
             else:
-                print(f"WebSocket观察者连接已注册: 游戏ID={game_id}")
-            
-            print(f"WebSocket连接已注册到管理器: 游戏ID={game_id}, 玩家ID={player_id}")
-
-            # 发送历史日志
-            if game_id in self.game_logs:
-                for log in self.game_logs[game_id]:
-                    try:
-                        await websocket.send_json(log)
-                    except Exception as e:
-                        print(f"【错误/WebSocket】发送历史日志时出错: {e}")
+                key = player_id
+                if game_id not in self.active_connections:
+                    self.active_connections[game_id] = {}
+                previous = self.active_connections[game_id].get(player_id)
+                self.active_connections[game_id][player_id] = connection
+                if previous is not None:
+                    # 同一玩家的旧连接，之前会一直留在写任务中直到发送失败
+                    previous.close("replaced")
+                print(f"WebSocket玩家连接已注册: 游戏ID={game_id}, 玩家ID={player_id}")
+
+            # 发送补发消息（只等待这个新连接自己），然后启动写任务
+            for log in history:
+                try:
+                    await connection.send(log)
+                except Exception as e:
+                    print(f"【错误/WebSocket】发送历史日志时出错: {e}")
+                    break
+            self.connects += 1
+            self._recent_connects.append(time.perf_counter())
+            connection.start()
+            return key
         except Exception as e:
             print(f"WebSocket连接管理器错误: {e}")
             import traceback
             traceback.print_exc()
             raise
 
-    def disconnect(self, game_id: str, player_id: str):
-        if game_id in self.active_connections:
-            if player_id in self.player_connections:
-                del self.active_connections[game_id][player_id]
-                if not self.active_connections[game_id]:
-                    del self.active_connections[game_id]
+    def disconnect(self, game_id: str, player_id: str, websocket: Optional[WebSocket] = None):
+        """移除连接；指定websocket时只在它仍是当前注册的连接时移除
 
-    async def broadcast_game_state(self, game_id: str, game_state: GameState):
-        """广播游戏状态到所有连接的客户端"""
-        if game_id in self.active_connections:
-            try:
-                # 使用自定义方法序列化GameState
-                state_dict = serialize_for_json(game_state.__dict__)
-                
-                message = {
-                    "type": "game_state",
-                    "data": state_dict
-                }
-                
-                print(f"【调试/WebSocket】准备广播游戏状态: 游戏ID={game_id}, 连接数={len(self.active_connections[game_id])}, 回合={game_state.current_round}, 阶段={game_state.phase}")
-                
-                if len(self.active_connections[game_id]) == 0:
-                    print(f"【警告/WebSocket】没有活跃的WebSocket连接，游戏状态更新可能不会实时显示: 游戏ID={game_id}")
-                
-                # 创建一个失败连接列表，用于跟踪需要移除的连接
-                failed_connections = []
-                success_count = 0
-                
-                for connection in self.active_connections[game_id].values():
-                    try:
-                        await connection.send_json(message)
-                        success_count += 1
-                        print(f"【调试/WebSocket】已发送游戏状态到WebSocket连接 #{success_count}")
-                    except Exception as e:
-                        print(f"【错误/WebSocket】发送游戏状态时出错: {e}")
-                        failed_connections.append(connection)
-                
-                # 移除失败的连接
-                for failed in failed_connections:
-                    self.active_connections[game_id].discard(failed)
-                    print(f"【调试/WebSocket】移除失败的WebSocket连接")
-                
-                if failed_connections:
-                    print(f"【警告/WebSocket】移除了 {len(failed_connections)} 个失败的连接，剩余 {len(self.active_connections[game_id])} 个连接")
-                
-                return success_count > 0  # 返回是否至少有一个连接成功
-            except Exception as e:
-                print(f"【错误/WebSocket】广播游戏状态时出错: {e}")
-                import traceback
-                traceback.print_exc()
-                return False
+        Args:
+            player_id: connect 返回的连接标识（玩家ID或观众会话ID）
+        """
+        connection = self._find(game_id, player_id)
+        if connection is None or (websocket is not None and connection.websocket is not websocket):
+            return
+        connection.close()
+
+    def sync_state(self, game_id: str, player_id: str, state_version: Optional[int]):
+        """客户端发现版本缺失或校验和不一致时请求同步：回复缺失的差异或完整状态"""
+        connection = self._find(game_id, player_id)
+        if connection is None:
+            return
+        messages = self._state_sync_messages(game_id, connection.view, state_version)
+        print(f"【调试/WebSocket】状态同步: 游戏ID={game_id}, 玩家ID={player_id}, 视图={connection.view}, 客户端版本={state_version}, 消息数={len(messages)}")
+        for message in messages:
+            connection.enqueue("state_sync", message)
+
+    def _serve_view(self, game_id: str, view: str) -> str:
+        """准备视图的状态版本，返回实际提供给连接的视图
+
+        本进程只有其他进程广播的状态（公开和管理员视图）时，玩家视图退回公开视图。
+        """
+        views = self.state_versions.setdefault(game_id, {})
+        if view in views:
+            return view
+        latest = self._latest_states.get(game_id)
+        if latest is None and views:
+            return view if view == ADMIN_VIEW and ADMIN_VIEW in views else PUBLIC_VIEW
+        versions = views[view] = VersionedState()
+        if latest is not None:
+            versions.update(project_state(latest, view))
+        return view
+
+    def _resume_messages(self, game_id: str, view: str, state_version: Optional[int],
+                         cursor: Optional[int]) -> List[str]:
+        """新连接需要的消息：视图的状态（差异或检查点）以及之后的动作（按批合并）"""
+        history = self.game_logs.get(game_id)
+        actions = history.since(cursor) if history is not None and cursor is not None else None
+        if actions is not None:
+            # 游标仍在缓冲区内：状态按版本补齐，动作只补发缺失部分
+            messages = self._state_sync_messages(game_id, view, state_version)
         else:
+            # 新观众或游标已被覆盖：检查点状态 + 检查点之后的动作
+            messages = self._state_sync_messages(game_id, view, None)
+            actions = []
+            if history is not None:
+                # 检查点之后的动作也已被部分覆盖时，只能补发缓冲区中仍有的部分
+                actions = history.since(history.checkpoint_cursor or 0) or history.since(history.cursor - self.history_size) or []
+        for start in range(0, len(actions), self.replay_batch):
+            batch = actions[start:start + self.replay_batch]
+            # 只收到了完整内容而该视图不可见的动作跳过
+            texts = [text for text in (ActionHistory.text_for(entry, view) for entry in batch) if text is not None]
+            if texts:
+                messages.append(self.encoder.frame("game_actions", f"[{','.join(texts)}]", cursor=batch[-1][0]))
+        return messages
+
+    def _state_sync_messages(self, game_id: str, view: str, state_version: Optional[int]) -> List[str]:
+        """把视图的客户端从state_version补齐到最新版本所需的消息（编码后）"""
+        versions = self.state_versions.get(game_id, {}).get(view)
+        if versions is None or versions.state is None:
+            return []
+        deltas = versions.since(state_version) if state_version is not None else None
+        if deltas is not None:
+            return [self.encoder.encode("state_delta", delta) for delta in deltas]
+        return [self.encoder.encode("game_state", versions.state, seq=versions.seq, checksum=versions.checksum)]
+
+    def _on_connection_closed(self, connection: ClientConnection):
+        # 所有断开（客户端断开、发送失败、慢消费者、被替换、空闲超时）都经过这里
+        if connection.close_reason == "slow_consumer":
+            self.slow_disconnects += 1
+        reason = connection.close_reason or "disconnected"
+        self.closes[reason] = self.closes.get(reason, 0) + 1
+        now = time.perf_counter()
+        self.lifetime_total += now - connection.connected_at
+        self._recent_closes.append(now)
+        self._remove(connection)
+
+    def _find(self, game_id: str, key: str) -> Optional[ClientConnection]:
+        connection = self.active_connections.get(game_id, {}).get(key)
+        if connection is None and game_id in self.spectators:
+            connection = self.spectators[game_id].get(key)
+        return connection
+
+    def audience(self, game_id: str) -> int:
+        """游戏的连接数（玩家和观众）"""
+        hub = self.spectators.get(game_id)
+        return len(self.active_connections.get(game_id, {})) + (len(hub) if hub is not None else 0)
+
+    def _remove(self, connection: ClientConnection):
+        if connection.session_id is not None:
+            hub = self.spectators.get(connection.game_id)
+            if hub is not None:
+                hub.remove(connection.session_id, connection)
+                if not len(hub):
+                    hub.close()
+                    del self.spectators[connection.game_id]
+            return
+        connections = self.active_connections.get(connection.game_id)
+        if connections and connections.get(connection.player_id) is connection:
+            del connections[connection.player_id]
+            if not connections:
+                del self.active_connections[connection.game_id]
+
+    def _has_audience(self, game_id: str) -> bool:
+        """是否需要广播：本进程有连接，或总线连接了其他进程（观众可能在其他进程）"""
+        return (self.bus is not None and self.bus.shared) or self.audience(game_id) > 0
+
+    def _fan_out(self, game_id: str, message_type: str, message: str, audience: str = "all") -> int:
+        """广播编码后的消息，返回本进程仍可用的连接数
+
+        有总线时发布到总线，由各进程的订阅回调投递给自己的连接。
+
+        Args:
+            audience: 受众（见 projection.py），只有视图属于受众的连接收到
+        """
+        if self.bus is not None:
+            self.bus.publish(game_id, message_type, message, audience)
+            return self.audience(game_id)
+        return self._deliver_local(game_id, message_type, message, audience)
+
+    def _on_bus_message(self, game_id: str, message_type: str, message: str, audience: str, remote: bool):
+        if remote:
+            self._mirror(game_id, message_type, message, audience)
+        self._deliver_local(game_id, message_type, message, audience)
+
+    def _mirror(self, game_id: str, message_type: str, message: str, audience: str):
+        """记录其他进程广播的状态和动作，使连到本进程的新观众也能补齐
+
+        状态只记录公开和管理员视图；动作记录公开内容，以及管理员和本人收到的私密动作的完整内容。
+        """
+        if message_type not in ("game_state", "state_delta", "game_action", "game_actions"):
+            return
+        if message_type in ("game_action", "game_actions"):
+            if audience == "all" or audience.startswith("others:"):
+                private = False
+            elif audience == ADMIN_VIEW or audience.startswith("owner:"):
+                private = True
+            else:
+                return
+            frame = json.loads(message)
+            history = self._history(game_id)
+            actions = [frame["data"]] if message_type == "game_action" else frame["data"]
+            first = frame["cursor"] - len(actions) + 1
+            for offset, action in enumerate(actions):
+                if not private:
+                    history.record(first + offset, data_text=dumps(action))
+                elif any(action.get(field) is not None for field in PRIVATE_ACTION_FIELDS.get(action.get("action_type"), ())):
+                    history.record(first + offset, private_text=dumps(action), owner=action["player_id"])
+        else:
+            if audience not in (PUBLIC_VIEW, ADMIN_VIEW):
+                return
+            frame = json.loads(message)
+            history = self._history(game_id)
+            views = self.state_versions.setdefault(game_id, {})
+            versions = views.get(audience)
+            if versions is None:
+                versions = views[audience] = VersionedState()
+            if message_type == "game_state":
+                versions.load(frame["data"], frame["seq"], frame["checksum"])
+            elif not versions.apply_delta(frame["data"]):
+                # 本进程加入总线之前错过了完整状态，等待之后的完整状态
+                print(f"【警告/WebSocket】总线状态版本不连续，无法记录: 游戏ID={game_id}, 视图={audience}, 本地版本={versions.seq}, 差异基于={frame['data']['base']}")
+                return
+            history.checkpoint()
+
+    def _deliver_local(self, game_id: str, message_type: str, message: str, audience: str = "all") -> int:
+        """把编码后的消息放入本进程游戏中属于受众的连接的发送队列（共享同一份文本），返回仍可用的连接数
+
+        玩家连接直接入队，观众由观众中心的各个分片分发。
+        """
+        accept = audience_filter(audience)
+        delivered = 0
+        for connection in list(self.active_connections.get(game_id, {}).values()):
+            if accept is not None and not accept(connection.view):
+                continue
+            if connection.enqueue(message_type, message):
+                delivered += 1
+        hub = self.spectators.get(game_id)
+        # 观众中心中没有玩家视图的连接
+        if hub is not None and not audience.startswith("player:"):
+            delivered += hub.publish(message_type, message, accept)
+        return delivered
+
+    async def broadcast_game_state(self, game_id: str, game_state: GameState):
+        """广播游戏状态到所有连接的客户端
+
+        每个视图（公开、管理员、各玩家本人）有自己的版本序列：第一次广播发送带版本号的完整状态，
+        之后只发送与上一版本的差异（state_delta）。每个视图的投影只计算和编码一次。
+        没有连接时也会记录版本，之后连接的客户端直接收到最新的完整状态。
+        """
+        full = self._latest_states[game_id] = compact(game_state)
+        views = self.state_versions.setdefault(game_id, {})
+        views.setdefault(PUBLIC_VIEW, VersionedState())
+        if self.bus is not None and self.bus.shared:
+            # 其他进程的管理员连接依赖总线上的管理员视图
+            views.setdefault(ADMIN_VIEW, VersionedState())
+        updates = []
+        for view, versions in list(views.items()):
+            first = versions.state is None
+            updates.append((view, versions, first, versions.update(project_state(full, view))))
+        # 状态之前产生的动作先发出，保持动作与状态的先后顺序
+        self._flush_actions(game_id)
+        # 新观众从这个状态开始，只需补发之后的动作
+        self._history(game_id).checkpoint()
+        if not self._has_audience(game_id):
             print(f"【警告/WebSocket】没有找到游戏的WebSocket连接: 游戏ID={game_id}")
             return False
+        try:
+            success_count = 0
+            for view, versions, first, delta in updates:
+                # 每个视图只编码一次，该视图的所有连接共享编码结果
+                if first:
+                    message_type = "game_state"
+                    message = self.encoder.encode("game_state", versions.state, seq=versions.seq, checksum=versions.checksum)
+                elif delta is not None:
+                    message_type = "state_delta"
+                    message = self.encoder.encode("state_delta", delta)
+                else:
+                    # 该视图的状态没有变化
+                    continue
+
+                print(f"【调试/WebSocket】准备广播游戏状态: 游戏ID={game_id}, 视图={view}, 连接数={self.audience(game_id)}, 版本={versions.seq}, 类型={message_type}, 长度={len(message)}")
+
+                success_count = max(success_count, self._fan_out(game_id, message_type, message, audience=view))
+            return success_count > 0  # 返回是否至少有一个连接可用
+        except Exception as e:
+            print(f"【错误/WebSocket】广播游戏状态时出错: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    def forget(self, game_id: str):
+        """游戏结束或取消后释放它的状态版本、最近状态和动作缓冲区
 
-    async def send_personal_message(self, player_id: str, message: dict):
-        if player_id in self.player_connections:
-            await self.player_connections[player_id].send_json(message)
+        合并窗口中尚未发送的动作先发出；已有的连接保持不变，之后连接的客户端不再补齐状态和动作。
+        """
+        self._flush_actions(game_id)
+        self.state_versions.pop(game_id, None)
+        self._latest_states.pop(game_id, None)
+        self.game_logs.pop(game_id, None)
+
+    async def send_personal_message(self, game_id: str, player_id: str, message: dict):
+        """只发给该游戏中该玩家的连接"""
+        connection = self.active_connections.get(game_id, {}).get(player_id)
+        if connection is not None:
+            connection.enqueue(message.get("type", "message"), self.encoder.encode_message(message))
 
     async def broadcast_game_action(self, game_id: str, action: GameAction):
-        if game_id in self.active_connections:
-            # 使用自定义方法序列化Pydantic模型
-            action_dict = serialize_for_json(action.__dict__)
-            
-            message = {
-                "type": "game_action",
-                "data": action_dict
-            }
-            
-            # 记录到游戏日志
-            if game_id not in self.game_logs:
-                self.game_logs[game_id] = []
-            self.game_logs[game_id].append(message)
-            
-            # 广播到所有连接
-            disconnected_players = []
-            for player_id, connection in self.active_connections[game_id].items():
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"【错误/WebSocket】发送游戏动作时出错: {e}")
-                    disconnected_players.append(player_id)
-            
-            # 清理断开的连接
-            for player_id in disconnected_players:
-                self.disconnect(game_id, player_id)
-            
-            return len(self.active_connections.get(game_id, {})) > 0
-        return False
+        # 只编码一次，所有连接和历史缓冲区共享编码结果；私密动作另外编码一份公开投影
+        private = is_private(action)
+        data_text = self.encoder.encode_data("game_action", redact_action(action) if private else action)
+        private_text = self.encoder.encode_data("game_action", action) if private else None
+        owner = action.player_id if private else None
+
+        # 记录到环形缓冲区（没有连接时也记录，供之后连接的观众补齐本回合）
+        history = self._history(game_id)
+        cursor = history.append(data_text, private_text, owner)
+        if not self._has_audience(game_id):
+            return False
+        if self.coalesce_window > 0:
+            # 合并模式：窗口结束时与同一窗口内的其他动作一起发送
+            self._pending_actions.setdefault(game_id, []).append([cursor, data_text, private_text, owner])
+            if game_id not in self._flush_handles:
+                self._flush_handles[game_id] = asyncio.get_running_loop().call_later(
+                    self.coalesce_window, self._flush_actions, game_id
+                )
+            return True
+        if private:
+            # 本人和管理员收到完整内容，其他连接收到公开投影
+            self._fan_out(game_id, "game_action", self.encoder.frame("game_action", private_text, cursor=cursor),
+                          audience=f"owner:{owner}")
+            return self._fan_out(game_id, "game_action", self.encoder.frame("game_action", data_text, cursor=cursor),
+                                 audience=f"others:{owner}") > 0
+        message = self.encoder.frame("game_action", data_text, cursor=cursor)
+        
+        # 放入所有连接的发送队列
+        return self._fan_out(game_id, "game_action", message) > 0
 
     async def broadcast_game_end(self, game_id: str, winner_id: str):
         """广播游戏结束消息"""
-        message = {
-            "type": "game_end",
-            "data": {
-                "winner_id": winner_id,
-                "timestamp": datetime.now().isoformat()
-            }
+        self._flush_actions(game_id)
+        message = self.encoder.encode("game_end", {
+            "winner_id": winner_id,
+            "timestamp": self.clock.now()
+        })
+        return self._fan_out(game_id, "game_end", message) > 0
+
+    def _flush_actions(self, game_id: str):
+        """把合并窗口中的动作作为一个帧发给所有连接
+
+        窗口中有私密动作时按受众分别组帧：其他连接收到公开投影，每个所属玩家和管理员收到各自可见的完整内容。
+        """
+        handle = self._flush_handles.pop(game_id, None)
+        if handle is not None:
+            handle.cancel()
+        pending = self._pending_actions.pop(game_id, None)
+        if not pending:
+            return
+        owners = sorted({entry[3] for entry in pending if entry[2] is not None})
+        if not owners:
+            self._fan_out(game_id, *self._actions_frame(pending, PUBLIC_VIEW))
+        else:
+            self._fan_out(game_id, *self._actions_frame(pending, PUBLIC_VIEW), audience=f"others:{','.join(owners)}")
+            for view in [player_view(owner) for owner in owners] + [ADMIN_VIEW]:
+                self._fan_out(game_id, *self._actions_frame(pending, view), audience=view)
+        if len(pending) > 1:
+            self.coalesced_frames += 1
+            self.coalesced_actions += len(pending)
+
+    def _actions_frame(self, entries: List[List[Any]], view: str) -> Tuple[str, str]:
+        """动作（ActionHistory的元素）在视图下的帧：单个动作为 game_action，多个为 game_actions"""
+        cursor = entries[-1][0]
+        if len(entries) == 1:
+            return "game_action", self.encoder.frame("game_action", ActionHistory.text_for(entries[0], view), cursor=cursor)
+        texts = ",".join(ActionHistory.text_for(entry, view) for entry in entries)
+        return "game_actions", self.encoder.frame("game_actions", f"[{texts}]", cursor=cursor)
+
+    def _history(self, game_id: str) -> ActionHistory:
+        history = self.game_logs.get(game_id)
+        if history is None:
+            history = self.game_logs[game_id] = ActionHistory(self.history_size)
+        return history
+
+    def _churn_stats(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        for recent in (self._recent_connects, self._recent_closes):
+            while recent and now - recent[0] > 60:
+                recent.popleft()
+        closed = sum(self.closes.values())
+        rtts = [c.rtt for c in self._all_connections() if c.rtt is not None]
+        return {
+            "connects": self.connects,
+            "closes": dict(self.closes),
+            "connects_last_minute": len(self._recent_connects),
+            "closes_last_minute": len(self._recent_closes),
+            "avg_lifetime": round(self.lifetime_total / closed, 1) if closed else 0.0,
+            "heartbeat_interval": self.heartbeat_interval,
+            "idle_timeout": self.idle_timeout,
+            "avg_rtt_ms": round(sum(rtts) / len(rtts) * 1000, 1) if rtts else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """所有连接的发送队列与滞后统计"""
+        connections = [c.stats() for conns in self.active_connections.values() for c in conns.values()]
+        players = len(connections)
+        connections += [c.stats() for hub in self.spectators.values() for c in hub.connections()]
+        return {
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "connections": len(connections),
+            "players": players,
+            "spectators": len(connections) - players,
+            "queued": sum(c["queue_depth"] for c in connections),
+            "dropped": sum(c["dropped"] for c in connections),
+            "coalesced": sum(c["coalesced"] for c in connections),
+            "slow_disconnects": self.slow_disconnects,
+            "max_lag": max((c["lag"] for c in connections), default=0.0),
+            "coalesce_window": self.coalesce_window,
+            "coalesced_frames": self.coalesced_frames,
+            "coalesced_actions": self.coalesced_actions,
+            # 观众可能有数千个，只列出玩家连接，观众按分片汇总
+            "per_connection": connections[:players],
+            "spectator_hubs": {game_id: hub.stats() for game_id, hub in self.spectators.items()},
+            "encoding": self.encoder.stats(),
+            "pubsub": self.bus.stats() if self.bus is not None else None,
+            "churn": self._churn_stats(),
         }
-        
-        # 广播到所有连接
-        if game_id in self.active_connections:
-            disconnected_players = []
-            for player_id, connection in self.active_connections[game_id].items():
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"【错误/WebSocket】发送游戏结束消息时出错: {e}")
-                    disconnected_players.append(player_id)
-            
-            # 清理断开的连接
-            for player_id in disconnected_players:
-                self.disconnect(game_id, player_id)
-            
-            return len(self.active_connections.get(game_id, {})) > 0
-        return False 
 
 class AIPlayer:
     def __init__(self, player_id, name, personality, strategy_prompt=""):